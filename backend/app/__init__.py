@@ -102,7 +102,8 @@ def create_app():
         return response
 
     # Enable CORS
-    CORS(app, supports_credentials=True, origins=["http://localhost:5173","https://frontend-72964026119.asia-southeast1.run.app"])
+    CORS(app, supports_credentials=True, origins=["http://localhost:5173","https://frontend-72964026119.asia-southeast1.run.app"],
+         expose_headers=["X-Total-Count", "X-Page", "X-Per-Page", "X-Total-Pages"])
 
     db.init_app(app)
     mail.init_app(app)
@@ -126,6 +127,22 @@ def create_app():
     from app.models.subscription_plan import SubscriptionPlan
     from app.models.superadmin import Superadmin
     from app.models.degree import Degree
+    from app.models.mail_outbox import MailOutbox
+
+    # Background sender for queued notification emails
+    from app.services import mail_outbox
+    mail_outbox.init_app(app)
+
+    # Keeps question banks of upcoming assessments topped up
+    from app.services import question_bank
+    question_bank.init_app(app)
+
+    # Fails report exports lost with a restarted process and deletes expired ones
+    from app.services import report_export
+    report_export.init_app(app)
+
+    from app.cli import register_cli_commands
+    register_cli_commands(app)
     
     # Import and register blueprints
     from app.routes.candidate import candidate_api_bp
@@ -135,6 +152,7 @@ def create_app():
     from app.routes.recruiter_analytics import recruiter_analytics_api_bp
     from app.routes.subscription import subscriptions_bp
     from app.routes.admin import admin_api_bp
+    from app.routes.storage import storage_api_bp
     
     app.register_blueprint(recruiter_analytics_api_bp, url_prefix='/api/recruiter/analytics')
     app.register_blueprint(candidate_api_bp)
@@ -142,6 +160,7 @@ def create_app():
     app.register_blueprint(recruiter_api_bp)
     app.register_blueprint(subscriptions_bp)
     app.register_blueprint(admin_api_bp)
+    app.register_blueprint(storage_api_bp)
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
 
     @app.route('/', methods=['GET'])
@@ -0,0 +1,67 @@
+import click
+from flask.cli import AppGroup
+from app.models.job import JobDescription
+
+bank_cli = AppGroup('bank', help='Inspect, warm up and import job question banks.')
+
+def _print_coverage(coverage):
+    click.echo(
+        f"Job {coverage['job_id']}: {coverage['total_questions']} questions, "
+        f"{coverage['missing_questions']} missing across {coverage['deficient_cells']} cells "
+        f"(target {coverage['target_per_cell']} per cell){' - ready' if coverage['ready'] else ''}"
+    )
+    for cell in coverage['cells']:
+        marker = '' if not cell['missing'] else f"  (-{cell['missing']})"
+        click.echo(f"  {cell['skill']:<30} {cell['band']:<8} {cell['count']:>4}{marker}")
+
+@bank_cli.command('coverage')
+@click.argument('job_id', type=int)
+def coverage_command(job_id):
+    """Show question counts per skill and difficulty band of JOB_ID."""
+    from app.services.question_bank import get_bank_coverage
+    JobDescription.query.get_or_404(job_id)
+    _print_coverage(get_bank_coverage(job_id))
+
+@bank_cli.command('warmup')
+@click.option('--job-id', type=int, multiple=True, help='Job to top up; repeatable. Defaults to upcoming jobs.')
+@click.option('--hours', type=float, default=None, help='Warm up active jobs starting within this many hours.')
+def warmup_command(job_id, hours):
+    """Top up deficient question banks now, in this process."""
+    from app.services import question_bank
+    if job_id:
+        jobs = JobDescription.query.filter(JobDescription.job_id.in_(job_id)).all()
+    else:
+        jobs = question_bank.upcoming_jobs(question_bank.BANK_WARMUP_HORIZON_HOURS if hours is None else hours)
+    if not jobs:
+        click.echo('No jobs to warm up')
+        return
+    for coverage in question_bank.warm_up_banks(jobs).values():
+        _print_coverage(coverage)
+
+@bank_cli.command('import')
+@click.argument('job_id', type=int)
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--skill', default=None, help='Skill of records that do not name one.')
+@click.option('--band', type=click.Choice(['good', 'better', 'perfect']), default=None,
+              help='Difficulty band of records that do not name one.')
+@click.option('--batch-size', type=int, default=None, help='Rows per COPY statement.')
+@click.option('--dry-run', is_flag=True, help='Validate and de-duplicate without writing anything.')
+def import_command(job_id, files, skill, band, batch_size, dry_run):
+    """Load curated JSON or JSONL question FILES into the bank of JOB_ID."""
+    from app.services import question_import
+    JobDescription.query.get_or_404(job_id)
+    report = question_import.import_questions(
+        job_id, list(files), skill=skill, band=band, dry_run=dry_run,
+        batch_size=batch_size or question_import.IMPORT_COPY_BATCH
+    )
+    for error in report['errors']:
+        click.echo(f"  skipped {error}")
+    click.echo(
+        f"{'Checked' if dry_run else 'Imported'} {report['imported']} of {report['records']} records "
+        f"from {report['files']} files in {report['seconds']}s ({report['records_per_second']} records/s); "
+        f"skipped {report['duplicates']} duplicates, {report['invalid']} invalid, "
+        f"{report['malformed']} malformed, {report['unknown_cell']} without a required skill/band"
+    )
+
+def register_cli_commands(app):
+    app.cli.add_command(bank_cli)
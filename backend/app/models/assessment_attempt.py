@@ -4,10 +4,13 @@ from sqlalchemy.dialects.postgresql import JSONB
 
 class AssessmentAttempt(db.Model):
     __tablename__ = 'assessment_attempts'
+    __table_args__ = (
+        db.Index('ix_assessment_attempts_candidate_id_job_id', 'candidate_id', 'job_id'),
+    )
 
     attempt_id = db.Column(db.Integer, primary_key=True)
     candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.candidate_id'), nullable=False)
-    job_id = db.Column(db.Integer, db.ForeignKey('job_descriptions.job_id'), nullable=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('job_descriptions.job_id'), nullable=False, index=True)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='started')
@@ -8,6 +8,7 @@ class AssessmentState(db.Model):
     state = db.Column(JSONB, nullable=False)
     skill_count = db.Column(db.Integer, nullable=False, default=1)
     expiry_date = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # bumped on every write
 
     def __repr__(self):
         return f'<AssessmentState attempt_id={self.attempt_id}>'
\ No newline at end of file
@@ -0,0 +1,16 @@
+from app import db
+from datetime import datetime
+
+class LLMResponseCache(db.Model):
+    __tablename__ = 'llm_response_cache'
+
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256 of model, prompt and generation settings
+    call_site = db.Column(db.String(50), nullable=False)
+    response_text = db.Column(db.Text, nullable=False)
+    prompt_tokens = db.Column(db.Integer)
+    output_tokens = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<LLMResponseCache {self.cache_key[:12]} call_site={self.call_site} expires_at={self.expires_at}>'
@@ -2,6 +2,9 @@ from app import db
 
 class MCQ(db.Model):
     __tablename__ = 'mcqs'
+    __table_args__ = (
+        db.Index('ix_mcqs_job_id_skill_id_difficulty_band_mcq_id', 'job_id', 'skill_id', 'difficulty_band', 'mcq_id'),
+    )
     
     mcq_id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.Integer, db.ForeignKey('job_descriptions.job_id'), nullable=False)
@@ -0,0 +1,19 @@
+from app import db
+from datetime import datetime
+
+class ProctoringEvent(db.Model):
+    """Append-only log of proctoring events, folded into performance_log when an attempt ends."""
+    __tablename__ = 'proctoring_events'
+    __table_args__ = (
+        db.Index('ix_proctoring_events_attempt_id_event_id', 'attempt_id', 'event_id'),
+    )
+
+    event_id = db.Column(db.BigInteger, primary_key=True)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('assessment_attempts.attempt_id', ondelete='CASCADE'), nullable=False)
+    event_type = db.Column(db.String(30), nullable=False)  # snapshot, tab_switch, fullscreen_warning, remark, termination
+    path = db.Column(db.String(255))  # storage path of a snapshot
+    detail = db.Column(db.Text)  # remark text or termination reason
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProctoringEvent {self.event_id} - Attempt {self.attempt_id} - {self.event_type}>'
@@ -3,6 +3,9 @@ from datetime import datetime
 
 class ProctoringViolation(db.Model):
     __tablename__ = 'proctoring_violation'
+    __table_args__ = (
+        db.Index('ix_proctoring_violation_attempt_id_timestamp', 'attempt_id', 'timestamp'),
+    )
 
     violation_id = db.Column(db.Integer, primary_key=True)
     attempt_id = db.Column(db.Integer, db.ForeignKey('assessment_attempts.attempt_id'), nullable=False)
@@ -0,0 +1,18 @@
+from app import db
+from datetime import datetime
+
+class ReportExport(db.Model):
+    __tablename__ = 'report_exports'
+
+    export_id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job_descriptions.job_id', ondelete='CASCADE'), nullable=False, index=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    report_type = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed, expired
+    file_path = db.Column(db.String(255))  # storage path of the PDF
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ReportExport {self.export_id} job_id={self.job_id} status={self.status}>'
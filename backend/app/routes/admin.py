@@ -19,6 +19,7 @@ from flask_mail import Message
 from datetime import date
 from calendar import monthrange
 from app.utils.gcs_upload import upload_to_gcs, delete_from_gcs
+from app.services.llm_client import get_llm_metrics
 import secrets
 import pyotp  # Import pyotp
 
@@ -501,3 +502,10 @@ def get_sales():
         return jsonify({'error': 'Unauthorized'}), 401
     sales = Sales.query.order_by(Sales.month).all()
     return jsonify([{'id': s.id, 'month': s.month.isoformat(), 'earnings': s.earnings, 'expenses': s.expenses} for s in sales])
+
+@admin_api_bp.route('/llm-metrics', methods=['GET'])
+def get_llm_usage():
+    # Per-worker counters; the limiter state is shared by all workers
+    if 'user_id' not in session or session.get('role') != 'superadmin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(get_llm_metrics()), 200
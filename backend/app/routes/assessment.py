@@ -14,17 +14,24 @@ from app.models.skill import Skill
 from app.models.candidate_skill import CandidateSkill
 from app.models.mcq import MCQ
 from app.models.assessment_registration import AssessmentRegistration
-from app.models.assessment_state import AssessmentState
 from app.models.proctoring_violation import ProctoringViolation
-from app.services.question_batches import generate_single_question
+from app.services.question_batches import QUESTIONS_PER_CELL, generate_single_question
+from app.services.question_bank import enqueue_warm_up
 from google.cloud import storage
 from app.utils.gcs_upload import upload_to_gcs
+from app.services.storage import get_storage
+from app.services.state_store import StateConflict, forget_loaded_versions, get_state_store
+from app.services.proctoring import EVENT_TYPES, fold_proctoring_events, log_event
+from app.services import question_selection
 from app.utils.face import compare_faces_from_files
 from io import BytesIO
 import timeout_decorator
 import google.api_core.exceptions
 import requests
 import json
+import secrets
+import time
+from functools import wraps
 
 assessment_api_bp = Blueprint('assessment_api', __name__, url_prefix='/api/assessment')
 
@@ -43,6 +50,20 @@ os.makedirs(VIOLATOIN_DIR, exist_ok=True)
 
 BAND_ORDER = ["good", "better", "perfect"]
 
+SNAPSHOT_CONTENT_TYPE = 'image/jpeg'
+VALID_VIOLATION_TYPES = ['gaze_away', 'no_face', 'multiple_faces', 'mobile_phone']
+# Storage path prefix of each kind of proctoring image; the attempt id scopes confirm calls
+UPLOAD_PATH_PREFIXES = {
+    'snapshot': 'snapshots/attempt{attempt_id}_',
+    'violation': 'violations/violation_attempt{attempt_id}_'
+}
+# Most signed upload URLs handed out by one upload-intent call
+MAX_UPLOAD_INTENTS = 10
+# Most events accepted by one /events batch
+MAX_EVENTS_PER_BATCH = 100
+# Times a view is re-run after losing a concurrent state update
+STATE_CONFLICT_RETRIES = 3
+
 GREETING_MESSAGES = [
     "Alright, let's get started with your assessment! Here's your first question.",
     "Ready to show your skills? Here's the next question for you!",
@@ -62,36 +83,31 @@ INCORRECT_FEEDBACK = [
     "😬 Close, but the answer was: {answer}"
 ]
 
-def load_question_bank(job_id):
-    """Load and shuffle questions for a job, organized by skill and difficulty band."""
+def load_question_plan(job_id, seed):
+    """Shuffle a job's question ids by difficulty band and skill for one attempt."""
     try:
-        bank = {band: {} for band in BAND_ORDER}
-        mcqs = MCQ.query.filter_by(job_id=job_id).join(Skill, Skill.skill_id == MCQ.skill_id).all()
-        
-        for mcq in mcqs:
-            skill_name = mcq.skill.name
-            band = mcq.difficulty_band
-            if skill_name not in bank[band]:
-                bank[band][skill_name] = []
-            if mcq.correct_answer not in ['A', 'B', 'C', 'D']:
-                logger.error(f"Invalid correct_answer '{mcq.correct_answer}' for MCQ mcq_id={mcq.mcq_id}")
-                continue
-            bank[band][skill_name].append({
-                "mcq_id": mcq.mcq_id,
-                "question": mcq.question,
-                "options": [mcq.option_a, mcq.option_b, mcq.option_c, mcq.option_d],
-                "answer": getattr(mcq, f"option_{mcq.correct_answer.lower()}")
-            })
-        
-        for band in bank:
-            for skill in bank[band]:
-                random.shuffle(bank[band][skill])
-        
-        return bank
+        rows = db.session.query(MCQ.mcq_id, MCQ.difficulty_band, Skill.name).join(
+            Skill, Skill.skill_id == MCQ.skill_id
+        ).filter(
+            MCQ.job_id == job_id,
+            MCQ.correct_answer.in_(['A', 'B', 'C', 'D'])
+        ).order_by(MCQ.mcq_id).all()
+        return question_selection.build_plan(rows, seed, BAND_ORDER)
     except Exception as e:
-        logger.error(f"Error in load_question_bank for job_id={job_id}: {str(e)}")
+        logger.error(f"Error in load_question_plan for job_id={job_id}: {str(e)}")
         raise
 
+def question_from_mcq(mcq, skill, band):
+    """Question entry kept in asked_questions for an MCQ row."""
+    return {
+        "mcq_id": mcq.mcq_id,
+        "question": mcq.question,
+        "options": [mcq.option_a, mcq.option_b, mcq.option_c, mcq.option_d],
+        "answer": getattr(mcq, f"option_{mcq.correct_answer.lower()}"),
+        "skill": skill,
+        "difficulty_band": band
+    }
+
 def divide_experience_range(jd_range):
     """Divide job experience range into three bands."""
     try:
@@ -139,43 +155,94 @@ def compare_images(snapshot_url, profile_url):
     except Exception as e:
         return False, f"Face comparison failed: {str(e)}"
 
-def save_assessment_state(attempt_id, state):
-    """Save assessment state to database."""
+def finalize_assessment(attempt, state, proctoring_data_in):
+    """Score an attempt, fold its proctoring events into the log and close it.
+
+    Returns the attempt's performance_log and proctoring_data.
+    """
+    attempt_id = attempt.attempt_id
+    proctoring_data = fold_proctoring_events(attempt_id, state.get('proctoring_data'))
+    proctoring_data.update({
+        "tab_switches": proctoring_data_in.get("tab_switches", proctoring_data["tab_switches"]),
+        "fullscreen_warnings": proctoring_data_in.get("fullscreen_warnings", proctoring_data["fullscreen_warnings"]),
+        "remarks": proctoring_data["remarks"] + proctoring_data_in.get("remarks", []),
+        "forced_termination": proctoring_data_in.get("forced_termination", proctoring_data["forced_termination"]),
+        "termination_reason": proctoring_data_in.get("termination_reason", proctoring_data["termination_reason"])
+    })
+
+    candidate = Candidate.query.get(attempt.candidate_id)
+    if candidate.profile_picture:
+        backend = get_storage()
+        profile_image_path = backend.public_url(candidate.profile_picture)
+        for snapshot in proctoring_data["snapshots"]:
+            is_match, remark = compare_images(backend.public_url(snapshot["path"]), profile_image_path)
+            proctoring_data["remarks"].append(f"Snapshot at {snapshot['timestamp']}: {remark}")
+            snapshot["is_valid"] = is_match
+    else:
+        proctoring_data["remarks"].append("No candidate profile image available for comparison")
+
+    performance_log = state['performance_log']
+    for skill in performance_log:
+        performance_log[skill]["final_band"] = state['current_band_per_skill'][skill]
+        correct = performance_log[skill]["correct_answers"]
+        total = performance_log[skill]["questions_attempted"]
+        performance_log[skill]["accuracy_percent"] = round((correct / total) * 100, 2) if total > 0 else 0.0
+    performance_log['proctoring_data'] = proctoring_data
+
+    attempt.performance_log = performance_log
+    attempt.end_time = datetime.utcnow()
+    attempt.status = 'completed'
+    db.session.commit()
+    # Delete state after completion
+    get_state_store().delete(attempt_id)
+    return performance_log, proctoring_data
+
+def retry_on_state_conflict(view):
+    """Re-run a view that lost an optimistic-concurrency race on the assessment state."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        for retry in range(STATE_CONFLICT_RETRIES):
+            try:
+                return view(*args, **kwargs)
+            except StateConflict as e:
+                db.session.rollback()
+                forget_loaded_versions()
+                logger.info(f"{e}; retrying {view.__name__} ({retry + 1}/{STATE_CONFLICT_RETRIES})")
+                time.sleep(random.uniform(0, 0.02) * (retry + 1))
+        return jsonify({'error': 'Assessment state was modified concurrently, please retry'}), 409
+    return wrapper
+
+def save_assessment_state(attempt_id, state, durable=False):
+    """Save assessment state through the configured state store.
+
+    `durable` writes through to the database even when a cache is in front of it.
+    """
     try:
-        assessment_state = AssessmentState.query.get(attempt_id)
-        if assessment_state:
-            assessment_state.state = state
-        else:
-            assessment_state = AssessmentState(
-                attempt_id=attempt_id,
-                state=state,
-                skill_count=len(state.get('performance_log', {})),
-                expiry_date=datetime.utcnow() + timedelta(hours=24)  # Set expiry to 24 hours from now
-            )
-            db.session.add(assessment_state)
-        db.session.commit()
+        get_state_store().save(attempt_id, state, durable=durable)
+    except StateConflict:
+        raise
     except Exception as e:
         logger.error(f"Error saving assessment state for attempt_id={attempt_id}: {str(e)}")
         db.session.rollback()
         raise
 
 def get_assessment_state(attempt_id):
-    """Retrieve assessment state from database."""
+    """Retrieve assessment state from the configured state store."""
     try:
-        assessment_state = AssessmentState.query.get(attempt_id)
-        if not assessment_state:
-            logger.error(f"Assessment state not found for attempt_id={attempt_id}")
-            return None
-        if assessment_state.expiry_date and assessment_state.expiry_date < datetime.utcnow():
-            logger.warning(f"Assessment state expired for attempt_id={attempt_id}")
-            db.session.delete(assessment_state)
-            db.session.commit()
-            return None
-        return assessment_state.state
+        return get_state_store().get(attempt_id)
     except Exception as e:
         logger.error(f"Error retrieving assessment state for attempt_id={attempt_id}: {str(e)}")
         raise
 
+def ensure_question_selection(state):
+    """Add selection state to sessions started before it was precomputed at start."""
+    if question_selection.has_selection(state):
+        return
+    required_skills = RequiredSkill.query.filter_by(job_id=state['job_id']).join(Skill, Skill.skill_id == RequiredSkill.skill_id).all()
+    jd_priorities = {rs.skill.name: rs.priority for rs in required_skills}
+    plan = question_selection.plan_from_bank(state.pop('question_bank', {}))
+    question_selection.init_selection(state, {skill: jd_priorities.get(skill, 0) for skill in state['questions_per_skill']}, plan)
+
 @assessment_api_bp.route('/start/<int:attempt_id>', methods=['POST'])
 def start_assessment_session(attempt_id):
     """Initialize an assessment session."""
@@ -229,10 +296,15 @@ def start_assessment_session(attempt_id):
         candidate_experience = candidate.years_of_experience or 0
         jd_experience_range = f"{job.experience_min}-{job.experience_max}"
 
-        question_bank = load_question_bank(job.job_id)
-        if not any(bank for band in question_bank.values() for bank in band.values()):
+        seed = question_selection.plan_seed(attempt_id)
+        question_plan = load_question_plan(job.job_id, seed)
+        if not any(mcq_ids for band in question_plan.values() for mcq_ids in band.values()):
             logger.error(f"No questions available for job_id={job.job_id}")
             return jsonify({'error': 'No questions available for this job'}), 400
+        if any(len(question_plan.get(band, {}).get(skill, [])) < QUESTIONS_PER_CELL
+               for band in BAND_ORDER for skill in jd_priorities):
+            # Thin cells fall back to live generation mid-test; top them up for later candidates
+            enqueue_warm_up(job.job_id)
 
         base_band = get_base_band(candidate_experience, jd_experience_range)
         priority_sum = sum(jd_priorities.values()) or 1
@@ -257,7 +329,7 @@ def start_assessment_session(attempt_id):
 
         state = {
             'job_id': job.job_id,
-            'question_bank': question_bank,
+            'plan_seed': seed,
             'questions_per_skill': questions_per_skill,
             'current_band_per_skill': current_band_per_skill,
             'initial_band_per_skill': initial_band_per_skill,
@@ -268,17 +340,10 @@ def start_assessment_session(attempt_id):
             'start_time': datetime.utcnow().timestamp(),
             'asked_questions': [],
             'job_description': job.job_description or "",
-            'custom_prompt': job.custom_prompt or "",
-            'proctoring_data': {
-                "snapshots": [],
-                "tab_switches": 0,
-                "fullscreen_warnings": 0,
-                "remarks": [],
-                "forced_termination": False,
-                "termination_reason": ""
-            }
+            'custom_prompt': job.custom_prompt or ""
         }
-        save_assessment_state(attempt_id, state)
+        question_selection.init_selection(state, jd_priorities, question_plan)
+        save_assessment_state(attempt_id, state, durable=True)
 
         return jsonify({
             'total_questions': total_questions,
@@ -288,6 +353,36 @@ def start_assessment_session(attempt_id):
         logger.error(f"Error in start_assessment_session for attempt_id={attempt_id}: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+def new_upload_path(attempt_id, kind):
+    """Storage path for a new snapshot ('snapshot') or violation image ('violation') of an attempt."""
+    timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    return f"{UPLOAD_PATH_PREFIXES[kind].format(attempt_id=attempt_id)}{timestamp}_{secrets.token_hex(4)}.jpg"
+
+def is_attempt_upload_path(attempt_id, kind, path):
+    """True if `path` is one handed out by new_upload_path for this attempt."""
+    prefix = UPLOAD_PATH_PREFIXES[kind].format(attempt_id=attempt_id)
+    return (
+        isinstance(path, str) and path.startswith(prefix) and path.endswith('.jpg')
+        and '/' not in path[len(prefix):] and '..' not in path
+    )
+
+def record_snapshot(attempt_id, snapshot_path):
+    """Log an uploaded snapshot; it is folded into the proctoring data when the attempt ends."""
+    log_event(attempt_id, 'snapshot', path=snapshot_path)
+    db.session.commit()
+    logger.debug(f"Recorded snapshot {snapshot_path} for attempt_id={attempt_id}")
+
+def record_violation(attempt_id, snapshot_path, violation_type):
+    violation = ProctoringViolation(
+        attempt_id=attempt_id,
+        snapshot_path=snapshot_path,
+        violation_type=violation_type,
+        timestamp=datetime.utcnow()
+    )
+    db.session.add(violation)
+    db.session.commit()
+    return violation
+
 @assessment_api_bp.route('/capture-snapshot/<int:attempt_id>', methods=['POST'])
 def capture_snapshot(attempt_id):
     """Capture and save a webcam snapshot for proctoring."""
@@ -310,33 +405,9 @@ def capture_snapshot(attempt_id):
             logger.error(f"Invalid snapshot file for attempt_id={attempt_id}")
             return jsonify({'error': 'Invalid snapshot file'}), 400
 
-        state = get_assessment_state(attempt_id)
-        if not state:
-            logger.error(f"Assessment session not found for attempt_id={attempt_id}")
-            return jsonify({'error': 'Assessment session not found'}), 404
-
-        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
-        snapshot_filename = f"attempt{attempt_id}_{timestamp}.jpg"
-        snapshot_path = f'snapshots/{snapshot_filename}'
-        upload_to_gcs(snapshot_file, snapshot_path, 'image/jpeg')
-
-        proctoring_data = state.get('proctoring_data', {
-            "snapshots": [],
-            "tab_switches": 0,
-            "fullscreen_warnings": 0,
-            "remarks": [],
-            "forced_termination": False,
-            "termination_reason": ""
-        })
-        snapshot_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "path": f'snapshots/{snapshot_filename}'
-        }
-        proctoring_data["snapshots"].append(snapshot_entry)
-        proctoring_data["remarks"].append(f"Snapshot captured at | {snapshot_entry['timestamp']} | {snapshot_entry['path']}")
-        state['proctoring_data'] = proctoring_data
-        save_assessment_state(attempt_id, state)
-        logger.debug(f"Updated proctoring_data for attempt_id={attempt_id}: {proctoring_data}")
+        snapshot_path = new_upload_path(attempt_id, 'snapshot')
+        upload_to_gcs(snapshot_file, snapshot_path, SNAPSHOT_CONTENT_TYPE)
+        record_snapshot(attempt_id, snapshot_path)
 
         return jsonify({'message': 'Snapshot captured successfully'}), 200
     except Exception as e:
@@ -363,8 +434,7 @@ def store_violation(attempt_id):
         snapshot_file = request.files['snapshot']
         violation_type = request.form['violation_type'].lower()
         
-        valid_violation_types = ['gaze_away','no_face', 'multiple_faces', 'mobile_phone']
-        if violation_type not in valid_violation_types:
+        if violation_type not in VALID_VIOLATION_TYPES:
             logger.error(f"Invalid violation type {violation_type} for attempt_id={attempt_id}")
             return jsonify({'error': 'Invalid violation type'}), 400
 
@@ -372,19 +442,9 @@ def store_violation(attempt_id):
             logger.error(f"Invalid snapshot file for attempt_id={attempt_id}")
             return jsonify({'error': 'Invalid snapshot file'}), 400
 
-        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
-        snapshot_filename = f"violation_attempt{attempt_id}_{timestamp}.jpg"
-        snapshot_path = f'violations/{snapshot_filename}'
-        upload_to_gcs(snapshot_file, snapshot_path, 'image/jpeg')
-
-        violation = ProctoringViolation(
-            attempt_id=attempt_id,
-            snapshot_path=snapshot_path,
-            violation_type=violation_type,
-            timestamp=datetime.utcnow()
-        )
-        db.session.add(violation)
-        db.session.commit()
+        snapshot_path = new_upload_path(attempt_id, 'violation')
+        upload_to_gcs(snapshot_file, snapshot_path, SNAPSHOT_CONTENT_TYPE)
+        violation = record_violation(attempt_id, snapshot_path, violation_type)
 
         logger.info(f"Violation stored for attempt_id={attempt_id}: {violation_type}")
         return jsonify({
@@ -397,9 +457,222 @@ def store_violation(attempt_id):
         logger.error(f"Error storing violation for attempt_id={attempt_id}: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@assessment_api_bp.route('/upload-intent/<int:attempt_id>', methods=['POST'])
+def create_upload_intent(attempt_id):
+    """Hand out signed URLs so the browser can PUT proctoring images straight to storage.
+
+    Body: {"kind": "snapshot" | "violation", "count": 1}. Each upload is then
+    recorded with /confirm-upload.
+    """
+    try:
+        attempt = AssessmentAttempt.query.get(attempt_id)
+        if not attempt:
+            logger.error(f"AssessmentAttempt not found for attempt_id={attempt_id}")
+            return jsonify({'error': 'Assessment attempt not found'}), 404
+
+        if attempt.status != 'started':
+            logger.error(f"Assessment not in progress for attempt_id={attempt_id}")
+            return jsonify({'error': 'Assessment not in progress'}), 400
+
+        data = request.get_json(silent=True) or {}
+        kind = data.get('kind', 'snapshot')
+        if kind not in UPLOAD_PATH_PREFIXES:
+            return jsonify({'error': 'Invalid upload kind'}), 400
+        try:
+            count = int(data.get('count', 1))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid count'}), 400
+        if not 1 <= count <= MAX_UPLOAD_INTENTS:
+            return jsonify({'error': f'count must be between 1 and {MAX_UPLOAD_INTENTS}'}), 400
+
+        backend = get_storage()
+        uploads = []
+        for _ in range(count):
+            path = new_upload_path(attempt_id, kind)
+            upload = backend.signed_upload_url(path, SNAPSHOT_CONTENT_TYPE)
+            upload['path'] = path
+            uploads.append(upload)
+
+        return jsonify({'kind': kind, 'uploads': uploads}), 200
+    except Exception as e:
+        logger.error(f"Error creating upload intent for attempt_id={attempt_id}: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@assessment_api_bp.route('/confirm-upload/<int:attempt_id>', methods=['POST'])
+def confirm_upload(attempt_id):
+    """Record an image uploaded through a signed URL.
+
+    Body: {"kind": "snapshot", "path": ...} or
+    {"kind": "violation", "path": ..., "violation_type": ...}.
+    """
+    try:
+        attempt = AssessmentAttempt.query.get(attempt_id)
+        if not attempt:
+            logger.error(f"AssessmentAttempt not found for attempt_id={attempt_id}")
+            return jsonify({'error': 'Assessment attempt not found'}), 404
+
+        if attempt.status != 'started':
+            logger.error(f"Assessment not in progress for attempt_id={attempt_id}")
+            return jsonify({'error': 'Assessment not in progress'}), 400
+
+        data = request.get_json(silent=True) or {}
+        kind = data.get('kind', 'snapshot')
+        path = data.get('path')
+        if kind not in UPLOAD_PATH_PREFIXES:
+            return jsonify({'error': 'Invalid upload kind'}), 400
+        if not is_attempt_upload_path(attempt_id, kind, path):
+            logger.error(f"Rejected upload path {path} for attempt_id={attempt_id}")
+            return jsonify({'error': 'Upload path does not belong to this attempt'}), 400
+        if not get_storage().exists(path):
+            logger.error(f"Upload {path} for attempt_id={attempt_id} was confirmed but never stored")
+            return jsonify({'error': 'Uploaded file not found; upload it before confirming'}), 400
+
+        if kind == 'violation':
+            violation_type = (data.get('violation_type') or '').lower()
+            if violation_type not in VALID_VIOLATION_TYPES:
+                logger.error(f"Invalid violation type {violation_type} for attempt_id={attempt_id}")
+                return jsonify({'error': 'Invalid violation type'}), 400
+            violation = record_violation(attempt_id, path, violation_type)
+            logger.info(f"Violation stored for attempt_id={attempt_id}: {violation_type}")
+            return jsonify({
+                'message': 'Violation stored successfully',
+                'violation_id': violation.violation_id,
+                'snapshot_path': violation.snapshot_path
+            }), 201
+
+        record_snapshot(attempt_id, path)
+        return jsonify({'message': 'Snapshot captured successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error confirming upload for attempt_id={attempt_id}: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@assessment_api_bp.route('/<int:attempt_id>/events', methods=['POST'])
+def record_proctoring_events(attempt_id):
+    """Record a batch of proctoring events in one transaction.
+
+    Accepts JSON {"events": [...]} or multipart/form-data with the same list
+    as a JSON string in the `events` field plus image files. Each event has a
+    `type` (snapshot, violation, tab_switch, fullscreen_warning, remark,
+    termination) and an optional ISO `timestamp`. Snapshots and violations
+    carry either a `path` from /upload-intent or a `blob` naming a file field;
+    violations also need `violation_type`, remarks and terminations a `detail`.
+    """
+    try:
+        attempt = AssessmentAttempt.query.get(attempt_id)
+        if not attempt:
+            logger.error(f"AssessmentAttempt not found for attempt_id={attempt_id}")
+            return jsonify({'error': 'Assessment attempt not found'}), 404
+
+        if attempt.status != 'started':
+            logger.error(f"Assessment not in progress for attempt_id={attempt_id}")
+            return jsonify({'error': 'Assessment not in progress'}), 400
+
+        if request.is_json:
+            events = (request.get_json(silent=True) or {}).get('events')
+        else:
+            try:
+                events = json.loads(request.form.get('events', 'null'))
+            except json.JSONDecodeError:
+                return jsonify({'error': 'events must be a JSON list'}), 400
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'events must be a non-empty list'}), 400
+        if len(events) > MAX_EVENTS_PER_BATCH:
+            return jsonify({'error': f'At most {MAX_EVENTS_PER_BATCH} events per batch'}), 400
+
+        # Validate the whole batch before touching storage or the database
+        parsed = []
+        for index, event in enumerate(events):
+            if not isinstance(event, dict):
+                return jsonify({'error': f'Event {index} must be an object'}), 400
+            event_type = event.get('type')
+            if event_type != 'violation' and event_type not in EVENT_TYPES:
+                return jsonify({'error': f'Event {index} has an invalid type'}), 400
+            try:
+                timestamp = datetime.fromisoformat(event['timestamp']) if event.get('timestamp') else datetime.utcnow()
+            except (TypeError, ValueError):
+                return jsonify({'error': f'Event {index} has an invalid timestamp'}), 400
+            if timestamp.tzinfo:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+            detail = event.get('detail')
+            if detail is not None and not isinstance(detail, str):
+                return jsonify({'error': f'Event {index} has an invalid detail'}), 400
+            if event_type in ('remark', 'termination') and not (detail or '').strip():
+                return jsonify({'error': f'Event {index} needs a detail'}), 400
+
+            entry = {'type': event_type, 'timestamp': timestamp, 'detail': detail}
+            if event_type in ('snapshot', 'violation'):
+                kind = 'violation' if event_type == 'violation' else 'snapshot'
+                if event.get('blob'):
+                    blob = request.files.get(event['blob'])
+                    if not blob or not blob.filename:
+                        return jsonify({'error': f"Event {index} references a missing file '{event['blob']}'"}), 400
+                    entry['file'] = blob
+                    entry['path'] = new_upload_path(attempt_id, kind)
+                elif is_attempt_upload_path(attempt_id, kind, event.get('path')):
+                    if not get_storage().exists(event['path']):
+                        return jsonify({'error': f'Event {index} references a file that was never uploaded'}), 400
+                    entry['path'] = event['path']
+                else:
+                    return jsonify({'error': f'Event {index} needs a blob or a path belonging to this attempt'}), 400
+            if event_type == 'violation':
+                entry['violation_type'] = (event.get('violation_type') or '').lower()
+                if entry['violation_type'] not in VALID_VIOLATION_TYPES:
+                    return jsonify({'error': f'Event {index} has an invalid violation type'}), 400
+            parsed.append(entry)
+
+        uploaded = []
+        violations = []
+        try:
+            # Uploads are inside the try so a failed one removes those already stored
+            for entry in parsed:
+                if 'file' in entry:
+                    upload_to_gcs(entry['file'], entry['path'], SNAPSHOT_CONTENT_TYPE)
+                    uploaded.append(entry['path'])
+
+            for entry in parsed:
+                if entry['type'] == 'violation':
+                    violation = ProctoringViolation(
+                        attempt_id=attempt_id,
+                        snapshot_path=entry['path'],
+                        violation_type=entry['violation_type'],
+                        timestamp=entry['timestamp']
+                    )
+                    db.session.add(violation)
+                    violations.append(violation)
+                else:
+                    log_event(attempt_id, entry['type'], path=entry.get('path'), detail=entry['detail'], timestamp=entry['timestamp'])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            backend = get_storage()
+            for path in uploaded:
+                backend.delete(path)
+            raise
+
+        logger.info(f"Recorded {len(parsed)} proctoring events ({len(uploaded)} uploads) for attempt_id={attempt_id}")
+        return jsonify({
+            'message': 'Events recorded successfully',
+            'recorded': len(parsed),
+            'paths': [entry.get('path') for entry in parsed],
+            'violation_ids': [violation.violation_id for violation in violations]
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error recording proctoring events for attempt_id={attempt_id}: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 @assessment_api_bp.route('/next-question/<int:attempt_id>', methods=['POST'])
 def get_next_question(attempt_id):
     """Retrieve the next question for the assessment."""
+    # Only the state read-modify-write is retried on a conflict; questions generated
+    # by an earlier try are kept here so a lost race doesn't call the LLM again
+    generated = {}
+    return retry_on_state_conflict(serve_next_question)(attempt_id, generated)
+
+def serve_next_question(attempt_id, generated):
+    """Pick the next question from fresh state; `generated` maps (skill, band) to live-generated questions."""
     try:
         state = get_assessment_state(attempt_id)
         if not state:
@@ -410,7 +683,6 @@ def get_next_question(attempt_id):
         total_questions = state['total_questions']
         test_duration = state['test_duration']
         start_time = state['start_time']
-        questions_per_skill = state['questions_per_skill']
         job_id = state['job_id']
         job_description = state.get('job_description', "")
         custom_prompt = state.get('custom_prompt', "")
@@ -418,85 +690,35 @@ def get_next_question(attempt_id):
 
         elapsed_time = datetime.utcnow().timestamp() - start_time
         if question_count >= total_questions or elapsed_time >= test_duration:
-            for skill in state['performance_log']:
-                state['performance_log'][skill]["final_band"] = state['current_band_per_skill'][skill]
-                correct = state['performance_log'][skill]["correct_answers"]
-                total = state['performance_log'][skill]["questions_attempted"]
-                state['performance_log'][skill]["accuracy_percent"] = round((correct / total) * 100, 2) if total > 0 else 0.0
-
             attempt = AssessmentAttempt.query.get(attempt_id)
             if not attempt:
                 logger.error(f"AssessmentAttempt not found for attempt_id={attempt_id}")
                 return jsonify({'error': 'Assessment attempt not found'}), 404
 
-            candidate = Candidate.query.get(attempt.candidate_id)
             data = request.get_json()
-            proctoring_data_in = data.get('proctoring_data', {})
-            proctoring_data = state.get('proctoring_data', {
-                "snapshots": [],
-                "tab_switches": 0,
-                "fullscreen_warnings": 0,
-                "remarks": [],
-                "forced_termination": False,
-                "termination_reason": ""
-            })
-
-            proctoring_data.update({
-                "tab_switches": proctoring_data_in.get("tab_switches", proctoring_data["tab_switches"]),
-                "fullscreen_warnings": proctoring_data_in.get("fullscreen_warnings", proctoring_data["fullscreen_warnings"]),
-                "remarks": proctoring_data.get("remarks", []) + proctoring_data_in.get("remarks", []),
-                "forced_termination": proctoring_data_in.get("forced_termination", proctoring_data["forced_termination"]),
-                "termination_reason": proctoring_data_in.get("termination_reason", proctoring_data["termination_reason"])
-            })
-
-            if candidate.profile_picture:
-                profile_image_path = f'https://storage.googleapis.com/gen-ai-quiz/uploads/{candidate.profile_picture}'
-                for snapshot in proctoring_data["snapshots"]:
-                    snapshot_path = f'https://storage.googleapis.com/gen-ai-quiz/uploads/{snapshot["path"]}'
-                    is_match, remark = compare_images(snapshot_path, profile_image_path)
-                    proctoring_data["remarks"].append(f"Snapshot at {snapshot['timestamp']}: {remark}")
-                    snapshot["is_valid"] = is_match
-            else:
-                proctoring_data["remarks"].append("No candidate profile image available for comparison")
-
-            performance_log = state['performance_log']
-            performance_log['proctoring_data'] = proctoring_data
-            attempt.performance_log = performance_log
-            attempt.end_time = datetime.utcnow()
-            attempt.status = 'completed'
-            db.session.commit()
-            # Delete state after completion
-            assessment_state = AssessmentState.query.get(attempt_id)
-            if assessment_state:
-                db.session.delete(assessment_state)
-                db.session.commit()
+            performance_log, proctoring_data = finalize_assessment(attempt, state, data.get('proctoring_data', {}))
 
             return jsonify({
                 'message': 'Assessment completed',
-                'candidate_report': state['performance_log'],
+                'candidate_report': performance_log,
                 'proctoring_data': proctoring_data
             }), 200
 
-        required_skills = RequiredSkill.query.filter_by(job_id=job_id).join(Skill, Skill.skill_id == RequiredSkill.skill_id).all()
-        jd_priorities = {rs.skill.name: rs.priority for rs in required_skills}
-        sorted_skills = sorted(questions_per_skill.items(), key=lambda x: -jd_priorities.get(x[0], 0))
-        for skill, remaining in sorted_skills:
-            if remaining <= 0:
-                continue
-
+        ensure_question_selection(state)
+        for skill in question_selection.skills_to_ask(state):
             band = state['current_band_per_skill'][skill]
-            available = [
-                q for q in state['question_bank'].get(band, {}).get(skill, [])
-                if q['mcq_id'] not in [aq['mcq_id'] for aq in asked_questions]
-            ]
 
             question = None
-            if question_count > 0:
+            if question_count > 0 and (skill, band) not in generated:
+                generated[(skill, band)] = None
                 try:
                     logger.debug(f"Generating question for skill={skill}, band={band}, attempt_id={attempt_id}")
-                    question_data = generate_single_question(skill, band, job_id, job_description, used_questions=asked_questions)
+                    # No stored-question fallback here: the plan cursor below is this cell's fallback
+                    question_data = generate_single_question(
+                        skill, band, job_id, job_description, used_questions=asked_questions, prestored_after=None
+                    )
                     if question_data:
-                        question = {
+                        generated[(skill, band)] = {
                             "mcq_id": question_data["mcq_id"],
                             "question": question_data["question"],
                             "options": [
@@ -509,17 +731,23 @@ def get_next_question(attempt_id):
                             "skill": skill,
                             "difficulty_band": band
                         }
-                        state['question_bank'].setdefault(band, {}).setdefault(skill, []).append(question)
                 except (timeout_decorator.TimeoutError, google.api_core.exceptions.GoogleAPIError) as e:
                     logger.warning(f"Real-time question generation failed for {skill} ({band}): {str(e)}. Falling back to database.")
+            if question_count > 0:
+                question = generated[(skill, band)]
 
-            if not question and available:
-                question = available.pop(0)
+            while not question:
+                mcq_id = question_selection.next_from_plan(state, band, skill)
+                if mcq_id is None:
+                    break
+                mcq = MCQ.query.get(mcq_id)
+                if mcq:
+                    question = question_from_mcq(mcq, skill, band)
 
             if question:
                 state['questions_per_skill'][skill] -= 1
                 state['question_count'] += 1
-                state['asked_questions'].append(question)
+                question_selection.mark_asked(state, question)
                 save_assessment_state(attempt_id, state)
 
                 return jsonify({
@@ -536,6 +764,8 @@ def get_next_question(attempt_id):
         logger.warning(f"No more questions available for attempt_id={attempt_id}")
         save_assessment_state(attempt_id, state)
         return jsonify({'message': 'No more questions available'}), 200
+    except StateConflict:
+        raise
     except Exception as e:
         logger.error(f"Error in get_next_question for attempt_id={attempt_id}: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
@@ -563,11 +793,12 @@ def submit_answer(attempt_id):
             logger.error(f"Invalid answer '{user_input}' for attempt_id={attempt_id}")
             return jsonify({'error': 'Invalid answer provided'}), 400
 
-        if not mcq_id or mcq_id not in [q['mcq_id'] for q in state['asked_questions']]:
+        ensure_question_selection(state)
+        question = question_selection.get_asked_question(state, mcq_id) if mcq_id else None
+        if not question:
             logger.error(f"Invalid mcq_id '{mcq_id}' for attempt_id={attempt_id}")
             return jsonify({'error': 'Invalid mcq_id provided'}), 400
 
-        question = next(q for q in state['asked_questions'] if q['mcq_id'] == mcq_id)
         band = state['current_band_per_skill'][skill]
         
         input_map = {1: 'A', 2: 'B', 3: 'C', 4: 'D'}
@@ -576,9 +807,14 @@ def submit_answer(attempt_id):
         correct_letter = next(letter for letter, opt in zip(['A', 'B', 'C', 'D'], question['options']) if opt == question['answer'])
         correct = user_letter == correct_letter
 
-        state['performance_log'][skill]["questions_attempted"] += 1
-        state['performance_log'][skill]["time_spent"] += time_taken
-        state['performance_log'][skill]["responses"].append({
+        # A retried submission of an answer that was already recorded is not counted twice
+        # Compare the stored mcq_id: the request may send it as a string
+        if any(r['mcq_id'] == question['mcq_id'] for r in state['performance_log'][skill]["responses"]):
+            logger.info(f"Answer for mcq_id={mcq_id} already recorded for attempt_id={attempt_id}")
+            feedback = random.choice(CORRECT_FEEDBACK) if correct else random.choice(INCORRECT_FEEDBACK).format(answer=question['answer'])
+            return jsonify({'feedback': feedback}), 200
+
+        response = {
             "mcq_id": question['mcq_id'],
             "question": question['question'],
             "chosen": user_option,
@@ -586,7 +822,10 @@ def submit_answer(attempt_id):
             "is_correct": correct,
             "band": band,
             "time_taken": time_taken
-        })
+        }
+        state['performance_log'][skill]["questions_attempted"] += 1
+        state['performance_log'][skill]["time_spent"] += time_taken
+        state['performance_log'][skill]["responses"].append(response)
 
         if correct:
             state['performance_log'][skill]["correct_answers"] += 1
@@ -599,7 +838,15 @@ def submit_answer(attempt_id):
                 state['current_band_per_skill'][skill] = BAND_ORDER[BAND_ORDER.index(band) - 1]
             feedback = random.choice(INCORRECT_FEEDBACK).format(answer=question['answer'])
 
-        save_assessment_state(attempt_id, state)
+        # Field-level update: doesn't rewrite the question bank or race with next-question
+        skill_path = ['performance_log', skill]
+        get_state_store().patch(attempt_id, state, [
+            ('inc', skill_path + ['questions_attempted'], 1),
+            ('inc', skill_path + ['time_spent'], time_taken),
+            ('inc', skill_path + ['correct_answers' if correct else 'incorrect_answers'], 1),
+            ('append', skill_path + ['responses'], response),
+            ('set', ['current_band_per_skill', skill], state['current_band_per_skill'][skill])
+        ], unless_recorded=(skill_path + ['responses'], {'mcq_id': question['mcq_id']}))
         return jsonify({'feedback': feedback}), 200
     except Exception as e:
         logger.error(f"Error in submit_answer for attempt_id={attempt_id}: {str(e)}")
@@ -618,55 +865,12 @@ def end_assessment(attempt_id):
         proctoring_data_in = data.get('proctoring_data', {})
         logger.debug(f"Received proctoring_data for attempt_id={attempt_id}: {proctoring_data_in}")
 
-        proctoring_data = state.get('proctoring_data', {
-            "snapshots": [],
-            "tab_switches": 0,
-            "fullscreen_warnings": 0,
-            "remarks": [],
-            "forced_termination": False,
-            "termination_reason": ""
-        })
-        proctoring_data.update({
-            "tab_switches": proctoring_data_in.get("tab_switches", proctoring_data["tab_switches"]),
-            "fullscreen_warnings": proctoring_data_in.get("fullscreen_warnings", proctoring_data["fullscreen_warnings"]),
-            "remarks": proctoring_data.get("remarks", []) + proctoring_data_in.get("remarks", []),
-            "forced_termination": proctoring_data_in.get("forced_termination", proctoring_data["forced_termination"]),
-            "termination_reason": proctoring_data_in.get("termination_reason", proctoring_data["termination_reason"])
-        })
-
         attempt = AssessmentAttempt.query.get(attempt_id)
         if not attempt:
             logger.error(f"AssessmentAttempt not found for attempt_id={attempt_id}")
             return jsonify({'error': 'Assessment attempt not found'}), 404
 
-        candidate = Candidate.query.get(attempt.candidate_id)
-        if candidate.profile_picture:
-            profile_image_path = f'https://storage.googleapis.com/gen-ai-quiz/uploads/{candidate.profile_picture}'
-            for snapshot in proctoring_data["snapshots"]:
-                snapshot_path = f'https://storage.googleapis.com/gen-ai-quiz/uploads/{snapshot["path"]}'
-                is_match, remark = compare_images(snapshot_path, profile_image_path)
-                proctoring_data["remarks"].append(f"Snapshot at {snapshot['timestamp']}: {remark}")
-                snapshot["is_valid"] = is_match
-        else:
-            proctoring_data["remarks"].append("No candidate profile image available for comparison")
-
-        performance_log = state['performance_log']
-        for skill in performance_log:
-            performance_log[skill]["final_band"] = state['current_band_per_skill'][skill]
-            correct = performance_log[skill]["correct_answers"]
-            total = performance_log[skill]["questions_attempted"]
-            performance_log[skill]["accuracy_percent"] = round((correct / total) * 100, 2) if total > 0 else 0.0
-        performance_log['proctoring_data'] = proctoring_data
-
-        attempt.performance_log = performance_log
-        attempt.end_time = datetime.utcnow()
-        attempt.status = 'completed'
-        db.session.commit()
-        # Delete state after completion
-        assessment_state = AssessmentState.query.get(attempt_id)
-        if assessment_state:
-            db.session.delete(assessment_state)
-            db.session.commit()
+        performance_log, proctoring_data = finalize_assessment(attempt, state, proctoring_data_in)
 
         return jsonify({
             'message': 'Assessment completed',
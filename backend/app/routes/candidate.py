@@ -15,14 +15,14 @@ from app.models.recruiter import Recruiter
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timezone, timedelta
 from app.utils.gcs_upload import upload_to_gcs
+from app.services.storage import get_storage
+from app.services.llm_client import get_llm
 from flask_mail import Message
-from google.cloud import storage
 from google.cloud.exceptions import GoogleCloudError
 import os
 import re
 import difflib
 import pytz
-import google.generativeai as genai
 import logging
 from io import BytesIO
 from pdfminer.high_level import extract_text
@@ -44,9 +44,6 @@ candidate_api_bp = Blueprint('candidate_api', __name__, url_prefix='/api/candida
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-
 # Initialize Flask-Limiter
 limiter = Limiter(key_func=get_remote_address)
 
@@ -176,7 +173,6 @@ def fallback_resume_parsing(resume_text):
 def analyze_resume(resume_text):
     """Analyze resume text using Gemini API with fallback."""
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
         prompt = f"""
 You are a JSON assistant. Extract and return ONLY valid JSON in the following format (no comments or explanations):
 
@@ -232,9 +228,10 @@ Extract information from the resume as follows:
 Resume:
 {resume_text}
         """
-        response = model.generate_content(prompt)
+        # Parsed resumes can run past the default output budget
+        text = get_llm().generate(prompt, max_output_tokens=8192, call_site='resume_analysis')
         logger.debug("Successfully received response from Gemini API")
-        return response.text
+        return text
     except Exception as e:
         logger.warning(f"Gemini API failed: {str(e)}. Falling back to spaCy parsing.")
         return fallback_resume_parsing(resume_text)
@@ -715,15 +712,10 @@ def update_profile(user_id):
         elif candidate.resume:
             # Re-parse existing resume from GCS
             logger.debug(f"Fetching existing resume from GCS for candidate_id={candidate.candidate_id}")
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(os.getenv("GCS_BUCKET_NAME", "gen-ai-quiz"))
-            blob = bucket.get_blob(f"uploads/{candidate.resume}")
-            if not blob:
+            resume_content = BytesIO()
+            if not get_storage().download(candidate.resume, resume_content):
                 logger.error(f"Resume not found in GCS: uploads/{candidate.resume}")
                 return jsonify({'error': 'Existing resume not found in storage. Please upload a new resume.'}), 404
-
-            resume_content = BytesIO()
-            blob.download_to_file(resume_content)
             resume_content.seek(0)
             resume_text = extract_text_from_pdf(resume_content)
             gemini_output = analyze_resume(resume_text)
@@ -794,15 +786,10 @@ def update_profile(user_id):
     elif candidate.resume and not parsed_data:
         try:
             logger.debug(f"Fetching existing resume from GCS for candidate_id={candidate.candidate_id}")
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(os.getenv("GCS_BUCKET_NAME", "gen-ai-quiz"))
-            blob = bucket.get_blob(f"uploads/{candidate.resume}")
-            if not blob:
+            resume_content = BytesIO()
+            if not get_storage().download(candidate.resume, resume_content):
                 logger.error(f"Resume not found in GCS: uploads/{candidate.resume}")
                 return jsonify({'error': 'Existing resume not found in storage. Please upload a new resume.'}), 404
-
-            resume_content = BytesIO()
-            blob.download_to_file(resume_content)
             resume_content.seek(0)
             resume_text = extract_text_from_pdf(resume_content)
             gemini_output = analyze_resume(resume_text)
@@ -1,6 +1,6 @@
 from io import BytesIO
 from string import Template
-from flask import Blueprint, jsonify, request, send_file, session
+from flask import Blueprint, Response, jsonify, request, send_file, session, stream_with_context
 import requests
 from app import db, mail
 from app.models.user import User, PasswordResetToken
@@ -18,21 +18,20 @@ from app.models.assessment_proctoring_data import AssessmentProctoringData
 from app.models.subscription_plan import SubscriptionPlan
 from app.models.proctoring_violation import ProctoringViolation
 from app.models.degree_branch import DegreeBranch
+from app.models.report_export import ReportExport
 from app.services import question_batches
+from app.services import question_bank
+from app.services import report_export
+from app.services import result_export
+from app.services.llm_async import LLM_ASYNC_ITEM_TIMEOUT, get_llm_engine
+from app.services.llm_limiter import LLMUnavailableError
+from app.services.storage import get_storage
 from sqlalchemy import and_
 from sqlalchemy.orm import joinedload
 from datetime import datetime, timezone, timedelta
 import logging
 import os
-import google.generativeai as genai
 import importlib
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 import secrets
 from flask_mail import Message
 from geopy.distance import geodesic
@@ -43,70 +42,119 @@ recruiter_api_bp = Blueprint('recruiter_api', __name__, url_prefix='/api/recruit
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Configure Gemini AI API
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY environment variable not set")
-genai.configure(api_key=api_key)
-generation_config = {
-    "temperature": 0.2,
-    "max_output_tokens": 2048
-}
-model_gemini = genai.GenerativeModel(
-    model_name="gemini-1.5-flash", generation_config=generation_config
-)
-
-
-def generate_ai_feedback(candidate_data, proctoring_data, violations):
+# Candidates whose AI feedback is generated together while a report is rendered to PDF
+REPORT_FEEDBACK_CHUNK = int(os.getenv('REPORT_FEEDBACK_CHUNK', 50))
+# Seconds each AI feedback call of a PDF report may wait for the rate limiter and the model; a chunk
+# needs about REPORT_FEEDBACK_CHUNK / LLM_RATE_PER_MINUTE minutes of tokens
+REPORT_FEEDBACK_TIMEOUT = float(os.getenv('REPORT_FEEDBACK_TIMEOUT', 300))
+
+
+def build_ai_feedback_prompt(candidate_data, performance_log, proctoring_data, violations):
+    """Prompt asking Gemini AI to summarize a candidate's performance and proctoring data."""
+    return (
+        "Analyze the candidate's assessment performance and proctoring data. "
+        "Provide insights on strengths, weaknesses, and any concerns based on "
+        "tab switches, fullscreen warnings, and violations. Summarize in 2-3 sentences.\n\n"
+        f"Candidate ID: {candidate_data.get('candidate_id')}\n"
+        f"Name: {candidate_data.get('name')}\n"
+        f"Performance: {performance_log}\n"
+        f"Skills: {candidate_data.get('skills', [])}\n"
+        f"Experience: {candidate_data.get('experience', 0)} years\n"
+        f"Tab Switches: {proctoring_data.tab_switches if proctoring_data else 0}\n"
+        f"Fullscreen Warnings: {proctoring_data.fullscreen_warnings if proctoring_data else 0}\n"
+        f"Remarks: {proctoring_data.remarks if proctoring_data else []}\n"
+        f"Violations: {[{'type': v.violation_type, 'timestamp': v.timestamp.isoformat()} for v in violations]}"
+    )
+
+def generate_ai_feedback(feedback_requests, timeout=LLM_ASYNC_ITEM_TIMEOUT):
     """
-    Generate AI feedback using Gemini AI.
+    Generate AI feedback for many candidates concurrently on the async LLM engine.
     Args:
-        candidate_data: Dict with candidate performance (e.g., performance_log, skills).
-        proctoring_data: AssessmentProctoringData object.
-        violations: List of ProctoringViolation objects.
+        feedback_requests: List of (candidate_data, proctoring_data, violations) tuples, where
+            candidate_data is a dict with candidate_id, job_id, name, skills, experience.
+        timeout: Seconds each call may wait for a rate-limiter token and the model.
     Returns:
-        Dict with AI-generated feedback or fallback message if error.
+        List of dicts with AI-generated feedback or a fallback message, in the order of feedback_requests.
     """
+    unavailable = {"summary": "AI feedback unavailable due to an error."}
+    rate_limited = {"summary": "AI feedback unavailable: the AI service is busy, please try again later."}
+    if not feedback_requests:
+        return []
     try:
-        print(candidate_data)
-        candidate_id = candidate_data.get('candidate_id')
-        job_id = candidate_data.get('job_id')
-        print("candiate and job id", candidate_id, job_id)  # Ensure job_id is passed in candidate_data
-        if not candidate_id or not job_id:
-            raise ValueError("Missing candidate_id or job_id")
-
-        # Fetch performance_log from AssessmentAttempt
-        attempt = AssessmentAttempt.query.filter_by(
-            candidate_id=candidate_id,
-            job_id=job_id,
-            status='completed'
-        ).first()
-        print(attempt)
-        performance_log = attempt.performance_log if attempt else {}
-        # Prepare prompt for Gemini AI
-        prompt = (
-            "Analyze the candidate's assessment performance and proctoring data. "
-            "Provide insights on strengths, weaknesses, and any concerns based on "
-            "tab switches, fullscreen warnings, and violations. Summarize in 2-3 sentences.\n\n"
-            f"Candidate ID: {candidate_data.get('candidate_id')}\n"
-            f"Name: {candidate_data.get('name')}\n"
-            f"Performance: {performance_log}\n"
-            f"Skills: {candidate_data.get('skills', [])}\n"
-            f"Experience: {candidate_data.get('experience', 0)} years\n"
-            f"Tab Switches: {proctoring_data.tab_switches if proctoring_data else 0}\n"
-            f"Fullscreen Warnings: {proctoring_data.fullscreen_warnings if proctoring_data else 0}\n"
-            f"Remarks: {proctoring_data.remarks if proctoring_data else []}\n"
-            f"Violations: {[{'type': v.violation_type, 'timestamp': v.timestamp.isoformat()} for v in violations]}"
-        )
-
-        # Call Gemini AI
-        response = model_gemini.generate_content(prompt)
-        feedback = response.text.strip() if response.text else "No feedback generated."
-
-        return {"summary": feedback}
+        candidate_ids = {data.get('candidate_id') for data, _, _ in feedback_requests}
+        job_ids = {data.get('job_id') for data, _, _ in feedback_requests}
+        # performance_log of each candidate's completed attempt, in one query for the whole report
+        performance_logs = {}
+        for attempt in AssessmentAttempt.query.filter(
+            AssessmentAttempt.candidate_id.in_(candidate_ids),
+            AssessmentAttempt.job_id.in_(job_ids),
+            AssessmentAttempt.status == 'completed'
+        ).order_by(AssessmentAttempt.attempt_id):
+            performance_logs.setdefault((attempt.candidate_id, attempt.job_id), attempt.performance_log)
+
+        prompts, positions = [], []
+        for position, (candidate_data, proctoring_data, violations) in enumerate(feedback_requests):
+            candidate_id, job_id = candidate_data.get('candidate_id'), candidate_data.get('job_id')
+            if not candidate_id or not job_id:
+                logger.warning(f"Skipping AI feedback without candidate_id or job_id: {candidate_data}")
+                continue
+            performance_log = performance_logs.get((candidate_id, job_id)) or {}
+            prompts.append(build_ai_feedback_prompt(candidate_data, performance_log, proctoring_data, violations))
+            positions.append(position)
+
+        feedback = [unavailable] * len(feedback_requests)
+        for position, item in zip(positions, get_llm_engine().generate_many(prompts, call_site='ai_feedback', timeout=timeout)):
+            if item.error:
+                if isinstance(item.error, LLMUnavailableError):
+                    feedback[position] = rate_limited
+                else:
+                    logger.warning(f"Error generating AI feedback with Gemini: {item.error}")
+                continue
+            feedback[position] = {"summary": item.text.strip() if item.text else "No feedback generated."}
+        return feedback
     except Exception as e:
-        print(f"Error generating AI feedback with Gemini: {str(e)}")
-        return {"summary": "AI feedback unavailable due to an error."}
+        logger.error(f"Error generating AI feedback with Gemini: {str(e)}")
+        return [unavailable] * len(feedback_requests)
+
+def assign_ai_feedback(feedback_requests, timeout=LLM_ASYNC_ITEM_TIMEOUT):
+    """Fill candidate_data['ai_feedback'] for (candidate_data, request) pairs collected while building a report."""
+    feedback = generate_ai_feedback([request for _, request in feedback_requests], timeout)
+    for (candidate_data, _), summary in zip(feedback_requests, feedback):
+        candidate_data['ai_feedback'] = summary
+
+def iter_with_ai_feedback(candidates, feedback_inputs, chunk_size=REPORT_FEEDBACK_CHUNK, timeout=REPORT_FEEDBACK_TIMEOUT):
+    """Yield ranked candidates with their AI feedback, generated one chunk at a time.
+
+    `feedback_inputs` maps candidate_id to (ai_input, attempt_id). Proctoring
+    rows are loaded per chunk and the yielded dicts are copies, so a report
+    rendered from this generator only holds one chunk's feedback at a time.
+    Calls get the long REPORT_FEEDBACK_TIMEOUT deadline by default, so a
+    chunk larger than the limiter's burst waits for tokens instead of
+    failing as busy.
+    """
+    for start in range(0, len(candidates), chunk_size):
+        chunk = [dict(candidate) for candidate in candidates[start:start + chunk_size]]
+        feedback_requests = []
+        for candidate_data in chunk:
+            entry = feedback_inputs.pop(candidate_data['candidate_id'], None)
+            if not entry:
+                continue
+            ai_input, attempt_id = entry
+            proctoring_data = AssessmentProctoringData.query.filter_by(attempt_id=attempt_id).first() if attempt_id else None
+            violations = ProctoringViolation.query.filter_by(attempt_id=attempt_id).all() if attempt_id else []
+            feedback_requests.append((candidate_data, (ai_input, proctoring_data, violations)))
+        assign_ai_feedback(feedback_requests, timeout)
+        yield from chunk
+
+def with_ai_feedback(candidates, feedback_inputs, defer_feedback):
+    """Ranked candidates with AI feedback: a lazy generator for PDFs with defer_feedback, else a list.
+
+    The list is built for the interactive JSON endpoints and keeps the short
+    per-call LLM deadline.
+    """
+    if defer_feedback:
+        return iter_with_ai_feedback(candidates, feedback_inputs)
+    return list(iter_with_ai_feedback(candidates, feedback_inputs, max(len(candidates), 1), LLM_ASYNC_ITEM_TIMEOUT))
 
 # Helper function to check if recruiter has AI reports enabled
 
@@ -455,7 +503,8 @@ def create_assessment():
             )
         except Exception as e:
             logger.warning(f"Failed to generate question batches for job_id={assessment.job_id}: {str(e)}")
-            pass
+            # Let the warm-up worker fill whatever is still missing
+            question_bank.enqueue_warm_up(assessment.job_id)
         return jsonify({'message': 'Assessment created successfully', 'job_id': assessment.job_id}), 201
     except ValueError as e:
         db.session.rollback()
@@ -499,17 +548,29 @@ def get_assessments_by_id(user_id):
         ]
     } for assessment in jobs]), 200
 
-@recruiter_api_bp.route('/candidates/<int:job_id>', methods=['GET'])
-def get_ranked_candidates(job_id):
-    if 'user_id' not in session or session['role'] != 'recruiter':
-        return jsonify({'error': 'Unauthorized'}), 401
+def report_not_ready(job):
+    """Return True while the assessment window of the job is still open."""
+    current_time = datetime.now(timezone.utc)  # Offset-aware current time
+    end_time = job.schedule_end if job.schedule_end else None
 
-    job = JobDescription.query.get_or_404(job_id)
+    # Ensure end_time is offset-aware
+    if end_time and end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=timezone.utc)
+
+    return bool(end_time and end_time > current_time)
+
+def build_pre_assessment_report(job, user_id, defer_feedback=False):
+    """Rank the candidates registered for a job before the assessment.
+
+    With defer_feedback, 'candidates' is a generator that adds AI feedback
+    chunk by chunk as it is consumed, for rendering large reports.
+    """
+    job_id = job.job_id
     registrations = AssessmentRegistration.query.filter_by(job_id=job_id).all()
     candidate_ids = [r.candidate_id for r in registrations]
 
     if not candidate_ids:
-        return jsonify({'job_id': job_id, 'job_title': job.job_title, 'candidates': []}), 200
+        return {'job_id': job_id, 'job_title': job.job_title, 'candidates': []}
 
     candidates = Candidate.query.filter(Candidate.candidate_id.in_(candidate_ids)).all()
     required_skills = RequiredSkill.query.filter_by(job_id=job_id).all()
@@ -530,7 +591,8 @@ def get_ranked_candidates(job_id):
     max_proficiency = 8
     max_skill_score = sum(required_skill_dict.values()) * max_proficiency
     ranked_candidates = []
-    ai_enabled = has_ai_reports(session['user_id'])
+    ai_enabled = has_ai_reports(user_id)
+    feedback_inputs = {}
 
     for candidate in candidates:
         skill_score = 0
@@ -571,7 +633,7 @@ def get_ranked_candidates(job_id):
             'experience_score': round(exp_score, 2),
             'description': description,
             'ai_feedback': None,
-            'job_id': JobDescription.query.get(job_id).job_id,
+            'job_id': job_id,
         }
 
         if ai_enabled:
@@ -588,7 +650,7 @@ def get_ranked_candidates(job_id):
                     "experience_max": job.experience_max
                 }
             }
-            candidate_data['ai_feedback'] = generate_ai_feedback(ai_input, None, [])
+            feedback_inputs[candidate.candidate_id] = (ai_input, None)
 
         ranked_candidates.append(candidate_data)
 
@@ -596,39 +658,34 @@ def get_ranked_candidates(job_id):
     for i, candidate in enumerate(ranked_candidates, 1):
         candidate['rank'] = i
 
-    return jsonify({
+    return {
         'job_id': job_id,
         'job_title': job.job_title,
-        'candidates': ranked_candidates,
+        'candidates': with_ai_feedback(ranked_candidates, feedback_inputs, defer_feedback),
         'ai_enabled': ai_enabled
-    }), 200
+    }
 
-@recruiter_api_bp.route('/report/<int:job_id>', methods=['GET'])
-def get_post_assessment_report(job_id):
+@recruiter_api_bp.route('/candidates/<int:job_id>', methods=['GET'])
+def get_ranked_candidates(job_id):
     if 'user_id' not in session or session['role'] != 'recruiter':
         return jsonify({'error': 'Unauthorized'}), 401
 
-    current_time = datetime.now(timezone.utc)  # Offset-aware current time
     job = JobDescription.query.get_or_404(job_id)
-    end_time = job.schedule_end if job.schedule_end else None
-
-    # Ensure end_time is offset-aware
-    if end_time and end_time.tzinfo is None:
-        end_time = end_time.replace(tzinfo=timezone.utc)
-
-    if end_time and end_time > current_time:
-        return jsonify({'error': 'Report not available until assessment ends'}), 403
+    return jsonify(build_pre_assessment_report(job, session['user_id'])), 200
 
+def build_post_assessment_report(job, user_id, defer_feedback=False):
+    """Rank the candidates of a job by their assessment results."""
+    job_id = job.job_id
     registrations = AssessmentRegistration.query.filter_by(job_id=job_id).all()
     candidate_ids = [r.candidate_id for r in registrations]
     if not candidate_ids:
-        return jsonify({
+        return {
             'job_id': job_id,
             'job_title': job.job_title,
             'job_description': job.job_description,
             'candidates': [],
             'ai_enabled': False
-        }), 200
+        }
 
     candidates = Candidate.query.filter(Candidate.candidate_id.in_(candidate_ids)).all()
     attempts = AssessmentAttempt.query.filter(
@@ -640,14 +697,13 @@ def get_post_assessment_report(job_id):
     ).all()
 
     attempt_map = {a.candidate_id: a for a in attempts}
-    ai_enabled = has_ai_reports(session['user_id'])
+    ai_enabled = has_ai_reports(user_id)
     report = []
+    feedback_inputs = {}
 
     for candidate in candidates:
         attempt = attempt_map.get(candidate.candidate_id)
         performance = attempt.performance_log if attempt else None
-        proctoring_data = AssessmentProctoringData.query.filter_by(attempt_id=attempt.attempt_id).first() if attempt else None
-        violations = ProctoringViolation.query.filter_by(attempt_id=attempt.attempt_id).all() if attempt else []
 
         if performance and isinstance(performance, dict):
             skill_data = {k: v for k, v in performance.items() if k != 'proctoring_data'}
@@ -687,7 +743,7 @@ def get_post_assessment_report(job_id):
                 "skills": list(skill_data.keys()) if skill_data else [],
                 "job_id": job_id
             }
-            candidate_data['ai_feedback'] = generate_ai_feedback(ai_input, proctoring_data, violations)
+            feedback_inputs[candidate.candidate_id] = (ai_input, attempt.attempt_id)
 
         report.append(candidate_data)
 
@@ -696,38 +752,36 @@ def get_post_assessment_report(job_id):
     for i, candidate in enumerate(report, 1):
         candidate['rank'] = i
 
-    return jsonify({
+    return {
         'job_id': job_id,
         'job_title': job.job_title,
-        'candidates': report,
+        'candidates': with_ai_feedback(report, feedback_inputs, defer_feedback),
         'ai_enabled': ai_enabled
-    }), 200
+    }
 
-@recruiter_api_bp.route('/combined-report/<int:job_id>', methods=['GET'])
-def get_combined_report(job_id):
+@recruiter_api_bp.route('/report/<int:job_id>', methods=['GET'])
+def get_post_assessment_report(job_id):
     if 'user_id' not in session or session['role'] != 'recruiter':
         return jsonify({'error': 'Unauthorized'}), 401
 
-    current_time = datetime.now(timezone.utc)  # Offset-aware current time
     job = JobDescription.query.get_or_404(job_id)
-    end_time = job.schedule_end if job.schedule_end else None
-
-    # Ensure end_time is offset-aware
-    if end_time and end_time.tzinfo is None:
-        end_time = end_time.replace(tzinfo=timezone.utc)
-
-    if end_time and end_time > current_time:
+    if report_not_ready(job):
         return jsonify({'error': 'Report not available until assessment ends'}), 403
 
+    return jsonify(build_post_assessment_report(job, session['user_id'])), 200
+
+def build_combined_report(job, user_id, defer_feedback=False):
+    """Rank the candidates of a job by pre- and post-assessment scores combined."""
+    job_id = job.job_id
     registrations = AssessmentRegistration.query.filter_by(job_id=job_id).all()
     candidate_ids = [r.candidate_id for r in registrations]
     if not candidate_ids:
-        return jsonify({
+        return {
             'job_id': job_id,
             'job_title': job.job_title,
             'candidates': [],
             'ai_enabled': False
-        }), 200
+        }
 
     candidates = Candidate.query.filter(Candidate.candidate_id.in_(candidate_ids)).all()
     required_skills = RequiredSkill.query.filter_by(job_id=job_id).all()
@@ -755,8 +809,9 @@ def get_combined_report(job_id):
 
     max_proficiency = 8
     max_skill_score = sum(required_skill_dict.values()) * max_proficiency
-    ai_enabled = has_ai_reports(session['user_id'])
+    ai_enabled = has_ai_reports(user_id)
     ranked_candidates = []
+    feedback_inputs = {}
 
     for candidate in candidates:
         # Pre-assessment calculations
@@ -791,8 +846,6 @@ def get_combined_report(job_id):
 
         # Post-assessment calculations
         attempt = attempt_map.get(candidate.candidate_id)
-        proctoring_data = AssessmentProctoringData.query.filter_by(attempt_id=attempt.attempt_id).first() if attempt else None
-        violations = ProctoringViolation.query.filter_by(attempt_id=attempt.attempt_id).all() if attempt else []
         performance = attempt.performance_log if attempt else None
 
         if performance and isinstance(performance, dict):
@@ -839,7 +892,7 @@ def get_combined_report(job_id):
                 "experience": candidate.years_of_experience,
                 "job_id": job_id
             }
-            candidate_data['ai_feedback'] = generate_ai_feedback(ai_input, proctoring_data, violations)
+            feedback_inputs[candidate.candidate_id] = (ai_input, attempt.attempt_id)
 
         ranked_candidates.append(candidate_data)
 
@@ -847,12 +900,29 @@ def get_combined_report(job_id):
     for i, candidate in enumerate(ranked_candidates, 1):
         candidate['rank'] = i
 
-    return jsonify({
+    return {
         'job_id': job_id,
         'job_title': job.job_title,
-        'candidates': ranked_candidates,
+        'candidates': with_ai_feedback(ranked_candidates, feedback_inputs, defer_feedback),
         'ai_enabled': ai_enabled
-    }), 200
+    }
+
+@recruiter_api_bp.route('/combined-report/<int:job_id>', methods=['GET'])
+def get_combined_report(job_id):
+    if 'user_id' not in session or session['role'] != 'recruiter':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    job = JobDescription.query.get_or_404(job_id)
+    if report_not_ready(job):
+        return jsonify({'error': 'Report not available until assessment ends'}), 403
+
+    return jsonify(build_combined_report(job, session['user_id'])), 200
+
+REPORT_BUILDERS = {
+    'pre-assessment': build_pre_assessment_report,
+    'post-assessment': build_post_assessment_report,
+    'combined': build_combined_report
+}
 # HTML template for PDF rendering
 PDF_TEMPLATE = """
 <!DOCTYPE html>
@@ -996,6 +1066,7 @@ def to_dict_string(d):
 
 @recruiter_api_bp.route('/download-report/<int:job_id>/<string:report_type>', methods=['GET'])
 def download_report(job_id, report_type):
+    """Download a report as PDF. Large reports are better queued with POST /report-exports."""
     if 'user_id' not in session or session['role'] != 'recruiter':
         return jsonify({'error': 'Unauthorized'}), 401
 
@@ -1004,130 +1075,17 @@ def download_report(job_id, report_type):
     if not recruiter or job.recruiter_id != recruiter.recruiter_id:
         return jsonify({'error': 'Unauthorized access to job'}), 403
 
-    # Fetch report data
-    if report_type == 'pre-assessment':
-        report_response = get_ranked_candidates(job_id)
-    elif report_type == 'post-assessment':
-        report_response = get_post_assessment_report(job_id)
-    elif report_type == 'combined':
-        report_response = get_combined_report(job_id)
-    else:
+    build_report = REPORT_BUILDERS.get(report_type)
+    if not build_report:
         return jsonify({'error': 'Invalid report type'}), 400
-
-    # Extract JSON data from response
-    if isinstance(report_response, tuple):
-        report_data = report_response[0].get_json()
-    else:
-        report_data = report_response.get_json()
+    if report_type != 'pre-assessment' and report_not_ready(job):
+        return jsonify({'error': 'Report not available until assessment ends'}), 403
 
     # Generate PDF
     try:
+        report_data = build_report(job, session['user_id'], defer_feedback=True)
         buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=letter,
-            leftMargin=0.75 * inch,
-            rightMargin=0.75 * inch,
-            topMargin=0.75 * inch,
-            bottomMargin=0.75 * inch
-        )
-        elements = []
-
-        # Define styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            name='Title',
-            parent=styles['Heading1'],
-            fontSize=16,
-            leading=20,
-            spaceAfter=12,
-            textColor=colors.black,
-            fontName='Helvetica-Bold'
-        )
-        heading_style = ParagraphStyle(
-            name='Heading',
-            parent=styles['Heading2'],
-            fontSize=12,
-            leading=14,
-            spaceAfter=8,
-            fontName='Helvetica-Bold'
-        )
-        body_style = ParagraphStyle(
-            name='Body',
-            parent=styles['Normal'],
-            fontSize=10,
-            leading=12,
-            spaceAfter=6,
-            fontName='Helvetica'
-        )
-        indent_style = ParagraphStyle(
-            name='Indent',
-            parent=body_style,
-            leftIndent=20
-        )
-
-        # Header
-        elements.append(Paragraph(
-            f"Recruitment Report: {report_data.get('job_title', 'Unknown Job')}",
-            title_style
-        ))
-        elements.append(Paragraph(
-            f"Type: {report_type.replace('-', ' ').title()}",
-            body_style
-        ))
-        elements.append(Spacer(1, 0.2 * inch))
-
-        # Candidate details
-        for candidate in report_data.get('candidates', []):
-            # Candidate name and rank
-            elements.append(Paragraph(
-                f"{candidate.get('name', 'Unknown')} (Rank: {candidate.get('rank', 'N/A')})",
-                heading_style
-            ))
-            # Details
-            elements.append(Paragraph(
-                f"Total Score: {candidate.get('combined_score', 0):.2f}",
-                indent_style
-            ))
-            elements.append(Paragraph(
-                f"Skill Score: {candidate.get('post_score', 0):.2f}",
-                indent_style
-            ))
-            elements.append(Paragraph(
-                f"Experience Score: {candidate.get('pre_score', 0):.2f}",
-                indent_style
-            ))
-            # Description (wrapped)
-            description = candidate.get('description', '')
-            elements.append(Paragraph(
-                f"Description: {description}",
-                indent_style
-            ))
-            # AI Feedback (if available)
-            if candidate.get('ai_feedback'):
-                feedback = candidate['ai_feedback'].get('summary', '')
-                elements.append(Paragraph(
-                    f"AI Feedback: {feedback}",
-                    indent_style
-                ))
-            elements.append(Spacer(1, 0.3 * inch))
-
-        # Build PDF with footer
-        def add_header_footer(canvas, doc):
-            canvas.saveState()
-            # Header
-            canvas.setFont('Helvetica-Bold', 10)
-            canvas.drawString(0.75 * inch, doc.pagesize[1] - 0.5 * inch, "Jatayu Recruitment Platform")
-            # Footer
-            canvas.setFont('Helvetica', 8)
-            canvas.drawString(0.75 * inch, 0.5 * inch, f"Page {canvas.getPageNumber()}")
-            canvas.drawRightString(
-                doc.pagesize[0] - 0.75 * inch, 0.5 * inch,
-                f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-            canvas.restoreState()
-
-        doc.build(elements, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
+        report_export.render_report_pdf(report_data, report_type, buffer)
         buffer.seek(0)
         return send_file(
             buffer,
@@ -1138,4 +1096,147 @@ def download_report(job_id, report_type):
     except Exception as e:
         logger.error(f"Error generating PDF: {str(e)}")
         return jsonify({'error': f'Failed to generate PDF: {str(e)}'}), 500
-    
+
+@recruiter_api_bp.route('/export-results/<int:job_id>', methods=['GET'])
+def export_results(job_id):
+    """Stream a job's candidates, scores, per-skill bands and violation counts as CSV or Parquet."""
+    if 'user_id' not in session or session['role'] != 'recruiter':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    job = JobDescription.query.get_or_404(job_id)
+    recruiter = Recruiter.query.filter_by(user_id=session['user_id']).first()
+    if not recruiter or job.recruiter_id != recruiter.recruiter_id:
+        return jsonify({'error': 'Unauthorized access to job'}), 403
+
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format == 'csv':
+        return Response(
+            stream_with_context(result_export.generate_results_csv(job_id)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=results_{job_id}.csv'}
+        )
+    if export_format == 'parquet':
+        if not result_export.parquet_available():
+            return jsonify({'error': 'Parquet export is not available on this server'}), 501
+        return Response(
+            stream_with_context(result_export.generate_results_parquet(job_id)),
+            mimetype='application/vnd.apache.parquet',
+            headers={'Content-Disposition': f'attachment; filename=results_{job_id}.parquet'}
+        )
+    return jsonify({'error': 'Invalid export format. Use csv or parquet.'}), 400
+
+@recruiter_api_bp.route('/question-bank/<int:job_id>', methods=['GET'])
+def get_question_bank(job_id):
+    """Question counts per skill and difficulty band of a job, with what is still missing."""
+    if 'user_id' not in session or session['role'] != 'recruiter':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    job = JobDescription.query.get_or_404(job_id)
+    recruiter = Recruiter.query.filter_by(user_id=session['user_id']).first()
+    if not recruiter or job.recruiter_id != recruiter.recruiter_id:
+        return jsonify({'error': 'Unauthorized access to job'}), 403
+
+    coverage = question_bank.get_bank_coverage(job_id)
+    coverage['warmup'] = question_bank.get_warmup_stats()
+    return jsonify(coverage), 200
+
+@recruiter_api_bp.route('/question-bank/<int:job_id>/warmup', methods=['POST'])
+def warm_up_question_bank(job_id):
+    """Queue a background top-up of a job's deficient (skill, band) cells."""
+    if 'user_id' not in session or session['role'] != 'recruiter':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    job = JobDescription.query.get_or_404(job_id)
+    recruiter = Recruiter.query.filter_by(user_id=session['user_id']).first()
+    if not recruiter or job.recruiter_id != recruiter.recruiter_id:
+        return jsonify({'error': 'Unauthorized access to job'}), 403
+
+    coverage = question_bank.get_bank_coverage(job_id)
+    if coverage['ready']:
+        return jsonify({'message': 'Question bank is already complete', 'coverage': coverage}), 200
+    question_bank.enqueue_warm_up(job_id)
+    return jsonify({'message': 'Question bank warm-up queued', 'coverage': coverage}), 202
+
+@recruiter_api_bp.route('/report-exports', methods=['POST'])
+def create_report_export():
+    """Queue a PDF report for background rendering; fetch it through the returned URLs."""
+    if 'user_id' not in session or session['role'] != 'recruiter':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    job_id = data.get('job_id')
+    report_type = data.get('report_type')
+    if not isinstance(job_id, int) or not report_type:
+        return jsonify({'error': 'job_id and report_type are required'}), 400
+
+    job = JobDescription.query.get_or_404(job_id)
+    recruiter = Recruiter.query.filter_by(user_id=session['user_id']).first()
+    if not recruiter or job.recruiter_id != recruiter.recruiter_id:
+        return jsonify({'error': 'Unauthorized access to job'}), 403
+
+    build_report = REPORT_BUILDERS.get(report_type)
+    if not build_report:
+        return jsonify({'error': 'Invalid report type'}), 400
+    if report_type != 'pre-assessment' and report_not_ready(job):
+        return jsonify({'error': 'Report not available until assessment ends'}), 403
+
+    export = ReportExport(
+        job_id=job_id,
+        requested_by=session['user_id'],
+        report_type=report_type,
+        status='queued'
+    )
+    db.session.add(export)
+    db.session.commit()
+    report_export.enqueue_report_export(export, build_report)
+    return jsonify({
+        'export_id': export.export_id,
+        'status': export.status,
+        'status_url': f'/api/recruiter/report-exports/{export.export_id}',
+        'download_url': f'/api/recruiter/report-exports/{export.export_id}/download'
+    }), 202
+
+def get_owned_report_export(export_id):
+    """Return the export if it belongs to the logged-in recruiter, else an error response."""
+    if 'user_id' not in session or session['role'] != 'recruiter':
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    export = ReportExport.query.get(export_id)
+    if not export or export.requested_by != session['user_id']:
+        return None, (jsonify({'error': 'Report export not found'}), 404)
+    return export, None
+
+@recruiter_api_bp.route('/report-exports/<int:export_id>', methods=['GET'])
+def get_report_export_status(export_id):
+    export, error = get_owned_report_export(export_id)
+    if error:
+        return error
+    return jsonify({
+        'export_id': export.export_id,
+        'job_id': export.job_id,
+        'report_type': export.report_type,
+        'status': export.status,
+        'error': export.error,
+        'created_at': export.created_at.isoformat() if export.created_at else None,
+        'completed_at': export.completed_at.isoformat() if export.completed_at else None,
+        'download_url': f'/api/recruiter/report-exports/{export.export_id}/download' if export.status == 'completed' else None
+    }), 200
+
+@recruiter_api_bp.route('/report-exports/<int:export_id>/download', methods=['GET'])
+def download_report_export(export_id):
+    export, error = get_owned_report_export(export_id)
+    if error:
+        return error
+    if export.status == 'expired':
+        return jsonify({'error': 'Report file is no longer available'}), 410
+    if export.status != 'completed':
+        return jsonify({'error': f'Report export is {export.status}', 'status': export.status}), 409
+    report_file = get_storage().open(export.file_path) if export.file_path else None
+    if report_file is None:
+        return jsonify({'error': 'Report file is no longer available'}), 410
+    # send_file streams the object in chunks, so large reports are never loaded into memory
+    return send_file(
+        report_file,
+        as_attachment=True,
+        download_name=f'report_{export.job_id}_{export.report_type}.pdf',
+        mimetype='application/pdf'
+    )
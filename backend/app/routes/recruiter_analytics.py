@@ -1,3 +1,4 @@
+from collections import defaultdict
 from flask import Blueprint, jsonify, request, session
 from app import db, mail
 from app.models.job import JobDescription
@@ -6,10 +7,18 @@ from app.models.candidate import Candidate
 from app.models.assessment_registration import AssessmentRegistration
 from app.models.assessment_attempt import AssessmentAttempt
 from app.models.proctoring_violation import ProctoringViolation
+from app.services import mail_outbox
 from flask_mail import Message
+from sqlalchemy import Float, String, and_, column, func, select
+from sqlalchemy.dialects.postgresql import JSONB
 
 recruiter_analytics_api_bp = Blueprint('recruiter_analytics_api', __name__, url_prefix='/api/recruiter/analytics')
 
+CANDIDATES_PER_PAGE = 100
+MAX_CANDIDATES_PER_PAGE = 500
+SNAPSHOTS_PER_PAGE = 50
+MAX_SNAPSHOTS_PER_PAGE = 200
+
 @recruiter_analytics_api_bp.route('/candidates', methods=['GET'])
 def get_candidates():
     """Retrieve all candidates for the recruiter's jobs, with optional filters."""
@@ -23,62 +32,102 @@ def get_candidates():
     job_id = request.args.get('job_id', type=int)
     status = request.args.get('status')
 
-    # Build the query
-    query = Candidate.query.join(
-        AssessmentRegistration,
-        Candidate.candidate_id == AssessmentRegistration.candidate_id
+    # Registrations on this recruiter's jobs that the filters select
+    registrations = db.session.query(
+        AssessmentRegistration.candidate_id,
+        AssessmentRegistration.job_id
     ).join(
-        JobDescription,
-        AssessmentRegistration.job_id == JobDescription.job_id
-    ).outerjoin(
-        AssessmentAttempt,
-        (AssessmentAttempt.candidate_id == Candidate.candidate_id) & 
-        (AssessmentAttempt.job_id == AssessmentRegistration.job_id)
+        JobDescription, AssessmentRegistration.job_id == JobDescription.job_id
     ).filter(
         JobDescription.recruiter_id == recruiter.recruiter_id
     )
-
     if job_id:
-        query = query.filter(AssessmentRegistration.job_id == job_id)
+        registrations = registrations.filter(AssessmentRegistration.job_id == job_id)
+    registrations = registrations.subquery()
+
+    # Average accuracy of one attempt, computed in SQL from its performance_log skills
+    skill_items = func.jsonb_each(AssessmentAttempt.performance_log).table_valued(
+        column('key', String), column('value', JSONB)
+    ).render_derived()
+    attempt_score = select(
+        func.avg(skill_items.c.value['accuracy_percent'].astext.cast(Float))
+    ).where(skill_items.c.key != 'proctoring_data').scalar_subquery()
+
+    # The score shown is that of each candidate's first attempt on those jobs
+    ranked_attempts = db.session.query(
+        AssessmentAttempt.candidate_id,
+        attempt_score.label('total_score'),
+        func.row_number().over(
+            partition_by=AssessmentAttempt.candidate_id, order_by=AssessmentAttempt.attempt_id
+        ).label('position')
+    ).join(
+        registrations,
+        and_(
+            registrations.c.candidate_id == AssessmentAttempt.candidate_id,
+            registrations.c.job_id == AssessmentAttempt.job_id
+        )
+    ).subquery()
+
+    # One row per candidate, titled with their first registration on the recruiter's jobs
+    query = db.session.query(
+        Candidate.candidate_id,
+        Candidate.name,
+        Candidate.status,
+        Candidate.block_reason,
+        JobDescription.job_id,
+        JobDescription.job_title,
+        func.coalesce(ranked_attempts.c.total_score, 0).label('total_score')
+    ).select_from(AssessmentRegistration).join(
+        registrations,
+        and_(
+            registrations.c.candidate_id == AssessmentRegistration.candidate_id,
+            registrations.c.job_id == AssessmentRegistration.job_id
+        )
+    ).join(
+        Candidate, Candidate.candidate_id == AssessmentRegistration.candidate_id
+    ).join(
+        JobDescription, AssessmentRegistration.job_id == JobDescription.job_id
+    ).outerjoin(
+        ranked_attempts,
+        and_(ranked_attempts.c.candidate_id == Candidate.candidate_id, ranked_attempts.c.position == 1)
+    )
     if status:
         query = query.filter(Candidate.status == status)
+    query = query.distinct(Candidate.candidate_id).order_by(
+        Candidate.candidate_id, AssessmentRegistration.registration_date, AssessmentRegistration.job_id
+    )
 
-    candidates = query.all()
-
-    # Process candidates and calculate total_score
-    result = []
-    for candidate in candidates:
-        # Get the job_title from the first registration
-        job_title = 'N/A'
-        if candidate.assessment_registrations:
-            job = JobDescription.query.get(candidate.assessment_registrations[0].job_id)
-            job_title = job.job_title if job else 'N/A'
-
-        # Calculate total_score from the first relevant attempt
-        total_score = 0
-        # Filter attempts for jobs the candidate is registered for
-        relevant_job_ids = [r.job_id for r in candidate.assessment_registrations]
-        attempts = candidate.assessment_attempts.filter(
-            AssessmentAttempt.job_id.in_(relevant_job_ids)
-        ).all()
-        if attempts and attempts[0].performance_log:
-            performance = {
-                k: v for k, v in attempts[0].performance_log.items() 
-                if k != 'proctoring_data' and v.get('accuracy_percent') is not None
-            }
-            if performance:
-                total_score = sum(p['accuracy_percent'] for p in performance.values()) / len(performance)
-
-        result.append({
-            'candidate_id': candidate.candidate_id,
-            'name': candidate.name,
-            'job_title': job_title,
-            'status': candidate.status or 'active',
-            'block_reason': candidate.block_reason or '',
-            'total_score': round(total_score, 2)
-        })
-
-    return jsonify(result), 200
+    # Pagination is opt-in so callers that expect the full list keep getting it
+    pagination = None
+    if 'page' in request.args:
+        pagination = query.paginate(
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', CANDIDATES_PER_PAGE, type=int),
+            max_per_page=MAX_CANDIDATES_PER_PAGE,
+            error_out=False
+        )
+        rows = pagination.items
+    else:
+        rows = query.all()
+
+    result = [{
+        'candidate_id': row.candidate_id,
+        'name': row.name,
+        'job_id': row.job_id,
+        'job_title': row.job_title or 'N/A',
+        'status': row.status or 'active',
+        'block_reason': row.block_reason or '',
+        'total_score': round(float(row.total_score), 2)
+    } for row in rows]
+
+    # The body stays a plain list; pagination details travel in headers
+    response = jsonify(result)
+    if pagination:
+        response.headers['X-Total-Count'] = str(pagination.total)
+        response.headers['X-Page'] = str(pagination.page)
+        response.headers['X-Per-Page'] = str(pagination.per_page)
+        response.headers['X-Total-Pages'] = str(pagination.pages)
+    return response, 200
 
 @recruiter_analytics_api_bp.route('/candidate/block/<int:candidate_id>', methods=['POST'])
 def block_candidate(candidate_id):
@@ -121,32 +170,48 @@ def get_proctoring_data(candidate_id):
         return jsonify({'error': 'Recruiter not found'}), 404
 
     candidate = Candidate.query.get_or_404(candidate_id)
+    snapshot_page = max(request.args.get('snapshot_page', 1, type=int), 1)
+    snapshot_per_page = min(
+        max(request.args.get('snapshot_per_page', SNAPSHOTS_PER_PAGE, type=int), 1),
+        MAX_SNAPSHOTS_PER_PAGE
+    )
+    snapshot_offset = (snapshot_page - 1) * snapshot_per_page
 
     # Only get attempts linked to jobs owned by this recruiter
-    attempts = AssessmentAttempt.query.join(JobDescription, AssessmentAttempt.job_id == JobDescription.job_id)\
+    attempts = db.session.query(AssessmentAttempt, JobDescription.job_title)\
+        .join(JobDescription, AssessmentAttempt.job_id == JobDescription.job_id)\
         .filter(AssessmentAttempt.candidate_id == candidate_id,
                 JobDescription.recruiter_id == recruiter.recruiter_id).all()
-    
-    proctoring_data = []
-    for attempt in attempts:
-        proctoring = attempt.performance_log.get('proctoring_data', {}) if attempt.performance_log else {}
 
-        # Fetch violations for this attempt
-        violations = ProctoringViolation.query.filter_by(attempt_id=attempt.attempt_id).all()
-        violations_list = [
-            {
+    # Fetch violations for all attempts at once and group them per attempt
+    violations_by_attempt = defaultdict(list)
+    attempt_ids = [attempt.attempt_id for attempt, _ in attempts]
+    if attempt_ids:
+        violations = ProctoringViolation.query.filter(
+            ProctoringViolation.attempt_id.in_(attempt_ids)
+        ).order_by(ProctoringViolation.attempt_id, ProctoringViolation.timestamp).all()
+        for v in violations:
+            violations_by_attempt[v.attempt_id].append({
                 'violation_id': v.violation_id,
                 'snapshot_path': v.snapshot_path,
                 'violation_type': v.violation_type,
                 'timestamp': v.timestamp.isoformat()
-            } for v in violations
-        ]
+            })
+
+    proctoring_data = []
+    for attempt, job_title in attempts:
+        proctoring = attempt.performance_log.get('proctoring_data', {}) if attempt.performance_log else {}
+        violations_list = violations_by_attempt.get(attempt.attempt_id, [])
 
         if proctoring or violations_list:
+            snapshots = proctoring.get('snapshots', [])
             proctoring_data.append({
                 'attempt_id': attempt.attempt_id,
-                'job_title': JobDescription.query.get(attempt.job_id).job_title,
-                'snapshots': proctoring.get('snapshots', []),
+                'job_title': job_title,
+                'snapshots': snapshots[snapshot_offset:snapshot_offset + snapshot_per_page],
+                'snapshot_total': len(snapshots),
+                'snapshot_page': snapshot_page,
+                'snapshot_per_page': snapshot_per_page,
                 'tab_switches': proctoring.get('tab_switches', 0),
                 'fullscreen_warnings': proctoring.get('fullscreen_warnings', 0),
                 'remarks': proctoring.get('remarks', []),
@@ -182,6 +247,13 @@ def get_jobs():
         'created_at': j.created_at.isoformat() if j.created_at else None
     } for j in jobs]), 200
 
+def get_registered_emails(job_id):
+    """Emails of every candidate registered for a job, in one query."""
+    rows = db.session.query(Candidate.email).join(
+        AssessmentRegistration, AssessmentRegistration.candidate_id == Candidate.candidate_id
+    ).filter(AssessmentRegistration.job_id == job_id).all()
+    return [email for (email,) in rows]
+
 @recruiter_analytics_api_bp.route('/job/suspend/<int:job_id>', methods=['POST'])
 def suspend_job(job_id):
     """Suspend a job with a reason and notify registered candidates."""
@@ -203,20 +275,16 @@ def suspend_job(job_id):
     job.suspension_reason = reason
     db.session.commit()
 
-    registrations = AssessmentRegistration.query.filter_by(job_id=job_id).all()
-    for reg in registrations:
-        candidate = Candidate.query.get(reg.candidate_id)
-        try:
-            msg = Message(
-                subject='Job Suspension Notification',
-                recipients=[candidate.email],
-                body=f'The job "{job.job_title}" has been suspended due to: {reason}. We apologize for any inconvenience.'
-            )
-            mail.send(msg)
-        except Exception as e:
-            return jsonify({'error': f'Job suspended, but failed to send email to candidate {candidate.candidate_id}: {str(e)}'}), 500
-
-    return jsonify({'message': 'Job suspended successfully'}), 200
+    queued = mail_outbox.enqueue_mail(
+        get_registered_emails(job_id),
+        subject='Job Suspension Notification',
+        body=f'The job "{job.job_title}" has been suspended due to: {reason}. We apologize for any inconvenience.',
+        category='job_suspension',
+        job_id=job_id,
+        created_by=session['user_id']
+    )
+
+    return jsonify({'message': 'Job suspended successfully', 'notifications_queued': queued}), 200
 
 @recruiter_analytics_api_bp.route('/job/delete/<int:job_id>', methods=['DELETE'])
 def delete_job(job_id):
@@ -232,22 +300,19 @@ def delete_job(job_id):
     if job.recruiter_id != recruiter.recruiter_id:
         return jsonify({'error': 'Unauthorized access'}), 403
 
-    registrations = AssessmentRegistration.query.filter_by(job_id=job_id).all()
-    for reg in registrations:
-        candidate = Candidate.query.get(reg.candidate_id)
-        try:
-            msg = Message(
-                subject='Job Deletion Notification',
-                recipients=[candidate.email],
-                body=f'The job "{job.job_title}" has been deleted. Please contact the recruiter for more details.'
-            )
-            mail.send(msg)
-        except Exception as e:
-            return jsonify({'error': f'Job deleted, but failed to send email to candidate {candidate.candidate_id}: {str(e)}'}), 500
+    # Queued before the delete so the registrations are still there to read
+    queued = mail_outbox.enqueue_mail(
+        get_registered_emails(job_id),
+        subject='Job Deletion Notification',
+        body=f'The job "{job.job_title}" has been deleted. Please contact the recruiter for more details.',
+        category='job_deletion',
+        job_id=job_id,
+        created_by=session['user_id']
+    )
 
     db.session.delete(job)
     db.session.commit()
-    return jsonify({'message': 'Job deleted successfully'}), 200
+    return jsonify({'message': 'Job deleted successfully', 'notifications_queued': queued}), 200
 
 @recruiter_analytics_api_bp.route('/shortlist/notify', methods=['POST'])
 def notify_shortlisted():
@@ -262,16 +327,32 @@ def notify_shortlisted():
     data = request.get_json()
     candidate_ids = data.get('candidate_ids', [])
 
-    for candidate_id in candidate_ids:
-        candidate = Candidate.query.get_or_404(candidate_id)
-        try:
-            msg = Message(
-                subject='Shortlist Notification',
-                recipients=[candidate.email],
-                body=f'Congratulations! You have been shortlisted for a job opportunity. Please check your dashboard for further details.'
-            )
-            mail.send(msg)
-        except Exception as e:
-            return jsonify({'error': f'Failed to send email to candidate {candidate_id}: {str(e)}'}), 500
-
-    return jsonify({'message': 'Emails sent to shortlisted candidates'}), 200
\ No newline at end of file
+    candidates = Candidate.query.filter(Candidate.candidate_id.in_(candidate_ids)).all() if candidate_ids else []
+    found_ids = {c.candidate_id for c in candidates}
+    missing = [candidate_id for candidate_id in candidate_ids if candidate_id not in found_ids]
+    if missing:
+        return jsonify({'error': f'Candidates not found: {missing}'}), 404
+
+    queued = mail_outbox.enqueue_mail(
+        [c.email for c in candidates],
+        subject='Shortlist Notification',
+        body=f'Congratulations! You have been shortlisted for a job opportunity. Please check your dashboard for further details.',
+        category='shortlist',
+        created_by=session['user_id']
+    )
+
+    return jsonify({'message': 'Emails queued for shortlisted candidates', 'notifications_queued': queued}), 200
+
+@recruiter_analytics_api_bp.route('/notifications/status', methods=['GET'])
+def get_notification_status():
+    """Delivery status of the notifications queued by this recruiter."""
+    if 'user_id' not in session or session.get('role') != 'recruiter':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    job_id = request.args.get('job_id', type=int)
+    category = request.args.get('category')
+
+    return jsonify({
+        'counts': mail_outbox.get_outbox_status(job_id=job_id, category=category, created_by=session['user_id']),
+        'worker': mail_outbox.get_mail_stats()
+    }), 200
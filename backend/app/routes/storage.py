@@ -0,0 +1,54 @@
+import os
+import logging
+from flask import Blueprint, jsonify, request, send_file
+from app.services.storage import LocalStorageBackend, get_storage
+
+storage_api_bp = Blueprint('storage_api', __name__, url_prefix='/api/storage')
+
+logger = logging.getLogger(__name__)
+
+# Largest body accepted by a signed upload on the local backend
+MAX_UPLOAD_BYTES = int(os.getenv('STORAGE_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+
+def get_local_storage():
+    """The local backend, or None when files live in GCS and these routes are disabled."""
+    backend = get_storage()
+    return backend if isinstance(backend, LocalStorageBackend) else None
+
+@storage_api_bp.route('/upload/<path:path>', methods=['PUT'])
+def upload_file(path):
+    """Accept a PUT to a signed upload URL issued by the local backend."""
+    backend = get_local_storage()
+    if not backend:
+        return jsonify({'error': 'Not found'}), 404
+
+    content_type = request.headers.get('Content-Type', '')
+    try:
+        valid = backend.verify_upload_signature(
+            path, content_type, request.args.get('expires'), request.args.get('signature')
+        )
+    except ValueError:
+        valid = False
+    if not valid:
+        logger.warning(f"Rejected local upload to {path}: invalid or expired signature")
+        return jsonify({'error': 'Invalid or expired upload URL'}), 403
+
+    if request.content_length is None or request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({'error': f'Upload must declare a Content-Length of at most {MAX_UPLOAD_BYTES} bytes'}), 413
+
+    backend.upload(request.stream, path, content_type)
+    return '', 200
+
+@storage_api_bp.route('/files/<path:path>', methods=['GET'])
+def get_file(path):
+    """Serve a file stored by the local backend."""
+    backend = get_local_storage()
+    if not backend:
+        return jsonify({'error': 'Not found'}), 404
+    try:
+        file_path = backend.file_path(path)
+    except ValueError:
+        return jsonify({'error': 'Not found'}), 404
+    if not file_path.is_file():
+        return jsonify({'error': 'Not found'}), 404
+    return send_file(file_path)
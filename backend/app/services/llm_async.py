@@ -0,0 +1,152 @@
+import os
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from app.services.llm_client import get_llm
+from app.services.llm_limiter import LLMUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# LLM calls in flight at once per worker process
+LLM_ASYNC_CONCURRENCY = int(os.getenv('LLM_ASYNC_CONCURRENCY', 64))
+# Seconds each item of a batch may take, including waiting for a rate-limit token
+LLM_ASYNC_ITEM_TIMEOUT = float(os.getenv('LLM_ASYNC_ITEM_TIMEOUT', 30))
+
+# text is None when the item failed or ran past its deadline; error says why
+BatchItem = namedtuple('BatchItem', ['text', 'error', 'cached'])
+
+class LLMBatch:
+    """Handle of a submitted batch; result() blocks until every item is done.
+
+    Items answered from the response cache are filled in at submit time.
+    Responses generated on the engine are written to the cache by result(),
+    which runs in the submitting thread and so has its app context.
+    """
+
+    def __init__(self, client, call_site, items, pending, future, timeout=LLM_ASYNC_ITEM_TIMEOUT):
+        self.client = client
+        self.call_site = call_site
+        self.timeout = timeout
+        self.items = items
+        self.pending = pending  # [(index, cache_key, ttl)] generated on the engine
+        self.future = future
+        self._collected = False
+
+    def done(self):
+        return self.future is None or self.future.done()
+
+    def cancel(self):
+        return self.future is not None and self.future.cancel()
+
+    def result(self, timeout=None):
+        """List of BatchItem in the order of the prompts."""
+        if self.future is not None and not self._collected:
+            results = self.future.result(timeout)
+            for (index, cache_key, ttl), outcome in zip(self.pending, results):
+                if isinstance(outcome, BaseException):
+                    if isinstance(outcome, asyncio.TimeoutError):
+                        outcome = TimeoutError("LLM call exceeded its deadline")
+                    self.items[index] = BatchItem(None, outcome, False)
+                else:
+                    self.items[index] = BatchItem(outcome, None, False)
+                    self.client.cache_store(cache_key, self.call_site, outcome, ttl)
+            self._collected = True
+            self._report()
+        return self.items
+
+    def _report(self):
+        """Log and count items that got no response, so a degraded batch is not silent."""
+        errors = [item.error for item in self.items if item.error is not None]
+        self.client.metrics.record_batch(self.call_site, len(errors))
+        if not errors:
+            return
+        refused = sum(1 for error in errors if isinstance(error, LLMUnavailableError))
+        timed_out = sum(1 for error in errors if isinstance(error, TimeoutError))
+        logger.warning(
+            f"{len(errors)} of {len(self.items)} {self.call_site} calls got no response: "
+            f"{refused} refused by the rate limiter or circuit breaker, {timed_out} past the "
+            f"{self.timeout:g}s deadline, {len(errors) - refused - timed_out} failed. "
+            f"Larger batches need a higher LLM_RATE_PER_MINUTE/LLM_RATE_BURST or LLM_ASYNC_ITEM_TIMEOUT."
+        )
+
+class AsyncLLMEngine:
+    """Runs LLM calls as coroutines on one event loop in a daemon thread.
+
+    Sync code submits a batch of prompts and gets an LLMBatch back right
+    away; the calls run concurrently on the loop, at most `concurrency` at
+    a time, each bounded by its own deadline. One loop thread serves any
+    number of in-flight calls, where a thread pool would need a thread per
+    call.
+    """
+
+    def __init__(self, concurrency=LLM_ASYNC_CONCURRENCY, client=None):
+        self.concurrency = concurrency
+        self.client = client
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='llm-async-engine', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _call(self, client, prompt, call_site, timeout, kwargs):
+        async def bounded():
+            async with self.semaphore:
+                return await client.generate_async(prompt, call_site=call_site, max_wait=timeout, **kwargs)
+        # The deadline covers the wait for a concurrency slot as well as the call
+        return await asyncio.wait_for(bounded(), timeout)
+
+    async def _gather(self, client, prompts, call_site, timeout, kwargs):
+        return await asyncio.gather(
+            *(self._call(client, prompt, call_site, timeout, kwargs) for prompt in prompts),
+            return_exceptions=True
+        )
+
+    def submit_batch(self, prompts, call_site='default', timeout=LLM_ASYNC_ITEM_TIMEOUT, **kwargs):
+        """Start generating a response per prompt and return an LLMBatch.
+
+        `kwargs` (response_schema, max_output_tokens, temperature) apply to
+        every prompt. Cached responses are looked up here, in the calling
+        thread, so only misses reach the loop.
+        """
+        client = self.client or get_llm()
+        items = [None] * len(prompts)
+        pending, pending_prompts = [], []
+        for index, prompt in enumerate(prompts):
+            cache_key, ttl, cached = client.cache_lookup(call_site, prompt, **kwargs)
+            if cached is not None:
+                items[index] = BatchItem(cached[0], None, True)
+            else:
+                pending.append((index, cache_key, ttl))
+                pending_prompts.append(prompt)
+        future = None
+        if pending_prompts:
+            future = asyncio.run_coroutine_threadsafe(
+                self._gather(client, pending_prompts, call_site, timeout, kwargs), self.loop
+            )
+        logger.debug(f"Submitted {len(pending_prompts)} of {len(prompts)} {call_site} prompts to the async engine")
+        return LLMBatch(client, call_site, items, pending, future, timeout)
+
+    def generate_many(self, prompts, call_site='default', timeout=LLM_ASYNC_ITEM_TIMEOUT, **kwargs):
+        """submit_batch and wait for it."""
+        return self.submit_batch(prompts, call_site, timeout, **kwargs).result()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_llm_engine():
+    """The process-wide engine, started on first use (after any fork, so each worker gets its own loop)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AsyncLLMEngine()
+                logger.info(f"Started async LLM engine with concurrency {_engine.concurrency}")
+    return _engine
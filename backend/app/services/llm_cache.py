@@ -0,0 +1,112 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import has_app_context
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models.llm_response_cache import LLMResponseCache
+
+logger = logging.getLogger(__name__)
+
+# db: responses shared by all workers through the llm_response_cache table; off: no caching
+LLM_CACHE = os.getenv('LLM_CACHE', 'db')
+# Call sites whose responses are cached and for how many seconds, as site:seconds pairs.
+# Question generation is left out on purpose: a repeated prompt should give new questions.
+LLM_CACHE_TTLS = os.getenv('LLM_CACHE_TTLS', 'ai_feedback:86400,skill_expansion:604800,resume_analysis:86400')
+# Expired rows are deleted once every this many writes
+LLM_CACHE_PURGE_EVERY = int(os.getenv('LLM_CACHE_PURGE_EVERY', 200))
+
+def parse_ttls(value):
+    """{'call_site': seconds} from 'site:seconds,site:seconds'."""
+    ttls = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        call_site, _, seconds = item.partition(':')
+        ttls[call_site.strip()] = int(seconds)
+    return ttls
+
+class DBResponseCache:
+    """Response cache in Postgres, keyed by a hash of the request.
+
+    Reads and writes use their own connection and transaction, so they
+    never commit or roll back the caller's session. Cache errors are logged
+    and treated as misses; outside an app context the cache is skipped.
+    """
+
+    def __init__(self, ttls=None, purge_every=LLM_CACHE_PURGE_EVERY):
+        self.ttls = parse_ttls(LLM_CACHE_TTLS) if ttls is None else ttls
+        self.purge_every = purge_every
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def ttl_for(self, call_site):
+        """Seconds responses of `call_site` are kept, or 0 if it does not use the cache."""
+        return self.ttls.get(call_site, 0) if has_app_context() else 0
+
+    def get(self, cache_key):
+        """(text, prompt_tokens, output_tokens) of an unexpired response, or None."""
+        table = LLMResponseCache.__table__
+        try:
+            with db.engine.connect() as connection:
+                row = connection.execute(
+                    select(table.c.response_text, table.c.prompt_tokens, table.c.output_tokens)
+                    .where(table.c.cache_key == cache_key, table.c.expires_at > datetime.utcnow())
+                ).first()
+        except SQLAlchemyError as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+        return tuple(row) if row else None
+
+    def set(self, cache_key, call_site, text, prompt_tokens, output_tokens, ttl):
+        now = datetime.utcnow()
+        statement = insert(LLMResponseCache.__table__).values(
+            cache_key=cache_key,
+            call_site=call_site,
+            response_text=text,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl)
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=['cache_key'],
+            set_={column: statement.excluded[column]
+                  for column in ('response_text', 'prompt_tokens', 'output_tokens', 'created_at', 'expires_at')}
+        )
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement)
+        except SQLAlchemyError as e:
+            logger.warning(f"LLM cache write failed: {e}")
+            return
+        with self.lock:
+            self.writes += 1
+            purge = self.purge_every and self.writes % self.purge_every == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Delete expired responses; returns how many were removed."""
+        try:
+            with db.engine.begin() as connection:
+                removed = connection.execute(
+                    delete(LLMResponseCache.__table__).where(LLMResponseCache.expires_at <= datetime.utcnow())
+                ).rowcount
+        except SQLAlchemyError as e:
+            logger.warning(f"LLM cache purge failed: {e}")
+            return 0
+        if removed:
+            logger.info(f"Purged {removed} expired LLM cache entries")
+        return removed
+
+def create_llm_cache(name=None):
+    name = (name or LLM_CACHE).lower()
+    if name == 'off':
+        return None
+    if name == 'db':
+        return DBResponseCache()
+    raise ValueError(f"Unknown LLM_CACHE '{name}'")
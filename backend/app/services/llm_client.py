@@ -0,0 +1,718 @@
+import os
+import json
+import time
+import asyncio
+import functools
+import random
+import hashlib
+import logging
+import threading
+from collections import deque, namedtuple
+from app.services.llm_limiter import LLMRateLimitedError, LLMUnavailableError, LLM_RATE_MAX_WAIT, create_llm_limiter
+from app.services.llm_cache import create_llm_cache
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+# gemini, or mock for offline runs and benchmarks
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+LLM_MODEL = os.getenv('LLM_MODEL', 'gemini-1.5-flash')
+LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', 0.2))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', 2048))
+# Objects the mock returns per combination of enum values in an array response
+MOCK_ITEMS_PER_COMBINATION = int(os.getenv('LLM_MOCK_ITEMS_PER_COMBINATION', 20))
+
+# Retries of transient provider errors (5xx, timeouts, injected errors); quota errors are not retried
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', 0.5))
+
+# Fault injection on top of any provider: added latency and a share of failing calls
+LLM_FAULT_LATENCY_MS = float(os.getenv('LLM_FAULT_LATENCY_MS', 0))
+LLM_FAULT_LATENCY_JITTER_MS = float(os.getenv('LLM_FAULT_LATENCY_JITTER_MS', 0))
+LLM_FAULT_ERROR_RATE = float(os.getenv('LLM_FAULT_ERROR_RATE', 0))
+# error (transient, retried) or rate_limit (TooManyRequests, as the Gemini API raises it)
+LLM_FAULT_ERROR_KIND = os.getenv('LLM_FAULT_ERROR_KIND', 'error')
+LLM_FAULT_SEED = os.getenv('LLM_FAULT_SEED')
+
+# off, record (call the provider and save responses) or replay (answer from saved responses only)
+LLM_RECORD_MODE = os.getenv('LLM_RECORD_MODE', 'off')
+LLM_RECORD_PATH = os.getenv('LLM_RECORD_PATH', 'llm_recordings.jsonl')
+
+# Latest calls per call site kept for latency percentiles
+LLM_METRICS_WINDOW = int(os.getenv('LLM_METRICS_WINDOW', 1000))
+
+LLMResponse = namedtuple('LLMResponse', ['text', 'prompt_tokens', 'output_tokens'])
+
+class LLMError(Exception):
+    """Base class of errors raised by the LLM client itself."""
+
+class LLMTransientError(LLMError):
+    """A failure worth retrying, e.g. an injected fault."""
+
+class LLMReplayMissError(LLMError):
+    """Replay mode got a request that was never recorded."""
+
+def request_key(prompt, response_schema, max_output_tokens, temperature, namespace=None):
+    """Stable hash of a request, for recordings and the response cache."""
+    payload = [prompt, response_schema, max_output_tokens, temperature] + ([namespace] if namespace else [])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4) if text else 0
+
+def _is_rate_limit(error):
+    return google_exceptions is not None and isinstance(error, google_exceptions.TooManyRequests)
+
+def _is_retryable(error):
+    if isinstance(error, LLMTransientError):
+        return True
+    if google_exceptions is not None:
+        return isinstance(error, (
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded
+        ))
+    return False
+
+class LLMProvider:
+    """Text generation backend.
+
+    `response_schema` asks for JSON output matching an OpenAPI-style schema
+    (see app.services.mcq_schema); without it the model returns free text.
+    `generate` returns an LLMResponse; `stream` yields LLMResponse chunks whose
+    token counts, where known, cover the call so far. `generate_async` is the
+    coroutine version used by the async engine (app.services.llm_async).
+    """
+    name = 'base'
+
+    @property
+    def cache_namespace(self):
+        """Identifies the model behind the provider in response cache keys."""
+        return self.name
+
+    def generate(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        yield self.generate(prompt, response_schema, max_output_tokens, temperature)
+
+    async def generate_async(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        # Providers without a native async API fall back to the loop's default thread pool
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.generate, prompt, response_schema, max_output_tokens, temperature)
+        )
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, model_name=LLM_MODEL, api_key=None):
+        if genai is None:
+            raise RuntimeError('google-generativeai is not installed')
+        api_key = api_key or os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable not set")
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name=model_name)
+
+    @property
+    def cache_namespace(self):
+        return f"gemini:{self.model_name}"
+
+    def _generation_config(self, response_schema, max_output_tokens, temperature):
+        config = {
+            "temperature": LLM_TEMPERATURE if temperature is None else temperature,
+            "max_output_tokens": max_output_tokens or LLM_MAX_OUTPUT_TOKENS
+        }
+        if response_schema:
+            config.update({"response_mime_type": "application/json", "response_schema": response_schema})
+        return config
+
+    def _usage(self, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if not usage:
+            return None, None
+        return usage.prompt_token_count or None, usage.candidates_token_count or None
+
+    def generate(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        response = self.model.generate_content(
+            prompt, generation_config=self._generation_config(response_schema, max_output_tokens, temperature)
+        )
+        return LLMResponse(response.text, *self._usage(response))
+
+    async def generate_async(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        response = await self.model.generate_content_async(
+            prompt, generation_config=self._generation_config(response_schema, max_output_tokens, temperature)
+        )
+        return LLMResponse(response.text, *self._usage(response))
+
+    def stream(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        response = self.model.generate_content(
+            prompt, generation_config=self._generation_config(response_schema, max_output_tokens, temperature), stream=True
+        )
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                text = ''  # A chunk without text parts, e.g. only a finish reason
+            prompt_tokens, output_tokens = self._usage(chunk)
+            if text or output_tokens:
+                yield LLMResponse(text, prompt_tokens, output_tokens)
+
+class MockProvider(LLMProvider):
+    """Deterministic local model: the same prompt and schema always give the same response.
+
+    With a schema it returns JSON built from it: strings are derived from a
+    hash of the prompt and their position, enum strings cycle through their
+    values, and arrays hold MOCK_ITEMS_PER_COMBINATION objects for every
+    combination of the enum values of their items. Without one it returns a
+    short text. Token counts are estimated from text length.
+    """
+    name = 'mock'
+
+    def __init__(self, chunk_size=64):
+        self.chunk_size = chunk_size
+
+    def _text(self, seed, path):
+        digest = hashlib.sha256(f"{seed}|{path}".encode()).hexdigest()
+        words = [digest[i:i + 6] for i in range(0, 36, 6)]
+        return f"Mock {path.rsplit('.', 1)[-1]} {' '.join(words)}"
+
+    def _enum_sizes(self, schema):
+        if schema.get("type", "").upper() != "OBJECT":
+            return []
+        return [len(prop["enum"]) for prop in schema.get("properties", {}).values() if prop.get("enum")]
+
+    def _build(self, schema, seed, path, index=0):
+        kind = schema.get("type", "STRING").upper()
+        if kind == "OBJECT":
+            value = {}
+            # Mixed-radix index over the enum properties, so every combination appears
+            radix = index
+            for key, prop in schema.get("properties", {}).items():
+                if prop.get("enum"):
+                    value[key] = prop["enum"][radix % len(prop["enum"])]
+                    radix //= len(prop["enum"])
+                else:
+                    value[key] = self._build(prop, seed, f"{path}.{key}", index)
+            return value
+        if kind == "ARRAY":
+            items = schema.get("items", {})
+            combinations = 1
+            for size in self._enum_sizes(items):
+                combinations *= size
+            return [self._build(items, seed, f"{path}[{i}]", i) for i in range(MOCK_ITEMS_PER_COMBINATION * combinations)]
+        if kind in ("INTEGER", "NUMBER"):
+            return index
+        if kind == "BOOLEAN":
+            return index % 2 == 0
+        if schema.get("enum"):
+            return schema["enum"][index % len(schema["enum"])]
+        return self._text(seed, path)
+
+    def _text_for(self, prompt, response_schema):
+        seed = hashlib.sha256(prompt.encode()).hexdigest()[:16]
+        if response_schema:
+            return json.dumps(self._build(response_schema, seed, "response"))
+        return f"Mock response {seed}"
+
+    def generate(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        text = self._text_for(prompt, response_schema)
+        return LLMResponse(text, _estimate_tokens(prompt), _estimate_tokens(text))
+
+    async def generate_async(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        return self.generate(prompt, response_schema, max_output_tokens, temperature)
+
+    def stream(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        text = self._text_for(prompt, response_schema)
+        prompt_tokens = _estimate_tokens(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield LLMResponse(
+                text[start:start + self.chunk_size], prompt_tokens, _estimate_tokens(text[:start + self.chunk_size])
+            )
+
+class FaultInjectingProvider(LLMProvider):
+    """Wraps a provider with added latency and randomly failing calls.
+
+    Latency is `latency_ms` plus up to `jitter_ms`, applied before the first
+    chunk. A failing call raises before reaching the wrapped provider, so a
+    retry costs the latency again but nothing upstream.
+    """
+
+    def __init__(self, inner, latency_ms=0, jitter_ms=0, error_rate=0.0, error_kind='error', seed=None):
+        self.inner = inner
+        self.name = f"{inner.name}+faults"
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @property
+    def cache_namespace(self):
+        return self.inner.cache_namespace
+
+    def _draw(self):
+        """(delay in seconds, whether the call fails) for the next call."""
+        with self.lock:
+            delay = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+        return delay / 1000, fail
+
+    def _fail(self):
+        if self.error_kind == 'rate_limit' and google_exceptions is not None:
+            raise google_exceptions.TooManyRequests('Injected rate limit')
+        raise LLMTransientError('Injected LLM failure')
+
+    def _inject(self):
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._fail()
+
+    def generate(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        self._inject()
+        return self.inner.generate(prompt, response_schema, max_output_tokens, temperature)
+
+    async def generate_async(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        delay, fail = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            self._fail()
+        return await self.inner.generate_async(prompt, response_schema, max_output_tokens, temperature)
+
+    def stream(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        self._inject()
+        yield from self.inner.stream(prompt, response_schema, max_output_tokens, temperature)
+
+class RecordReplayProvider(LLMProvider):
+    """Saves responses of a provider to a JSONL file, or answers from that file.
+
+    Requests are keyed by a hash of prompt, schema, token limit and
+    temperature. Streamed responses keep their chunks so a replay streams
+    them the same way. In replay mode `inner` is not needed and an unknown
+    request raises LLMReplayMissError.
+    """
+
+    def __init__(self, path, mode='replay', inner=None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown record mode '{mode}'")
+        if mode == 'record' and inner is None:
+            raise ValueError("Record mode needs a provider to record")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.name = f"{inner.name}+record" if mode == 'record' else 'replay'
+        self.recordings = self._load()
+        self.lock = threading.Lock()
+
+    @property
+    def cache_namespace(self):
+        return self.inner.cache_namespace if self.inner is not None else 'replay'
+
+    def _load(self):
+        recordings = {}
+        if not os.path.exists(self.path):
+            if self.mode == 'replay':
+                logger.warning(f"No LLM recordings at {self.path}")
+            return recordings
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry['key']] = entry
+        logger.info(f"Loaded {len(recordings)} LLM recordings from {self.path}")
+        return recordings
+
+    def _save(self, key, chunks):
+        entry = {
+            'key': key,
+            'chunks': [chunk.text for chunk in chunks],
+            'prompt_tokens': chunks[-1].prompt_tokens if chunks else None,
+            'output_tokens': chunks[-1].output_tokens if chunks else None
+        }
+        with self.lock:
+            self.recordings[key] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def _replay(self, key):
+        entry = self.recordings.get(key)
+        if entry is None:
+            raise LLMReplayMissError(f"No recorded LLM response for request {key[:12]}")
+        return entry
+
+    def generate(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        key = request_key(prompt, response_schema, max_output_tokens, temperature)
+        if self.mode == 'replay':
+            entry = self._replay(key)
+            return LLMResponse(''.join(entry['chunks']), entry['prompt_tokens'], entry['output_tokens'])
+        response = self.inner.generate(prompt, response_schema, max_output_tokens, temperature)
+        self._save(key, [response])
+        return response
+
+    async def generate_async(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        if self.mode == 'replay':
+            return self.generate(prompt, response_schema, max_output_tokens, temperature)
+        response = await self.inner.generate_async(prompt, response_schema, max_output_tokens, temperature)
+        self._save(request_key(prompt, response_schema, max_output_tokens, temperature), [response])
+        return response
+
+    def stream(self, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        key = request_key(prompt, response_schema, max_output_tokens, temperature)
+        if self.mode == 'replay':
+            entry = self._replay(key)
+            for text in entry['chunks']:
+                yield LLMResponse(text, None, None)
+            yield LLMResponse('', entry['prompt_tokens'], entry['output_tokens'])
+            return
+        chunks = []
+        for chunk in self.inner.stream(prompt, response_schema, max_output_tokens, temperature):
+            chunks.append(chunk)
+            yield chunk
+        # Only complete streams are recorded; an abandoned one would replay truncated
+        self._save(key, chunks)
+
+class LLMMetrics:
+    """Per call site counters of LLM calls: latency, tokens, retries and errors.
+
+    Calls refused by the limiter count as `rejected`, not as errors.
+    Responses served from the cache count as cache hits, not as calls.
+    Async batches with items that got no response count as degraded.
+    """
+
+    def __init__(self, window=LLM_METRICS_WINDOW):
+        self.window = window
+        self.sites = {}
+        self.lock = threading.Lock()
+
+    def _site(self, call_site):
+        site = self.sites.get(call_site)
+        if site is None:
+            site = self.sites[call_site] = {
+                'calls': 0, 'errors': 0, 'rejected': 0, 'retries': 0, 'prompt_tokens': 0, 'output_tokens': 0,
+                'cache_hits': 0, 'cache_misses': 0, 'batches': 0, 'degraded_batches': 0, 'batch_items_failed': 0,
+                'latencies': deque(maxlen=self.window)
+            }
+        return site
+
+    def record_batch(self, call_site, failed):
+        """Count an async batch and how many of its items got no response."""
+        with self.lock:
+            site = self._site(call_site)
+            site['batches'] += 1
+            site['degraded_batches'] += 1 if failed else 0
+            site['batch_items_failed'] += failed
+
+    def record_cache(self, call_site, hit):
+        with self.lock:
+            self._site(call_site)['cache_hits' if hit else 'cache_misses'] += 1
+
+    def record(self, call_site, provider, latency, prompt_tokens, output_tokens, retries, error=None):
+        status = 'rejected' if isinstance(error, LLMUnavailableError) else 'error' if error else 'ok'
+        logger.info(
+            f"LLM call site={call_site} provider={provider} latency_ms={latency * 1000:.1f} "
+            f"prompt_tokens={prompt_tokens} output_tokens={output_tokens} retries={retries} status={status}"
+        )
+        with self.lock:
+            site = self._site(call_site)
+            site['calls'] += 1
+            site['errors'] += 1 if status == 'error' else 0
+            site['rejected'] += 1 if status == 'rejected' else 0
+            site['retries'] += retries
+            site['prompt_tokens'] += prompt_tokens or 0
+            site['output_tokens'] += output_tokens or 0
+            site['latencies'].append(latency)
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for call_site, site in self.sites.items():
+                latencies = sorted(site['latencies'])
+                lookups = site['cache_hits'] + site['cache_misses']
+                percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+                result[call_site] = {
+                    'calls': site['calls'],
+                    'errors': site['errors'],
+                    'rejected': site['rejected'],
+                    'retries': site['retries'],
+                    'prompt_tokens': site['prompt_tokens'],
+                    'output_tokens': site['output_tokens'],
+                    'cache_hits': site['cache_hits'],
+                    'cache_misses': site['cache_misses'],
+                    'cache_hit_rate': round(site['cache_hits'] / lookups, 4) if lookups else None,
+                    'batches': site['batches'],
+                    'degraded_batches': site['degraded_batches'],
+                    'batch_items_failed': site['batch_items_failed'],
+                    'latency_ms_p50': percentile(0.5) if latencies else None,
+                    'latency_ms_p95': percentile(0.95) if latencies else None,
+                    'latency_ms_max': round(latencies[-1] * 1000, 1) if latencies else None
+                }
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.sites = {}
+
+llm_metrics = LLMMetrics()
+
+class LLMClient:
+    """Entry point for model calls: rate limiting, retries of transient errors and metrics.
+
+    `call_site` names the caller (e.g. 'ai_feedback') in logs and metrics.
+    With a limiter, every attempt takes a token first and reports its
+    outcome to the circuit breaker; a refused call raises
+    LLMUnavailableError without reaching the provider. `max_wait` is how
+    long a call may wait for a token. With a cache, call sites that have a
+    TTL configured are answered from it when the same request was made
+    before, without taking a token.
+    """
+
+    def __init__(self, provider, limiter=None, cache=None, max_retries=LLM_MAX_RETRIES,
+                 retry_backoff=LLM_RETRY_BACKOFF, metrics=llm_metrics):
+        self.provider = provider
+        self.limiter = limiter
+        self.cache = cache
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.metrics = metrics
+
+    @property
+    def name(self):
+        return self.provider.name
+
+    def available(self):
+        """False while the circuit breaker is open, so callers can skip straight to their fallback."""
+        return self.limiter is None or self.limiter.allows_calls()
+
+    def _acquire(self, max_wait):
+        if self.limiter is not None:
+            self.limiter.acquire(LLM_RATE_MAX_WAIT if max_wait is None else max_wait)
+
+    def _succeeded(self):
+        if self.limiter is not None:
+            self.limiter.record_success()
+
+    def _failed(self, error):
+        """Report a provider error to the breaker; True if the call should be retried."""
+        rate_limited, retryable = _is_rate_limit(error), _is_retryable(error)
+        if self.limiter is not None and (rate_limited or retryable):
+            self.limiter.record_failure(rate_limited=rate_limited)
+        return retryable
+
+    def cache_lookup(self, call_site, prompt, response_schema=None, max_output_tokens=None, temperature=None):
+        """(cache_key, ttl, cached response or None); ttl is 0 when the call site is not cached."""
+        ttl = self.cache.ttl_for(call_site) if self.cache is not None else 0
+        if not ttl:
+            return None, 0, None
+        cache_key = request_key(prompt, response_schema, max_output_tokens, temperature, self.provider.cache_namespace)
+        cached = self.cache.get(cache_key)
+        self.metrics.record_cache(call_site, cached is not None)
+        return cache_key, ttl, cached
+
+    def cache_store(self, cache_key, call_site, text, ttl):
+        """Save a response found by cache_lookup to be missing, e.g. one generated on the async engine."""
+        if ttl and text:
+            self.cache.set(cache_key, call_site, text, None, _estimate_tokens(text), ttl)
+
+    async def _acquire_async(self, deadline):
+        """Take a token without blocking the event loop, waiting for one until `deadline` (loop time)."""
+        if self.limiter is None:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # The limiter takes a file lock and does file I/O, so it runs off the loop
+                await loop.run_in_executor(None, self.limiter.acquire, 0)
+                return
+            except LLMRateLimitedError as e:
+                if loop.time() + e.retry_after > deadline:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    def _backoff(self, call_site, retries, error):
+        wait_time = self.retry_backoff * 2 ** (retries - 1)
+        logger.warning(f"Transient LLM error at {call_site}: {error}. Retry {retries} in {wait_time:.1f}s")
+        time.sleep(wait_time)
+
+    def generate(self, prompt, response_schema=None, max_output_tokens=None, temperature=None, call_site='default',
+                 max_wait=None):
+        """Return the full response text."""
+        cache_key, ttl, cached = self.cache_lookup(call_site, prompt, response_schema, max_output_tokens, temperature)
+        if cached is not None:
+            return cached[0]
+        start = time.perf_counter()
+        retries = 0
+        while True:
+            try:
+                self._acquire(max_wait)
+                try:
+                    response = self.provider.generate(prompt, response_schema, max_output_tokens, temperature)
+                except Exception as e:
+                    if self._failed(e) and retries < self.max_retries:
+                        retries += 1
+                        self._backoff(call_site, retries, e)
+                        continue
+                    raise
+                self._succeeded()
+                break
+            except Exception as e:
+                self.metrics.record(call_site, self.name, time.perf_counter() - start, None, None, retries, e)
+                raise
+        prompt_tokens = response.prompt_tokens or _estimate_tokens(prompt)
+        output_tokens = response.output_tokens or _estimate_tokens(response.text)
+        self.metrics.record(call_site, self.name, time.perf_counter() - start, prompt_tokens, output_tokens, retries)
+        if ttl and response.text:
+            self.cache.set(cache_key, call_site, response.text, prompt_tokens, output_tokens, ttl)
+        return response.text
+
+    async def generate_async(self, prompt, response_schema=None, max_output_tokens=None, temperature=None,
+                             call_site='default', max_wait=0):
+        """Coroutine version of generate for the async engine, without the response cache.
+
+        The cache needs an app context, so the engine consults it in the
+        submitting thread instead. Waiting for a token and retry backoff
+        sleep on the event loop, and limiter calls run in the loop's
+        executor, so one call never blocks the others.
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        deadline = loop.time() + max_wait
+        retries = 0
+        while True:
+            try:
+                await self._acquire_async(deadline)
+                try:
+                    response = await self.provider.generate_async(prompt, response_schema, max_output_tokens, temperature)
+                except Exception as e:
+                    if await loop.run_in_executor(None, self._failed, e) and retries < self.max_retries:
+                        retries += 1
+                        wait_time = self.retry_backoff * 2 ** (retries - 1)
+                        logger.warning(f"Transient LLM error at {call_site}: {e}. Retry {retries} in {wait_time:.1f}s")
+                        await asyncio.sleep(wait_time)
+                        continue
+                    raise
+                await loop.run_in_executor(None, self._succeeded)
+                break
+            except (Exception, asyncio.CancelledError) as e:
+                self.metrics.record(call_site, self.name, time.perf_counter() - start, None, None, retries, e)
+                raise
+        self.metrics.record(
+            call_site, self.name, time.perf_counter() - start,
+            response.prompt_tokens or _estimate_tokens(prompt), response.output_tokens or _estimate_tokens(response.text),
+            retries
+        )
+        return response.text
+
+    def stream(self, prompt, response_schema=None, max_output_tokens=None, temperature=None, call_site='default',
+               max_wait=None):
+        """Yield the response text in chunks as it is produced.
+
+        Transient errors are retried only until the first chunk arrives;
+        after that the caller has already consumed part of the response.
+        A cached response arrives as a single chunk.
+        """
+        cache_key, ttl, cached = self.cache_lookup(call_site, prompt, response_schema, max_output_tokens, temperature)
+        if cached is not None:
+            yield cached[0]
+            return
+        start = time.perf_counter()
+        retries = 0
+        received = []
+        prompt_tokens = output_tokens = None
+        error = None
+        try:
+            while True:
+                self._acquire(max_wait)
+                try:
+                    for chunk in self.provider.stream(prompt, response_schema, max_output_tokens, temperature):
+                        prompt_tokens = chunk.prompt_tokens or prompt_tokens
+                        output_tokens = chunk.output_tokens or output_tokens
+                        if chunk.text:
+                            received.append(chunk.text)
+                            yield chunk.text
+                except GeneratorExit:
+                    raise
+                except Exception as e:
+                    if self._failed(e) and not received and retries < self.max_retries:
+                        retries += 1
+                        self._backoff(call_site, retries, e)
+                        continue
+                    raise
+                self._succeeded()
+                break
+            if ttl and received:
+                self.cache.set(
+                    cache_key, call_site, ''.join(received),
+                    prompt_tokens or _estimate_tokens(prompt), output_tokens or _estimate_tokens(''.join(received)), ttl
+                )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            text = ''.join(received)
+            self.metrics.record(
+                call_site, self.name, time.perf_counter() - start,
+                prompt_tokens or _estimate_tokens(prompt), output_tokens or _estimate_tokens(text),
+                retries, error
+            )
+
+def create_llm_provider(name=None, record_mode=None):
+    """Provider for `name` (LLM_PROVIDER), with recording and fault injection from the environment."""
+    name = (name or LLM_PROVIDER).lower()
+    record_mode = (record_mode or LLM_RECORD_MODE).lower()
+    if record_mode == 'replay':
+        provider = RecordReplayProvider(LLM_RECORD_PATH, 'replay')
+    else:
+        if name == 'mock':
+            provider = MockProvider()
+        elif name == 'gemini':
+            provider = GeminiProvider()
+        else:
+            raise ValueError(f"Unknown LLM_PROVIDER '{name}'")
+        if record_mode == 'record':
+            provider = RecordReplayProvider(LLM_RECORD_PATH, 'record', provider)
+        elif record_mode != 'off':
+            raise ValueError(f"Unknown LLM_RECORD_MODE '{record_mode}'")
+    if LLM_FAULT_LATENCY_MS or LLM_FAULT_LATENCY_JITTER_MS or LLM_FAULT_ERROR_RATE:
+        provider = FaultInjectingProvider(
+            provider, LLM_FAULT_LATENCY_MS, LLM_FAULT_LATENCY_JITTER_MS, LLM_FAULT_ERROR_RATE, LLM_FAULT_ERROR_KIND,
+            int(LLM_FAULT_SEED) if LLM_FAULT_SEED else None
+        )
+    return provider
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """The process-wide LLMClient, created on first use."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = LLMClient(create_llm_provider(), create_llm_limiter(), create_llm_cache())
+                logger.info(f"Using LLM provider {_llm.name}")
+    return _llm
+
+def set_llm(provider):
+    """Replace the process-wide client, e.g. with a MockProvider for benchmarks."""
+    global _llm
+    _llm = provider if isinstance(provider, LLMClient) else LLMClient(provider)
+
+def get_llm_metrics():
+    metrics = llm_metrics.snapshot()
+    if _llm is not None and _llm.limiter is not None:
+        metrics['limiter'] = _llm.limiter.status()
+    return metrics
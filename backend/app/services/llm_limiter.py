@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from filelock import FileLock, Timeout
+
+logger = logging.getLogger(__name__)
+
+# file: one token bucket and circuit breaker shared by all workers on a host; off: no limits
+LLM_LIMITER = os.getenv('LLM_LIMITER', 'file')
+LLM_LIMITER_STATE_PATH = os.getenv('LLM_LIMITER_STATE_PATH', os.path.join(tempfile.gettempdir(), 'quizzer_llm_limiter.json'))
+# Sustained LLM calls per minute and the burst allowed on top of it
+LLM_RATE_PER_MINUTE = float(os.getenv('LLM_RATE_PER_MINUTE', 60))
+LLM_RATE_BURST = float(os.getenv('LLM_RATE_BURST', 10))
+# Default seconds a call may wait for a token; 0 fails fast
+LLM_RATE_MAX_WAIT = float(os.getenv('LLM_RATE_MAX_WAIT', 0))
+# Consecutive failed calls (quota errors, 5xx, timeouts) that open the breaker, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 3))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+# Seconds the single trial call after a cooldown may take before another one is allowed
+LLM_BREAKER_PROBE_TIMEOUT = float(os.getenv('LLM_BREAKER_PROBE_TIMEOUT', 30))
+# Longest wait for the state file lock before treating the LLM as unavailable
+LOCK_TIMEOUT = 5
+
+class LLMUnavailableError(Exception):
+    """The call was refused before reaching the provider; callers should fall back."""
+
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+class LLMRateLimitedError(LLMUnavailableError):
+    pass
+
+class SharedLLMLimiter:
+    """Token bucket and circuit breaker kept in a small JSON file behind a file lock.
+
+    Every worker process on the host reads and updates the same state, so
+    the rate limit is global and one worker's quota errors stop the others
+    from calling too. The breaker opens after `failure_threshold`
+    consecutive failures; after `cooldown` seconds one call is let through
+    as a probe, and its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, path=LLM_LIMITER_STATE_PATH, rate_per_minute=LLM_RATE_PER_MINUTE, burst=LLM_RATE_BURST,
+                 failure_threshold=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN,
+                 probe_timeout=LLM_BREAKER_PROBE_TIMEOUT):
+        self.path = path
+        self.lock = FileLock(f"{path}.lock", timeout=LOCK_TIMEOUT)
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'tokens': self.burst, 'updated': time.time(), 'state': 'closed', 'failures': 0,
+                    'opened_until': 0, 'probe_until': 0}
+
+    def _write(self, state):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _refill(self, state, now):
+        state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated']) * self.rate)
+        state['updated'] = now
+
+    def _check_breaker(self, state, now):
+        """Raise if the breaker refuses calls; turns an expired open breaker into a probe."""
+        if state['state'] == 'open':
+            if now < state['opened_until']:
+                raise CircuitOpenError('LLM circuit breaker is open', state['opened_until'] - now)
+            state['state'] = 'half_open'
+            state['probe_until'] = now + self.probe_timeout
+            logger.info("LLM circuit breaker half-open, letting one probe call through")
+        elif state['state'] == 'half_open':
+            if now < state['probe_until']:
+                raise CircuitOpenError('LLM circuit breaker is waiting for a probe call', state['probe_until'] - now)
+            # The previous probe never reported back; let another one through
+            state['probe_until'] = now + self.probe_timeout
+
+    def acquire(self, max_wait=LLM_RATE_MAX_WAIT):
+        """Take a token for one call, waiting up to `max_wait` seconds for one.
+
+        Raises CircuitOpenError or LLMRateLimitedError instead of waiting
+        longer, so callers can fall back straight away.
+        """
+        deadline = time.time() + max_wait
+        while True:
+            try:
+                with self.lock:
+                    state = self._read()
+                    now = time.time()
+                    breaker = state['state'], state['probe_until']
+                    self._check_breaker(state, now)
+                    self._refill(state, now)
+                    if state['tokens'] >= 1:
+                        state['tokens'] -= 1
+                        self._write(state)
+                        return
+                    # No call is made, so a probe slot taken above is given back
+                    state['state'], state['probe_until'] = breaker
+                    wait = (1 - state['tokens']) / self.rate if self.rate else float('inf')
+                    self._write(state)
+            except Timeout:
+                raise LLMUnavailableError('Timed out waiting for the LLM limiter lock')
+            if now + wait > deadline:
+                raise LLMRateLimitedError('LLM rate limit reached', wait)
+            time.sleep(wait)
+
+    def allows_calls(self):
+        """Whether the breaker would let a call through now, without taking a token."""
+        try:
+            with self.lock:
+                state = self._read()
+        except Timeout:
+            return False
+        now = time.time()
+        if state['state'] == 'open':
+            return now >= state['opened_until']
+        if state['state'] == 'half_open':
+            return now >= state['probe_until']
+        return True
+
+    def record_success(self):
+        with self.lock:
+            state = self._read()
+            if state['state'] == 'closed' and not state['failures']:
+                return
+            if state['state'] != 'closed':
+                logger.info("LLM circuit breaker closed")
+            state.update({'state': 'closed', 'failures': 0})
+            self._write(state)
+
+    def record_failure(self, rate_limited=False):
+        """Count a failed call; a quota error also empties the bucket."""
+        with self.lock:
+            state = self._read()
+            now = time.time()
+            state['failures'] += 1
+            if rate_limited:
+                state['tokens'] = 0
+                state['updated'] = now
+            if state['state'] == 'half_open' or state['failures'] >= self.failure_threshold:
+                state.update({'state': 'open', 'opened_until': now + self.cooldown})
+                logger.warning(
+                    f"LLM circuit breaker open for {self.cooldown:.0f}s after {state['failures']} consecutive failures"
+                )
+            self._write(state)
+
+    def status(self):
+        with self.lock:
+            state = self._read()
+        now = time.time()
+        self._refill(state, now)
+        return {
+            'state': state['state'],
+            'consecutive_failures': state['failures'],
+            'tokens': round(state['tokens'], 2),
+            'open_seconds_left': round(max(0, state['opened_until'] - now), 1)
+        }
+
+def create_llm_limiter(name=None):
+    name = (name or LLM_LIMITER).lower()
+    if name == 'off':
+        return None
+    if name == 'file':
+        return SharedLLMLimiter()
+    raise ValueError(f"Unknown LLM_LIMITER '{name}'")
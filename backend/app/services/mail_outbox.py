@@ -0,0 +1,186 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import func, insert
+from app import db, mail
+from app.models.mail_outbox import MailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Messages claimed and sent over one SMTP connection
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 100))
+# A message is marked failed after this many unsuccessful attempts
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+# First retry delay in seconds, doubled on every further attempt
+MAIL_RETRY_BACKOFF = int(os.getenv('MAIL_RETRY_BACKOFF', 30))
+# How often the worker looks for due retries when nothing wakes it up
+MAIL_POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', 15))
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'sent': 0,
+    'failed': 0,
+    'retried': 0,
+    'batches': 0,
+    'last_batch_size': 0,
+    'last_batch_seconds': 0.0,
+    'last_batch_rate': 0.0
+}
+
+def init_app(app):
+    """Start the outbox worker with the first request this process serves, unless MAIL_OUTBOX_WORKER=0.
+
+    `flask` CLI commands never serve a request, so they don't start it.
+    Pointing MAIL_SERVER/MAIL_PORT at a local stand-in such as
+    `python -m aiosmtpd -n -l localhost:8025` (with MAIL_USE_TLS=False)
+    exercises the whole pipeline without a real SMTP relay.
+    """
+    if os.getenv('MAIL_OUTBOX_WORKER', '1') == '0':
+        return
+
+    @app.before_request
+    def ensure_mail_worker():
+        if _worker is None or not _worker.is_alive():
+            start_mail_worker(app)
+
+def start_mail_worker(app=None):
+    global _worker
+    app = app or current_app._get_current_object()
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_mail_worker, args=(app,), name='mail-outbox', daemon=True)
+            _worker.start()
+            logger.info("Mail outbox worker started")
+
+def enqueue_mail(recipients, subject, body, category=None, job_id=None, created_by=None):
+    """Queue one message per recipient and wake this process' worker, if it runs.
+
+    Never starts the worker itself: with MAIL_OUTBOX_WORKER=0, or from a CLI
+    command, the rows wait for a worker of a serving process to pick them up.
+    Commits the current session; returns the number of queued messages.
+    """
+    now = datetime.utcnow()
+    rows = [{
+        'recipient': recipient,
+        'subject': subject,
+        'body': body,
+        'category': category,
+        'job_id': job_id,
+        'created_by': created_by,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now
+    } for recipient in dict.fromkeys(r for r in recipients if r)]
+
+    if rows:
+        db.session.execute(insert(MailOutbox), rows)
+    db.session.commit()
+
+    if rows:
+        _wakeup.set()
+        logger.info(f"Queued {len(rows)} '{category}' emails for job_id={job_id}")
+    return len(rows)
+
+def get_mail_stats():
+    """Throughput counters of this process' worker."""
+    with _stats_lock:
+        return dict(_stats)
+
+def get_outbox_status(job_id=None, category=None, created_by=None):
+    """Message counts per status, optionally narrowed to a job, category or sender."""
+    query = db.session.query(MailOutbox.status, func.count(MailOutbox.mail_id))
+    if job_id is not None:
+        query = query.filter(MailOutbox.job_id == job_id)
+    if category:
+        query = query.filter(MailOutbox.category == category)
+    if created_by is not None:
+        query = query.filter(MailOutbox.created_by == created_by)
+    counts = {'pending': 0, 'sent': 0, 'failed': 0}
+    counts.update({status: count for status, count in query.group_by(MailOutbox.status).all()})
+    return counts
+
+def _record_failure(message, error, now):
+    message.attempts += 1
+    message.last_error = str(error)[:1000]
+    if message.attempts >= MAIL_MAX_ATTEMPTS:
+        message.status = 'failed'
+        return 'failed'
+    message.next_attempt_at = now + timedelta(seconds=MAIL_RETRY_BACKOFF * 2 ** (message.attempts - 1))
+    return 'retried'
+
+def dispatch_pending_mail(batch_size=MAIL_BATCH_SIZE):
+    """Send one batch of due messages over a single SMTP connection.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED so several workers (one per
+    gunicorn process) never pick the same message, and the locks are held
+    until the per-recipient results are committed; if the process dies
+    mid-batch the rows simply stay pending. Returns the batch size.
+    """
+    now = datetime.utcnow()
+    batch = MailOutbox.query.filter(
+        MailOutbox.status == 'pending',
+        MailOutbox.next_attempt_at <= now
+    ).order_by(MailOutbox.mail_id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not batch:
+        db.session.commit()
+        return 0
+
+    outcome = {'sent': 0, 'failed': 0, 'retried': 0}
+    started = time.monotonic()
+    processed = 0
+    try:
+        with mail.connect() as conn:
+            for message in batch:
+                try:
+                    conn.send(Message(subject=message.subject, recipients=[message.recipient], body=message.body))
+                    message.status = 'sent'
+                    message.sent_at = datetime.utcnow()
+                    message.attempts += 1
+                    message.last_error = None
+                    outcome['sent'] += 1
+                except Exception as e:
+                    outcome[_record_failure(message, e, now)] += 1
+                    logger.warning(f"Failed to send email {message.mail_id} to {message.recipient}: {str(e)}")
+                processed += 1
+    except Exception as e:
+        # Connection could not be opened (or was dropped while closing): retry what is left
+        logger.error(f"SMTP connection failed: {str(e)}")
+        for message in batch[processed:]:
+            outcome[_record_failure(message, e, now)] += 1
+    db.session.commit()
+
+    elapsed = time.monotonic() - started
+    rate = outcome['sent'] / elapsed if elapsed > 0 else 0.0
+    with _stats_lock:
+        for key, value in outcome.items():
+            _stats[key] += value
+        _stats['batches'] += 1
+        _stats['last_batch_size'] = len(batch)
+        _stats['last_batch_seconds'] = round(elapsed, 3)
+        _stats['last_batch_rate'] = round(rate, 2)
+    logger.info(
+        f"Mail batch: {outcome['sent']}/{len(batch)} sent, {outcome['retried']} to retry, "
+        f"{outcome['failed']} failed in {elapsed:.2f}s ({rate:.1f} msg/s)"
+    )
+    return len(batch)
+
+def _mail_worker(app):
+    while True:
+        _wakeup.wait(MAIL_POLL_INTERVAL)
+        _wakeup.clear()
+        with app.app_context():
+            try:
+                while dispatch_pending_mail():
+                    pass
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Mail outbox worker error: {str(e)}", exc_info=True)
@@ -0,0 +1,63 @@
+from typing import Annotated, List, Literal
+from pydantic import BaseModel, BeforeValidator, ConfigDict, StringConstraints, TypeAdapter, ValidationError
+
+DIFFICULTY_BANDS = ('good', 'better', 'perfect')
+ANSWER_LETTERS = ('A', 'B', 'C', 'D')
+
+def _upper(value):
+    return value.strip().upper() if isinstance(value, str) else value
+
+NonEmptyText = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+AnswerLetter = Annotated[Literal['A', 'B', 'C', 'D'], BeforeValidator(_upper)]
+
+class GeneratedMCQ(BaseModel):
+    """One generated multiple-choice question, as returned by the model."""
+    model_config = ConfigDict(extra='ignore', strict=True)
+
+    question: NonEmptyText
+    option_a: NonEmptyText
+    option_b: NonEmptyText
+    option_c: NonEmptyText
+    option_d: NonEmptyText
+    correct_answer: AnswerLetter
+
+class BatchedMCQ(GeneratedMCQ):
+    """A generated question of a batched request, tagged with the cell it belongs to."""
+    skill: NonEmptyText
+    difficulty_band: NonEmptyText
+
+# Validators are built once; validate_python/validate_json run in pydantic-core
+generated_mcq_adapter = TypeAdapter(GeneratedMCQ)
+generated_mcq_list_adapter = TypeAdapter(List[GeneratedMCQ])
+batched_mcq_adapter = TypeAdapter(BatchedMCQ)
+
+def validation_summary(error):
+    """Short description of a ValidationError, without echoing the whole input."""
+    return '; '.join(f"{'.'.join(str(p) for p in e['loc']) or 'value'}: {e['msg']}" for e in error.errors()[:3])
+
+def _string(enum=None):
+    schema = {"type": "STRING"}
+    if enum:
+        schema.update({"format": "enum", "enum": list(enum)})
+    return schema
+
+def mcq_response_schema(skills=None, bands=None):
+    """Response schema of one MCQ object for schema-constrained JSON output.
+
+    With `skills` and `bands`, objects also carry the skill and
+    difficulty_band they were generated for, limited to those values.
+    """
+    properties = {
+        "question": _string(),
+        "option_a": _string(),
+        "option_b": _string(),
+        "option_c": _string(),
+        "option_d": _string(),
+        "correct_answer": _string(ANSWER_LETTERS)
+    }
+    if skills is not None:
+        properties = {"skill": _string(skills), "difficulty_band": _string(bands or DIFFICULTY_BANDS), **properties}
+    return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+
+def mcq_list_response_schema(skills=None, bands=None):
+    return {"type": "ARRAY", "items": mcq_response_schema(skills, bands)}
@@ -0,0 +1,69 @@
+import io
+import csv
+import logging
+from sqlalchemy import insert
+from app import db
+from app.models.mcq import MCQ
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTY_BANDS = ('good', 'better', 'perfect')
+MCQ_TEXT_FIELDS = ('question', 'option_a', 'option_b', 'option_c', 'option_d')
+MCQ_COPY_COLUMNS = ('job_id', 'skill_id', 'difficulty_band', 'correct_answer') + MCQ_TEXT_FIELDS
+
+def build_mcq_row(job_id, skill_id, difficulty_band, parsed):
+    """Insert parameters for one parsed question, or None if it is not a valid MCQ."""
+    if difficulty_band not in DIFFICULTY_BANDS:
+        logger.warning(f"Invalid difficulty_band '{difficulty_band}' for job_id={job_id}, skill_id={skill_id}")
+        return None
+    if not all(isinstance(parsed.get(field), str) and parsed[field].strip() for field in MCQ_TEXT_FIELDS):
+        logger.warning(f"Skipping MCQ with missing or empty fields for job_id={job_id}, skill_id={skill_id}")
+        return None
+    if parsed.get('correct_answer') not in ('A', 'B', 'C', 'D'):
+        logger.warning(f"Skipping MCQ with invalid correct_answer '{parsed.get('correct_answer')}' for job_id={job_id}, skill_id={skill_id}")
+        return None
+    row = {field: parsed[field] for field in MCQ_TEXT_FIELDS}
+    row.update({
+        'job_id': job_id,
+        'skill_id': skill_id,
+        'difficulty_band': difficulty_band,
+        'correct_answer': parsed['correct_answer']
+    })
+    return row
+
+def insert_mcqs(rows):
+    """Insert MCQ rows in one multi-row INSERT ... RETURNING; the caller commits.
+
+    Returns the new mcq_ids in the order of `rows`.
+    """
+    if not rows:
+        return []
+    result = db.session.execute(
+        insert(MCQ).returning(MCQ.mcq_id, sort_by_parameter_order=True),
+        rows
+    )
+    mcq_ids = list(result.scalars())
+    logger.debug(f"Inserted {len(mcq_ids)} MCQs")
+    return mcq_ids
+
+def copy_mcqs(rows):
+    """Load MCQ rows with one COPY ... FROM STDIN on the session's connection; the caller commits.
+
+    Much faster than INSERT for bulk loads, but the new mcq_ids are not returned.
+    """
+    if not rows:
+        return 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Postgres text cannot hold NUL characters
+        writer.writerow([str(row[column]).replace('\x00', '') for column in MCQ_COPY_COLUMNS])
+    buffer.seek(0)
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {MCQ.__tablename__} ({', '.join(MCQ_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        copied = cursor.rowcount
+    logger.debug(f"Copied {copied} MCQs")
+    return copied
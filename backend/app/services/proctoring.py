@@ -0,0 +1,60 @@
+import logging
+from datetime import datetime
+from app import db
+from app.models.proctoring_event import ProctoringEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('snapshot', 'tab_switch', 'fullscreen_warning', 'remark', 'termination')
+
+def empty_proctoring_data():
+    return {
+        "snapshots": [],
+        "tab_switches": 0,
+        "fullscreen_warnings": 0,
+        "remarks": [],
+        "forced_termination": False,
+        "termination_reason": ""
+    }
+
+def log_event(attempt_id, event_type, path=None, detail=None, timestamp=None):
+    """Add one event to the session; the caller commits."""
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f'Invalid proctoring event type: {event_type}')
+    event = ProctoringEvent(
+        attempt_id=attempt_id,
+        event_type=event_type,
+        path=path,
+        detail=detail,
+        timestamp=timestamp or datetime.utcnow()
+    )
+    db.session.add(event)
+    return event
+
+def fold_proctoring_events(attempt_id, proctoring_data=None):
+    """Build the proctoring_data summary of an attempt from its event log.
+
+    `proctoring_data` is whatever was kept in the assessment state by older
+    code; logged events are appended to it in the order they were recorded.
+    """
+    proctoring_data = {**empty_proctoring_data(), **(proctoring_data or {})}
+    proctoring_data["snapshots"] = list(proctoring_data["snapshots"])
+    proctoring_data["remarks"] = list(proctoring_data["remarks"])
+
+    events = ProctoringEvent.query.filter_by(attempt_id=attempt_id).order_by(ProctoringEvent.event_id).all()
+    for event in events:
+        if event.event_type == 'snapshot':
+            snapshot_entry = {"timestamp": event.timestamp.isoformat(), "path": event.path}
+            proctoring_data["snapshots"].append(snapshot_entry)
+            proctoring_data["remarks"].append(f"Snapshot captured at | {snapshot_entry['timestamp']} | {snapshot_entry['path']}")
+        elif event.event_type == 'tab_switch':
+            proctoring_data["tab_switches"] += 1
+        elif event.event_type == 'fullscreen_warning':
+            proctoring_data["fullscreen_warnings"] += 1
+        elif event.event_type == 'remark':
+            proctoring_data["remarks"].append(event.detail)
+        elif event.event_type == 'termination':
+            proctoring_data["forced_termination"] = True
+            proctoring_data["termination_reason"] = event.detail or ""
+    logger.debug(f"Folded {len(events)} proctoring events for attempt_id={attempt_id}")
+    return proctoring_data
@@ -0,0 +1,250 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import and_, func, select, tuple_
+from app import db
+from app.models.job import JobDescription
+from app.models.mcq import MCQ
+from app.models.required_skill import RequiredSkill
+from app.models.skill import Skill
+from app.services import question_batches
+from app.services.question_dedup import get_duplicate_index
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTY_BANDS = ('good', 'better', 'perfect')
+# Jobs starting within this many hours (or already running) are kept warm by the worker
+BANK_WARMUP_HORIZON_HOURS = float(os.getenv('BANK_WARMUP_HORIZON_HOURS', 48))
+# How often the worker checks upcoming jobs when nothing wakes it up
+BANK_WARMUP_INTERVAL = float(os.getenv('BANK_WARMUP_INTERVAL', 900))
+# schedule_start/schedule_end are stored as naive IST, as the assessment start check assumes
+SCHEDULE_TIMEZONE = timezone(offset=timedelta(hours=5, minutes=30))
+# First key of the Postgres advisory lock held while a job's bank is topped up; the second is the job_id
+BANK_LOCK_NAMESPACE = 0x4d4351
+
+_wakeup = threading.Event()
+_pending_jobs = set()
+_pending_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'runs': 0,
+    'jobs_topped_up': 0,
+    'questions_added': 0,
+    'last_run_at': None,
+    'last_run_seconds': 0.0,
+    'running_job_id': None
+}
+
+def bank_coverage(job_ids):
+    """Question counts per required (skill, band) of each job, from one grouped query.
+
+    Returns {job_id: coverage} where coverage lists every cell with its
+    count and how many questions it is short of QUESTIONS_PER_CELL.
+    """
+    job_ids = list(job_ids)
+    if not job_ids:
+        return {}
+    rows = db.session.query(
+        RequiredSkill.job_id, Skill.skill_id, Skill.name, MCQ.difficulty_band, func.count(MCQ.mcq_id)
+    ).join(
+        Skill, Skill.skill_id == RequiredSkill.skill_id
+    ).outerjoin(
+        MCQ, and_(MCQ.job_id == RequiredSkill.job_id, MCQ.skill_id == RequiredSkill.skill_id)
+    ).filter(
+        RequiredSkill.job_id.in_(job_ids)
+    ).group_by(
+        RequiredSkill.job_id, Skill.skill_id, Skill.name, MCQ.difficulty_band
+    ).all()
+
+    counts = {job_id: {} for job_id in job_ids}
+    for job_id, skill_id, skill_name, band, count in rows:
+        skill_counts = counts[job_id].setdefault((skill_id, skill_name), dict.fromkeys(DIFFICULTY_BANDS, 0))
+        if band in skill_counts:
+            skill_counts[band] = count
+
+    target = question_batches.QUESTIONS_PER_CELL
+    coverage = {}
+    for job_id, skills in counts.items():
+        cells = [{
+            'skill': skill_name,
+            'skill_id': skill_id,
+            'band': band,
+            'count': count,
+            'missing': max(0, target - count)
+        } for (skill_id, skill_name), band_counts in sorted(skills.items(), key=lambda item: item[0][1])
+            for band, count in band_counts.items()]
+        coverage[job_id] = {
+            'job_id': job_id,
+            'target_per_cell': target,
+            'cells': cells,
+            'total_questions': sum(cell['count'] for cell in cells),
+            'missing_questions': sum(cell['missing'] for cell in cells),
+            'deficient_cells': sum(1 for cell in cells if cell['missing']),
+            'ready': bool(cells) and not any(cell['missing'] for cell in cells)
+        }
+    return coverage
+
+def get_bank_coverage(job_id):
+    return bank_coverage([job_id])[job_id]
+
+def _try_lock(connection, job_id):
+    return connection.execute(select(func.pg_try_advisory_lock(BANK_LOCK_NAMESPACE, job_id))).scalar()
+
+def _unlock(connection, job_id):
+    connection.execute(select(func.pg_advisory_unlock(BANK_LOCK_NAMESPACE, job_id)))
+
+def top_up_bank(job, coverage=None):
+    """Generate questions for the deficient cells of a job's bank; returns the coverage afterwards.
+
+    A Postgres advisory lock per job keeps several workers from topping up
+    the same bank at once; a job that is already being topped up elsewhere
+    is skipped. Questions are committed as they are generated.
+    """
+    coverage = coverage or get_bank_coverage(job.job_id)
+    deficient = [cell for cell in coverage['cells'] if cell['missing']]
+    if not deficient:
+        return coverage
+
+    with db.engine.connect() as lock_connection:
+        if not _try_lock(lock_connection, job.job_id):
+            logger.info(f"Question bank of job_id={job.job_id} is already being topped up elsewhere")
+            return coverage
+        try:
+            with _stats_lock:
+                _stats['running_job_id'] = job.job_id
+            # Re-read under the lock: another worker may have finished a top-up meanwhile
+            coverage = get_bank_coverage(job.job_id)
+            deficient = [cell for cell in coverage['cells'] if cell['missing']]
+            if not deficient:
+                return coverage
+
+            existing = {}
+            for skill_id, band, mcq_id, question in db.session.query(
+                MCQ.skill_id, MCQ.difficulty_band, MCQ.mcq_id, MCQ.question
+            ).filter(
+                MCQ.job_id == job.job_id,
+                tuple_(MCQ.skill_id, MCQ.difficulty_band).in_([(cell['skill_id'], cell['band']) for cell in deficient])
+            ):
+                existing.setdefault((skill_id, band), []).append({'mcq_id': mcq_id, 'question': question})
+
+            cells = [question_batches.make_cell(
+                job.job_id, cell['skill'], cell['skill_id'], cell['band'],
+                get_duplicate_index(job.job_id, cell['skill_id']), existing.get((cell['skill_id'], cell['band']))
+            ) for cell in deficient]
+            logger.info(
+                f"Topping up {len(cells)} cells ({coverage['missing_questions']} questions) of job_id={job.job_id}"
+            )
+            question_batches.generate_cells(job.job_id, cells, job.custom_prompt or "")
+            db.session.commit()
+
+            after = get_bank_coverage(job.job_id)
+            added = after['total_questions'] - coverage['total_questions']
+            with _stats_lock:
+                _stats['jobs_topped_up'] += 1
+                _stats['questions_added'] += added
+            logger.info(f"Added {added} questions to job_id={job.job_id}; {after['missing_questions']} still missing")
+            return after
+        finally:
+            with _stats_lock:
+                _stats['running_job_id'] = None
+            _unlock(lock_connection, job.job_id)
+
+def upcoming_jobs(horizon_hours=BANK_WARMUP_HORIZON_HOURS):
+    """Active jobs that start within the horizon or are running now."""
+    now = datetime.now(timezone.utc).astimezone(SCHEDULE_TIMEZONE).replace(tzinfo=None)
+    return JobDescription.query.filter(
+        JobDescription.schedule_start <= now + timedelta(hours=horizon_hours),
+        JobDescription.schedule_end > now,
+        JobDescription.status == 'active'
+    ).order_by(JobDescription.schedule_start).all()
+
+def warm_up_banks(jobs):
+    """Top up every deficient bank among `jobs`, soonest start first; returns {job_id: coverage}."""
+    coverage = bank_coverage(job.job_id for job in jobs)
+    results = {}
+    for job in jobs:
+        job_coverage = coverage[job.job_id]
+        if job_coverage['deficient_cells']:
+            try:
+                job_coverage = top_up_bank(job, job_coverage)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to top up question bank of job_id={job.job_id}: {str(e)}", exc_info=True)
+        results[job.job_id] = job_coverage
+    return results
+
+def init_app(app):
+    """Start the bank warm-up worker with the first request this process serves, unless BANK_WARMUP_WORKER=0.
+
+    `flask` CLI commands (bank import, bank coverage, ...) never serve a
+    request, so they don't start a thread that sweeps jobs and calls the LLM.
+    """
+    if os.getenv('BANK_WARMUP_WORKER', '1') == '0':
+        return
+
+    @app.before_request
+    def ensure_warmup_worker():
+        if _worker is None or not _worker.is_alive():
+            start_warmup_worker(app)
+
+def start_warmup_worker(app=None):
+    global _worker
+    app = app or current_app._get_current_object()
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_warmup_worker, args=(app,), name='bank-warmup', daemon=True)
+            _worker.start()
+            logger.info("Question bank warm-up worker started")
+
+def enqueue_warm_up(job_id):
+    """Ask the worker to top up one job's bank soon, without waiting for it."""
+    with _pending_lock:
+        _pending_jobs.add(job_id)
+    _wakeup.set()
+
+def get_warmup_stats():
+    """Counters of this process' warm-up worker."""
+    with _stats_lock:
+        stats = dict(_stats)
+    with _pending_lock:
+        stats['pending_job_ids'] = sorted(_pending_jobs)
+    stats['worker_running'] = _worker is not None and _worker.is_alive()
+    return stats
+
+def _warmup_worker(app):
+    next_sweep = 0
+    while True:
+        _wakeup.wait(max(0, next_sweep - time.time()))
+        _wakeup.clear()
+        with _pending_lock:
+            job_ids = list(_pending_jobs)
+            _pending_jobs.clear()
+        sweep = time.time() >= next_sweep
+        with app.app_context():
+            started = time.perf_counter()
+            try:
+                if sweep:
+                    jobs = upcoming_jobs()
+                    next_sweep = time.time() + BANK_WARMUP_INTERVAL
+                else:
+                    jobs = []
+                known = {job.job_id for job in jobs}
+                jobs += [job for job in JobDescription.query.filter(JobDescription.job_id.in_(job_ids)).all()
+                         if job.job_id not in known] if job_ids else []
+                if jobs:
+                    warm_up_banks(jobs)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Question bank warm-up worker error: {str(e)}", exc_info=True)
+            finally:
+                db.session.remove()
+            with _stats_lock:
+                _stats['runs'] += 1
+                _stats['last_run_at'] = datetime.utcnow().isoformat()
+                _stats['last_run_seconds'] = round(time.perf_counter() - started, 3)
@@ -1,15 +1,21 @@
 import os
-import json
 import re
 import threading
 import functools
-import time
 from flask import current_app
-import google.generativeai as genai
 from google.api_core.exceptions import TooManyRequests
 from app import db
 from app.models.skill import Skill
 from app.models.mcq import MCQ
+from app.services.question_dedup import discard_duplicate_index, get_duplicate_index
+from app.services.mcq_writer import build_mcq_row, insert_mcqs
+from app.services.llm_client import get_llm
+from app.services.llm_limiter import LLMUnavailableError
+from app.services.mcq_schema import (
+    ValidationError, batched_mcq_adapter, generated_mcq_adapter, mcq_list_response_schema,
+    mcq_response_schema, validation_summary
+)
+from app.utils.json_stream import JSONArrayStreamParser
 
 # Cross-platform timeout implementation
 class TimeoutError(Exception):
@@ -45,18 +51,41 @@ def timeout_with_context(seconds):
         return wrapper
     return decorator
 
-# Configure Gemini AI API
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY environment variable not set")
-genai.configure(api_key=api_key)
-generation_config = {
-    "temperature": 0.2,
-    "max_output_tokens": 2048
+# Output token budget of batched requests, which return several skills and bands at once
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv('QUESTION_BATCH_MAX_OUTPUT_TOKENS', 8192))
+
+# Questions stored per skill and difficulty band when a job's bank is prepared
+QUESTIONS_PER_CELL = 20
+# batched: one request covers several (skill, band) cells; per_band: one request per cell
+QUESTION_GENERATION_MODE = os.getenv('QUESTION_GENERATION_MODE', 'batched')
+# Most questions asked for in one batched request
+BATCH_MAX_QUESTIONS = int(os.getenv('QUESTION_BATCH_MAX_QUESTIONS', 60))
+# Rounds of batched requests for short cells before falling back to single questions
+BATCH_MAX_ROUNDS = int(os.getenv('QUESTION_BATCH_MAX_ROUNDS', 3))
+# Questions validated and stored together while a response is still streaming
+STREAM_BATCH_SIZE = int(os.getenv('QUESTION_STREAM_BATCH_SIZE', 10))
+# Seconds bank preparation may wait for an LLM rate-limit token; candidate-facing calls never wait
+BANK_LLM_MAX_WAIT = float(os.getenv('QUESTION_BANK_LLM_MAX_WAIT', 30))
+
+DIFFICULTY_DESCRIPTORS = {
+    "good": "easy and theory-based, suitable for beginners. Can include data structures and algorithms questions.",
+    "better": "moderate difficulty, mixing theory and practical concepts, can be DSA-based or practical.",
+    "perfect": "challenging, practical, and suitable for advanced learners, mostly code snippet-based to test practical skills."
 }
-model_gemini = genai.GenerativeModel(
-    model_name="gemini-1.5-flash", generation_config=generation_config
-)
+
+# Skill names never change once created, so their ids are cached per process
+_skill_ids = {}
+
+def get_skill_id(skill_name):
+    """Skill id for a skill name, or None if there is no such skill."""
+    skill_id = _skill_ids.get(skill_name)
+    if skill_id:
+        return skill_id
+    skill = Skill.query.filter_by(name=skill_name).first()
+    if not skill:
+        return None
+    _skill_ids[skill_name] = skill.skill_id
+    return skill.skill_id
 
 def divide_experience_range(jd_range):
     start, end = map(float, jd_range.split("-"))
@@ -69,30 +98,17 @@ def divide_experience_range(jd_range):
 
 def expand_skills_with_gemini(skill):
     prompt = f"List 5 key subtopics under {skill} that are relevant for a technical interview. Only list the subskills."
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            chat_session = model_gemini.start_chat(history=[{"role": "user", "parts": [prompt]}])
-            response = chat_session.send_message(prompt)
-            if response and isinstance(response.text, str):
-                subtopics = [line.strip("- ").strip() for line in response.text.split("\n") if line.strip()][:5]
-                return subtopics
-        except TooManyRequests:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt * 10
-                print(f"⛔️ Gemini quota exceeded while expanding skill: {skill}. Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print(f"⛔️ Gemini quota exceeded after {max_retries} retries for skill: {skill}")
-                return []
+    try:
+        text = get_llm().generate(prompt, call_site='skill_expansion')
+    except (TooManyRequests, LLMUnavailableError) as e:
+        print(f"⛔️ Gemini unavailable while expanding skill {skill}: {e}")
+        return []
+    if isinstance(text, str):
+        return [line.strip("- ").strip() for line in text.split("\n") if line.strip()][:5]
     return []
 
 def generate_questions_prompt(skill, subskills, difficulty_band, job_description="", previous_questions=None):
-    difficulty_descriptor = {
-        "good": "easy and theory-based, suitable for beginners. Can include data structures and algorithms questions.",
-        "better": "moderate difficulty, mixing theory and practical concepts, can be DSA-based or practical.",
-        "perfect": "challenging, practical, and suitable for advanced learners, mostly code snippet-based to test practical skills."
-    }[difficulty_band]
+    difficulty_descriptor = DIFFICULTY_DESCRIPTORS[difficulty_band]
     description_context = f"The job description is: {job_description}" if job_description else "There is no specific job description provided."
     
     avoid_section = ""
@@ -140,6 +156,39 @@ def generate_questions_prompt(skill, subskills, difficulty_band, job_description
     """
     return prompt.strip()
 
+def generate_batched_questions_prompt(cells, job_description=""):
+    """Prompt for the missing questions of several (skill, band) cells in one request."""
+    description_context = f"The job description is: {job_description}" if job_description else "There is no specific job description provided."
+    
+    cell_lines = []
+    avoid_lines = []
+    total = 0
+    for cell in cells:
+        missing = QUESTIONS_PER_CELL - len(cell["saved"])
+        total += missing
+        cell_lines.append(f'- skill "{cell["skill"]}", difficulty_band "{cell["band"]}": exactly {missing} questions, {DIFFICULTY_DESCRIPTORS[cell["band"]]}')
+        for q in cell["saved"][:3]:
+            avoid_lines.append(f'- ({cell["skill"]}, {cell["band"]}) {q["question"]}')
+    avoid_section = ""
+    if avoid_lines:
+        avoid_section = "Avoid questions similar in content or concept to these existing ones:\n" + "\n".join(avoid_lines) + "\n"
+    
+    prompt = f"""
+    {description_context}
+    Generate {total} unique and diverse multiple-choice questions (MCQs) for the following skills and difficulty bands:
+    {chr(10).join(cell_lines)}
+    Guidelines:
+    1. Cover a broad range of the key subtopics of each skill that are relevant for a technical interview.
+    2. Include some code snippet questions where applicable, more of them for harder bands.
+    3. Each question must be unique in wording and concept, with no repetition or paraphrasing.
+    {avoid_section}
+    4. Each MCQ must have exactly four options and the correct answer must be one of 'A', 'B', 'C', 'D'.
+    5. Return a single flat JSON array. Each object has the string fields: 'skill', 'difficulty_band', 'question', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', with 'skill' and 'difficulty_band' copied exactly from the list above.
+    6. For code snippets in questions, use escaped quotes (\\\") and replace newlines with spaces to ensure valid JSON.
+    7. Return ONLY the JSON array, with no additional text and no code block markers (```).
+    """
+    return prompt.strip()
+
 def generate_single_question_prompt(skill, subskills, difficulty_band, job_description="", previous_questions=None):
     """Generate a concise prompt for a single MCQ based on skill, subskills, and difficulty."""
     difficulty_descriptor = {
@@ -177,170 +226,50 @@ def clean_entry(entry):
     if not isinstance(entry, str):
         return entry
     entry = entry.strip().replace('\n', ' ').replace('\\n', ' ')
-    entry = re.sub(r'([a-z])\1+', r'\1', entry)
+    # Collapse stutters like "aaaa" without touching real double letters ("three", "class")
+    entry = re.sub(r'([a-z])\1{2,}', r'\1', entry)
     return ' '.join(entry.split())
 
+def parsed_question(mcq):
+    """Question dict used by generation code for a validated MCQ."""
+    options = [clean_entry(mcq.option_a), clean_entry(mcq.option_b), clean_entry(mcq.option_c), clean_entry(mcq.option_d)]
+    return {
+        "question": clean_entry(mcq.question),
+        "option_a": options[0],
+        "option_b": options[1],
+        "option_c": options[2],
+        "option_d": options[3],
+        "correct_answer": mcq.correct_answer,
+        "options": options
+    }
+
 def parse_question_block(question_data):
-    """Parse a single question JSON object into a structured format."""
+    """Validate a single question JSON object into a structured format."""
     try:
-        # Validate required fields
-        required_fields = ['question', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer']
-        if not all(field in question_data for field in required_fields):
-            print(f"Invalid question format: Missing required fields in {json.dumps(question_data)}")
-            return None
-        
-        # Validate correct_answer
-        if question_data['correct_answer'] not in ['A', 'B', 'C', 'D']:
-            print(f"Invalid correct_answer: {question_data['correct_answer']} in {json.dumps(question_data)}")
-            return None
-        
-        # Validate that all fields are strings
-        for field in required_fields:
-            if not isinstance(question_data[field], str):
-                print(f"Invalid field type: {field} is {type(question_data[field])} in {json.dumps(question_data)}")
-                return None
-        
-        # Clean entries
-        parsed = {
-            "question": clean_entry(question_data['question']),
-            "option_a": clean_entry(question_data['option_a']),
-            "option_b": clean_entry(question_data['option_b']),
-            "option_c": clean_entry(question_data['option_c']),
-            "option_d": clean_entry(question_data['option_d']),
-            "correct_answer": question_data['correct_answer'],
-            "options": [
-                clean_entry(question_data['option_a']),
-                clean_entry(question_data['option_b']),
-                clean_entry(question_data['option_c']),
-                clean_entry(question_data['option_d'])
-            ]
-        }
-        return parsed
-    except Exception as e:
-        print(f"Error parsing question block: {e} - Data: {json.dumps(question_data)}")
+        return parsed_question(generated_mcq_adapter.validate_python(question_data))
+    except ValidationError as e:
+        print(f"Invalid question: {validation_summary(e)}")
         return None
 
-def parse_response(raw_text):
-    """Parse the raw JSON response from Gemini into a list of questions."""
-    print(f"📜 Raw Gemini response: {raw_text[:500]}... (truncated)")
-    
-    try:
-        # Clean response: remove any code block markers or extra whitespace
-        raw_text = raw_text.strip()
-        raw_text = re.sub(r'^```(json|python)?\s*\n', '', raw_text, flags=re.MULTILINE)
-        raw_text = re.sub(r'\n```$', '', raw_text, flags=re.MULTILINE)
-        
-        # Parse JSON
-        questions = json.loads(raw_text)
-        
-        # Handle single question (object) or multiple questions (array)
-        if isinstance(questions, dict):
-            questions = [questions]
-        elif not isinstance(questions, list):
-            print(f"Invalid response format: Expected JSON array or object, got {type(questions)}")
-            return []
-        
-        # Validate and clean questions
-        parsed_questions = []
-        for q in questions:
-            parsed = parse_question_block(q)
-            if parsed:
-                parsed_questions.append(parsed)
-            else:
-                print(f"Skipping invalid question: {json.dumps(q)}")
-        
-        return parsed_questions
-    except json.JSONDecodeError as e:
-        print(f"⚠️ Failed to parse JSON response: {e} - Raw text: {raw_text[:100]}...")
-        # Attempt to fix common JSON issues (e.g., missing brackets)
-        try:
-            if raw_text.startswith("{") and not raw_text.startswith("["):
-                raw_text = f"[{raw_text}]"
-                questions = json.loads(raw_text)
-                parsed_questions = []
-                for q in questions:
-                    parsed = parse_question_block(q)
-                    if parsed:
-                        parsed_questions.append(parsed)
-                    else:
-                        print(f"Skipping invalid question: {json.dumps(q)}")
-                return parsed_questions
-        except json.JSONDecodeError as e2:
-            print(f"⚠️ Failed to parse after attempting fix: {e2} - Raw text: {raw_text[:100]}...")
-        return []
-    except Exception as e:
-        print(f"⚠️ Error parsing response: {e} - Raw text: {raw_text[:100]}...")
-        return []
-
 def parse_single_question_response(raw_text):
-    """Parse a single question from raw JSON response."""
-    print(f"📜 Raw response: {raw_text[:500]}... (truncated)")
+    """Parse a single question from a schema-constrained JSON response."""
     try:
         raw_text = raw_text.strip()
         raw_text = re.sub(r'^```(json|python)?\s*\n', '', raw_text, flags=re.MULTILINE)
         raw_text = re.sub(r'\n```$', '', raw_text, flags=re.MULTILINE)
-        
-        question_data = json.loads(raw_text)
-        if not isinstance(question_data, dict):
-            print(f"Invalid response format: Expected JSON object, got {type(question_data)}")
-            return None
-        
-        # Validate required fields
-        required_fields = ['question', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer']
-        if not all(field in question_data for field in required_fields):
-            missing = [f for f in required_fields if f not in question_data]
-            print(f"Invalid question format: Missing fields {missing} in {json.dumps(question_data)}")
-            return None
-        
-        # Validate correct_answer
-        correct_answer = question_data['correct_answer']
-        if not isinstance(correct_answer, str) or correct_answer not in ['A', 'B', 'C', 'D']:
-            print(f"Invalid correct_answer: '{correct_answer}' (type: {type(correct_answer)}) in {json.dumps(question_data)}")
-            # Attempt to fix lowercase answers
-            if isinstance(correct_answer, str) and correct_answer.upper() in ['A', 'B', 'C', 'D']:
-                print(f"Converting lowercase correct_answer '{correct_answer}' to '{correct_answer.upper()}'")
-                question_data['correct_answer'] = correct_answer.upper()
-            else:
-                return None
-        
-        # Validate that all fields are strings and non-empty
-        for field in required_fields:
-            if not isinstance(question_data[field], str) or not question_data[field].strip():
-                print(f"Invalid field: {field} is {type(question_data[field])} or empty in {json.dumps(question_data)}")
-                return None
-        
-        # Clean entries
-        parsed = {
-            "question": clean_entry(question_data['question']),
-            "option_a": clean_entry(question_data['option_a']),
-            "option_b": clean_entry(question_data['option_b']),
-            "option_c": clean_entry(question_data['option_c']),
-            "option_d": clean_entry(question_data['option_d']),
-            "correct_answer": question_data['correct_answer'],
-            "options": [
-                clean_entry(question_data['option_a']),
-                clean_entry(question_data['option_b']),
-                clean_entry(question_data['option_c']),
-                clean_entry(question_data['option_d'])
-            ]
-        }
-        return parsed
-    except json.JSONDecodeError as e:
-        print(f"⚠️ Failed to parse JSON response: {e} - Raw text: {raw_text[:100]}...")
-        return None
-    except Exception as e:
-        print(f"⚠️ Error parsing response: {e} - Raw text: {raw_text[:100]}...")
+        return parsed_question(generated_mcq_adapter.validate_json(raw_text))
+    except ValidationError as e:
+        print(f"⚠️ Invalid question response: {validation_summary(e)} - Raw text: {raw_text[:100]}...")
         return None
 
 @timeout_with_context(10)
 def generate_single_question_with_timeout(skill_name, difficulty_band, job_id, job_description="", used_questions=None):
     """Generate a single question with timeout."""
-    skill = Skill.query.filter_by(name=skill_name).first()
-    if not skill:
+    skill_id = get_skill_id(skill_name)
+    if not skill_id:
         print(f"⚠️ Skill {skill_name} not found in database.")
         return None
     
-    skill_id = skill.skill_id
     subskills = expand_skills_with_gemini(skill_name)
     
     previous_questions = [
@@ -352,33 +281,36 @@ def generate_single_question_with_timeout(skill_name, difficulty_band, job_id, j
     for attempt in range(max_retries):
         try:
             prompt = generate_single_question_prompt(skill_name, subskills, difficulty_band, job_description, previous_questions)
-            chat = model_gemini.start_chat(history=[{"role": "user", "parts": [prompt]}])
-            response = chat.send_message(prompt)
+            text = get_llm().generate(prompt, response_schema=mcq_response_schema(), call_site='question_single')
             
-            if response and isinstance(response.text, str):
-                parsed = parse_single_question_response(response.text)
-                print(parsed)
+            if isinstance(text, str):
+                parsed = parse_single_question_response(text)
                 if not parsed:
                     print(f"⚠️ No valid question generated for {skill_name} ({difficulty_band})")
                     continue
                 
-                mcq = MCQ(
-                    job_id=job_id,
-                    skill_id=skill_id,
-                    question=parsed["question"],
-                    option_a=parsed["option_a"],
-                    option_b=parsed["option_b"],
-                    option_c=parsed["option_c"],
-                    option_d=parsed["option_d"],
-                    correct_answer=parsed["correct_answer"],
-                    difficulty_band=difficulty_band
-                )
-                db.session.add(mcq)
-                db.session.commit()
+                row = build_mcq_row(job_id, skill_id, difficulty_band, parsed)
+                if not row:
+                    continue
+                
+                dedup_index = get_duplicate_index(job_id, skill_id)
+                position = dedup_index.check_and_add(parsed["question"])
+                if position is None:
+                    print(f"🔁 Rejected near-duplicate question for {skill_name} ({difficulty_band}); rejection rate {dedup_index.rejection_rate:.0%}")
+                    continue
+                
+                try:
+                    mcq_id, = insert_mcqs([row])
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    dedup_index.discard(position)
+                    raise
+                dedup_index.set_mcq_id(position, mcq_id)
                 
                 print(f"✅ Saved question for {skill_name} ({difficulty_band})")
                 return {
-                    "mcq_id": mcq.mcq_id,
+                    "mcq_id": mcq_id,
                     "question": parsed["question"],
                     "option_a": parsed["option_a"],
                     "option_b": parsed["option_b"],
@@ -389,43 +321,38 @@ def generate_single_question_with_timeout(skill_name, difficulty_band, job_id, j
                     "difficulty_band": difficulty_band,
                     "options": parsed["options"]
                 }
-        except TooManyRequests:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt * 10
-                print(f"⛔️ Gemini quota exceeded. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                print(f"⛔️ Gemini quota exceeded after {max_retries} retries.")
-                return None
+        except (TooManyRequests, LLMUnavailableError):
+            # Quota problems are not retried here; the caller falls back to pre-stored questions
+            raise
         except Exception as e:
+            # Transient provider errors were already retried by the LLM client
             print(f"⚠️ Error generating question: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt * 1.5)
-                continue
-            return None
     return None
 
-def get_prestored_question(skill_name, difficulty_band, job_id, used_questions=None):
-    """Retrieve a pre-stored question."""
+def get_prestored_question(skill_name, difficulty_band, job_id, after_mcq_id=0):
+    """Retrieve the pre-stored question of a cell that follows `after_mcq_id`.
+
+    `after_mcq_id` is the caller's keyset cursor, the highest mcq_id it has
+    already taken from the cell. The row is read in one query that seeks the
+    (job_id, skill_id, difficulty_band, mcq_id) index past the cursor, so the
+    cost doesn't depend on the bank size or on how many questions were used.
+    """
     try:
-        skill = Skill.query.filter_by(name=skill_name).first()
-        if not skill:
+        skill_id = get_skill_id(skill_name)
+        if not skill_id:
             print(f"⚠️ Skill {skill_name} not found in database.")
             return None
         
-        used_mcq_ids = [q['mcq_id'] for q in (used_questions or []) if 'mcq_id' in q]
-        query = MCQ.query.filter_by(
-            job_id=job_id,
-            skill_id=skill.skill_id,
-            difficulty_band=difficulty_band
-        ).filter(~MCQ.mcq_id.in_(used_mcq_ids))
-        
-        available_mcqs = query.all()
-        if not available_mcqs:
+        mcq = MCQ.query.filter(
+            MCQ.job_id == job_id,
+            MCQ.skill_id == skill_id,
+            MCQ.difficulty_band == difficulty_band,
+            MCQ.mcq_id > after_mcq_id
+        ).order_by(MCQ.mcq_id).limit(1).first()
+        if not mcq:
             print(f"⚠️ No unused pre-stored questions found for {skill_name} ({difficulty_band})")
             return None
         
-        mcq = available_mcqs[0]  # Select first available question
         print(f"📦 Using pre-stored question for {skill_name} ({difficulty_band}) - ID: {mcq.mcq_id}")
         return {
             "mcq_id": mcq.mcq_id,
@@ -443,11 +370,22 @@ def get_prestored_question(skill_name, difficulty_band, job_id, used_questions=N
         print(f"⚠️ Error fetching pre-stored question: {e}")
         return None
 
-def generate_single_question(skill_name, difficulty_band, job_id, job_description="", used_questions=None):
-    """Main function that tries real-time generation with fallback to pre-stored questions."""
+def generate_single_question(skill_name, difficulty_band, job_id, job_description="", used_questions=None, prestored_after=0):
+    """Main function that tries real-time generation with fallback to pre-stored questions.
+
+    `prestored_after` is the caller's cursor into the cell's stored questions
+    (see get_prestored_question); None skips the fallback, for callers such
+    as the assessment that fall back to their own question plan.
+    """
     if used_questions is None:
         used_questions = []
     
+    if not get_llm().available():
+        if prestored_after is None:
+            return None
+        print(f"⛔️ Gemini circuit breaker is open. Using pre-stored questions for {skill_name} ({difficulty_band}).")
+        return get_prestored_question(skill_name, difficulty_band, job_id, prestored_after)
+    
     max_attempts = 3
     for attempt in range(max_attempts):
         try:
@@ -457,15 +395,208 @@ def generate_single_question(skill_name, difficulty_band, job_id, job_descriptio
         except TimeoutError:
             print(f"⏰ Real-time generation timed out for {skill_name} ({difficulty_band}). Falling back to pre-stored questions.")
             break
-        except TooManyRequests:
-            print(f"⛔️ Gemini quota exceeded after retries for {skill_name} ({difficulty_band}). Falling back to pre-stored questions.")
+        except (TooManyRequests, LLMUnavailableError) as e:
+            print(f"⛔️ Gemini unavailable for {skill_name} ({difficulty_band}): {e}. Falling back to pre-stored questions.")
             break
         except Exception as e:
             print(f"⚠️ Error in real-time generation for {skill_name} ({difficulty_band}): {e}")
             print("🔄 Falling back to pre-stored questions.")
             break
     
-    return get_prestored_question(skill_name, difficulty_band, job_id, used_questions)
+    if prestored_after is None:
+        return None
+    return get_prestored_question(skill_name, difficulty_band, job_id, prestored_after)
+
+def pack_cells(cells, max_questions):
+    """Group cells that still need questions into requests of at most `max_questions` questions."""
+    requests, current, size = [], [], 0
+    for cell in cells:
+        missing = QUESTIONS_PER_CELL - len(cell["saved"])
+        if missing <= 0:
+            continue
+        if current and size + missing > max_questions:
+            requests.append(current)
+            current, size = [], 0
+        current.append(cell)
+        size += missing
+    if current:
+        requests.append(current)
+    return requests
+
+def route_batched_question(question, cells_by_key):
+    """(cell, parsed) for one object of a batched response, or None if it is invalid or was not asked for."""
+    try:
+        mcq = batched_mcq_adapter.validate_python(question)
+    except ValidationError as e:
+        print(f"Skipping invalid question: {validation_summary(e)}")
+        return None
+    cell = cells_by_key.get((mcq.skill.lower(), mcq.difficulty_band.lower()))
+    if not cell:
+        print(f"⚠️ Dropping question for unrequested cell ({mcq.skill}, {mcq.difficulty_band}): {mcq.question}")
+        return None
+    return cell, parsed_question(mcq)
+
+def stream_question_objects(prompt, response_schema, max_output_tokens=None, call_site='question_stream', max_wait=None):
+    """Yield the question objects of a streamed response as soon as each one is complete."""
+    parser = JSONArrayStreamParser()
+    for text in get_llm().stream(
+        prompt, response_schema=response_schema, max_output_tokens=max_output_tokens, call_site=call_site,
+        max_wait=max_wait
+    ):
+        yield from parser.feed(text)
+    parser.close()
+    if parser.errors:
+        print(f"⚠️ Skipped {parser.errors} malformed questions in streamed response")
+
+def stream_generated_questions(job_id, prompt, response_schema, route, max_output_tokens=None, call_site='question_stream',
+                               max_wait=None):
+    """Store the questions of a streamed response in micro-batches as they arrive.
+
+    `route` turns a question object into a (cell, parsed) pair, or None to
+    drop it. Each micro-batch is committed, so questions already stored
+    survive a failure later in the stream. Returns (received, saved).
+    """
+    received = 0
+    saved = 0
+    pending = []
+    
+    def flush():
+        nonlocal saved
+        if pending:
+            saved += store_generated_questions(job_id, pending)
+            db.session.commit()
+            pending.clear()
+    
+    try:
+        for question in stream_question_objects(prompt, response_schema, max_output_tokens, call_site, max_wait):
+            received += 1
+            routed = route(question)
+            if routed:
+                pending.append(routed)
+            if len(pending) >= STREAM_BATCH_SIZE:
+                flush()
+    finally:
+        flush()
+    return received, saved
+
+def store_generated_questions(job_id, routed):
+    """Validate, de-duplicate and insert (cell, parsed) pairs with a single INSERT.
+
+    Questions go to each cell's `saved` list, up to QUESTIONS_PER_CELL.
+    Returns how many were stored.
+    """
+    accepted = []
+    pending = {}
+    for cell, parsed in routed:
+        key = (cell["skill"], cell["band"])
+        if len(cell["saved"]) + pending.get(key, 0) >= QUESTIONS_PER_CELL:
+            continue
+        row = build_mcq_row(job_id, cell["skill_id"], cell["band"], parsed)
+        if not row:
+            continue
+        position = cell["dedup_index"].check_and_add(parsed["question"])
+        if position is None:
+            print(f"🔁 Skipping near-duplicate: {parsed['question']}")
+            continue
+        pending[key] = pending.get(key, 0) + 1
+        accepted.append((cell, position, parsed, row))
+    
+    # One multi-row INSERT per response; a failure only drops this batch
+    mcq_ids = []
+    if accepted:
+        try:
+            with db.session.begin_nested():
+                mcq_ids = insert_mcqs([row for _, _, _, row in accepted])
+        except Exception as e:
+            print(f"⚠️ Error saving {len(accepted)} MCQs: {e}")
+            for cell, position, _, _ in accepted:
+                cell["dedup_index"].discard(position)
+    
+    for (cell, position, parsed, _), mcq_id in zip(accepted, mcq_ids):
+        cell["dedup_index"].set_mcq_id(position, mcq_id)
+        cell["saved"].append({
+            "mcq_id": mcq_id,
+            "question": parsed["question"],
+            "options": parsed["options"],
+            "correct_answer": parsed["correct_answer"],
+            "skill": cell["skill"],
+            "difficulty_band": cell["band"]
+        })
+        print(f"Added MCQ: {parsed['question']} (Band: {cell['band']}, Correct Answer: {parsed['correct_answer']})")
+    return len(mcq_ids)
+
+def generate_cells_batched(job_id, cells, job_description=""):
+    """Fill cells with batched requests, reissuing only the cells that came back short."""
+    for round_number in range(1, BATCH_MAX_ROUNDS + 1):
+        requests = pack_cells(cells, BATCH_MAX_QUESTIONS)
+        if not requests:
+            break
+        for request_cells in requests:
+            labels = ", ".join(f"{cell['skill']}/{cell['band']}" for cell in request_cells)
+            cells_by_key = {(cell["skill"].lower(), cell["band"]): cell for cell in request_cells}
+            try:
+                prompt = generate_batched_questions_prompt(request_cells, job_description)
+                schema = mcq_list_response_schema(
+                    sorted({cell["skill"] for cell in request_cells}), sorted({cell["band"] for cell in request_cells})
+                )
+                received, saved = stream_generated_questions(
+                    job_id, prompt, schema, lambda question: route_batched_question(question, cells_by_key),
+                    max_output_tokens=BATCH_MAX_OUTPUT_TOKENS, call_site='question_batch', max_wait=BANK_LLM_MAX_WAIT
+                )
+                print(f"✅ Round {round_number} [{labels}]: {received} questions generated, {saved} saved")
+            except (TooManyRequests, LLMUnavailableError) as e:
+                print(f"⛔️ Gemini unavailable for [{labels}]: {e}. Leaving the remaining cells to single-question generation.")
+                return
+            except Exception as e:
+                print(f"⚠️ Error generating batch for [{labels}]: {e}")
+
+def generate_cell_per_band(cell, subskills, job_description=""):
+    """Fill one cell with one request per attempt, as before batched generation."""
+    attempts = 0
+    max_attempts = 5
+    while len(cell["saved"]) < QUESTIONS_PER_CELL and attempts < max_attempts:
+        try:
+            prompt = generate_questions_prompt(cell["skill"], subskills, cell["band"], job_description, cell["saved"])
+            
+            def route(question):
+                parsed = parse_question_block(question)
+                return (cell, parsed) if parsed else None
+            
+            received, saved = stream_generated_questions(
+                cell["job_id"], prompt, mcq_list_response_schema(), route, call_site='question_per_band',
+                max_wait=BANK_LLM_MAX_WAIT
+            )
+            print(f"✅ [{cell['band'].upper()}] {cell['skill']}: {received} questions generated, {saved} saved")
+        
+        except (TooManyRequests, LLMUnavailableError) as e:
+            print(f"⛔️ Gemini unavailable for {cell['skill']} ({cell['band']}): {e}")
+            return
+        except Exception as e:
+            print(f"⚠️ Error generating batch for {cell['skill']} in {cell['band']} band: {e}")
+        
+        attempts += 1
+
+def make_cell(job_id, skill_name, skill_id, band, dedup_index, saved=None):
+    """A (skill, band) cell to fill; `saved` holds questions it already has."""
+    return {
+        "job_id": job_id,
+        "skill": skill_name,
+        "skill_id": skill_id,
+        "band": band,
+        "saved": list(saved or []),
+        "dedup_index": dedup_index
+    }
+
+def generate_cells(job_id, cells, job_description=""):
+    """Fill cells up to QUESTIONS_PER_CELL with the configured generation mode."""
+    if QUESTION_GENERATION_MODE == "batched":
+        generate_cells_batched(job_id, cells, job_description)
+        return
+    subskills = {}
+    for cell in cells:
+        if cell["skill"] not in subskills:
+            subskills[cell["skill"]] = expand_skills_with_gemini(cell["skill"])
+        generate_cell_per_band(cell, subskills[cell["skill"]], job_description)
 
 def prepare_question_batches(skills_with_priorities, jd_experience_range, job_id, job_description=""):
     """Generate and store 20 unique questions per skill per difficulty band."""
@@ -473,97 +604,57 @@ def prepare_question_batches(skills_with_priorities, jd_experience_range, job_id
     question_bank = {"good": {}, "better": {}, "perfect": {}}
     total_questions_saved = 0
     
+    cells = []
+    dedup_indexes = {}
     for skill_data in skills_with_priorities:
         skill_name = skill_data["name"]
         print(f"\n📌 Processing Skill: {skill_name} (Priority: {skill_data['priority']})")
-        skill = Skill.query.filter_by(name=skill_name).first()
-        if not skill:
+        skill_id = get_skill_id(skill_name)
+        if not skill_id:
             print(f"⚠️ Skill {skill_name} not found in database. Skipping...")
             continue
-        skill_id = skill.skill_id
-        subskills = expand_skills_with_gemini(skill_name)
-        
-        for band in ["good", "better", "perfect"]:
-            key = f"{skill_name}"
-            if key not in question_bank[band]:
-                question_bank[band][key] = []
-            
-            saved_questions = []
-            attempts = 0
-            max_attempts = 5
-            while len(saved_questions) < 20 and attempts < max_attempts:
+        dedup_index = get_duplicate_index(job_id, skill_id)
+        dedup_indexes[skill_name] = (dedup_index, dedup_index.checked, dedup_index.rejected)
+        cells.extend(make_cell(job_id, skill_name, skill_id, band, dedup_index) for band in ["good", "better", "perfect"])
+    
+    generate_cells(job_id, cells, job_description)
+    
+    for cell in cells:
+        skill_name, band, saved_questions = cell["skill"], cell["band"], cell["saved"]
+        if len(saved_questions) < QUESTIONS_PER_CELL:
+            print(f"⚠️ Only {len(saved_questions)} unique questions generated for {skill_name} ({band})")
+            # Attempt to fill remaining questions using single question generation
+            while len(saved_questions) < QUESTIONS_PER_CELL:
                 try:
-                    prompt = generate_questions_prompt(skill_name, subskills, band, job_description, saved_questions)
-                    chat = model_gemini.start_chat(history=[{"role": "user", "parts": [prompt]}])
-                    response = chat.send_message(prompt)
-                    
-                    if response and isinstance(response.text, str):
-                        questions = parse_response(response.text)
-                        print(f"✅ [{band.upper()}] {skill_name}: {len(questions)} questions generated")
-                        
-                        for parsed in questions[:20 - len(saved_questions)]:  # Limit to remaining needed questions
-                            try:
-                                mcq = MCQ(
-                                    job_id=job_id,
-                                    skill_id=skill_id,
-                                    question=parsed["question"],
-                                    option_a=parsed["option_a"],
-                                    option_b=parsed["option_b"],
-                                    option_c=parsed["option_c"],
-                                    option_d=parsed["option_d"],
-                                    correct_answer=parsed["correct_answer"],
-                                    difficulty_band=band
-                                )
-                                db.session.add(mcq)
-                                db.session.flush()
-                                saved_questions.append({
-                                    "mcq_id": mcq.mcq_id,
-                                    "question": parsed["question"],
-                                    "options": parsed["options"],
-                                    "correct_answer": parsed["correct_answer"],
-                                    "skill": skill_name,
-                                    "difficulty_band": band
-                                })
-                                total_questions_saved += 1
-                                print(f"Added MCQ: {parsed['question']} (Band: {band}, Correct Answer: {parsed['correct_answer']})")
-                            except Exception as e:
-                                print(f"⚠️ Error adding MCQ to session for {skill_name} in {band} band: {e}")
-                                print(f"MCQ data: {parsed}")
-                
-                except TooManyRequests:
-                    print(f"⛔️ Gemini quota exceeded for {skill_name} ({band}). Retrying in 10 seconds...")
-                    time.sleep(10)
-                except Exception as e:
-                    print(f"⚠️ Error generating batch for {skill_name} in {band} band: {e}")
-                
-                attempts += 1
-                time.sleep(1.5)
-            
-            if len(saved_questions) < 20:
-                print(f"⚠️ Only {len(saved_questions)} unique questions generated for {skill_name} ({band}) after {max_attempts} attempts")
-                # Attempt to fill remaining questions using single question generation
-                while len(saved_questions) < 20:
-                    try:
-                        question = generate_single_question(skill_name, band, job_id, job_description, saved_questions)
-                        if question:
-                            saved_questions.append(question)
-                            total_questions_saved += 1
-                            print(f"Added single MCQ: {question['question']} (Band: {band}, Correct Answer: {question['correct_answer']})")
-                        else:
-                            print(f"⚠️ Failed to generate single question for {skill_name} ({band})")
-                            break
-                    except Exception as e:
-                        print(f"⚠️ Error generating single question for {skill_name} ({band}): {e}")
+                    # Every stored question of the cell so far is in saved_questions, so only newer ones are fallbacks
+                    prestored_after = max((q['mcq_id'] for q in saved_questions if q.get('mcq_id')), default=0)
+                    question = generate_single_question(skill_name, band, job_id, job_description, saved_questions, prestored_after)
+                    if question:
+                        saved_questions.append(question)
+                        print(f"Added single MCQ: {question['question']} (Band: {band}, Correct Answer: {question['correct_answer']})")
+                    else:
+                        print(f"⚠️ Failed to generate single question for {skill_name} ({band})")
                         break
-            
-            question_bank[band][key] = saved_questions
+                except Exception as e:
+                    print(f"⚠️ Error generating single question for {skill_name} ({band}): {e}")
+                    break
+        
+        question_bank[band][skill_name] = saved_questions
+        total_questions_saved += len(saved_questions)
+    
+    for skill_name, (dedup_index, checked_before, rejected_before) in dedup_indexes.items():
+        checked = dedup_index.checked - checked_before
+        rejected = dedup_index.rejected - rejected_before
+        print(f"🔁 {skill_name}: rejected {rejected} of {checked} generated questions as near-duplicates ({rejected / checked if checked else 0:.0%})")
     
     try:
         db.session.commit()
         print(f"✅ {total_questions_saved} questions saved to the database.")
     except Exception as e:
         db.session.rollback()
+        for skill_data in skills_with_priorities:
+            discard_duplicate_index(job_id, get_skill_id(skill_data["name"]))
         print(f"⚠️ Error saving questions to database: {e}")
     
     print("\n✅ Question generation completed!")
-    return question_bank
\ No newline at end of file
+    return question_bank
@@ -0,0 +1,179 @@
+import os
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from app import db
+from app.models.mcq import MCQ
+
+logger = logging.getLogger(__name__)
+
+# Jaccard similarity of two questions' content words at or above which the newer one is a near-duplicate.
+# Calibrated on paraphrase pairs: reordered or padded phrasings score 0.75-1.0, while questions that
+# differ in their key term (type([]) / type({}), PostgreSQL / MySQL, 404 / 500) score 0.5-0.67.
+DEDUP_THRESHOLD = float(os.getenv('MCQ_DEDUP_THRESHOLD', 0.7))
+# Sentence punctuation stripped from the ends of words; code such as type([]) keeps its brackets
+WORD_EDGE_CHARS = '.,;:!?"\''
+# Function words that only carry phrasing, left out of the compared word sets
+STOP_WORDS = frozenset((
+    'a an and are as at be by can do does for from how in is it its of on or the this that to '
+    'used was what when where which who why will with would following'
+).split())
+
+# 32 LSH bands of 4 rows: pairs become candidates from about (1/32) ** (1/4) = 0.42 similarity
+LSH_BANDS = 32
+LSH_ROWS = 4
+NUM_PERM = LSH_BANDS * LSH_ROWS
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240611)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+def normalize_text(text):
+    return ' '.join((text or '').lower().split())
+
+def shingles(text):
+    """Content words of normalized text, with a plural "s" dropped from plain words.
+
+    Word order and function words are ignored, so "In Python, what does
+    type([]) return?" and "What does type([]) return in Python?" are the
+    same set.
+    """
+    words = set()
+    for word in normalize_text(text).split():
+        word = word.strip(WORD_EDGE_CHARS)
+        if not word or word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and word.isalpha():
+            word = word[:-1]
+        words.add(word)
+    return words or {normalize_text(text)}
+
+def shingle_hashes(text):
+    """Stable 31-bit hashes of the content words of text."""
+    words = shingles(text)
+    return np.fromiter((zlib.crc32(w.encode()) % _PRIME for w in words), dtype=np.uint64, count=len(words))
+
+def minhash(hashes):
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME).min(axis=0).astype(np.uint32)
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+class DuplicateIndex:
+    """MinHash/LSH index of the questions of one job and skill.
+
+    LSH buckets find candidate questions; each candidate is then compared by
+    the exact Jaccard similarity of its word set, so MinHash estimation noise
+    never decides a rejection.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.keys = []
+        self.signatures = []
+        self.word_sets = []
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+        self.known_ids = set()
+        self.checked = 0
+        self.rejected = 0
+        self.last_mcq_id = 0
+        self.lock = threading.RLock()
+
+    def _band_keys(self, signature):
+        return [signature[b * LSH_ROWS:(b + 1) * LSH_ROWS].tobytes() for b in range(LSH_BANDS)]
+
+    def _add_signature(self, key, hashes):
+        signature = minhash(hashes)
+        position = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+        self.word_sets.append(frozenset(hashes.tolist()))
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(position)
+
+    def add(self, mcq_id, text):
+        if mcq_id not in self.known_ids:
+            self.known_ids.add(mcq_id)
+            self._add_signature(mcq_id, shingle_hashes(text))
+
+    def _most_similar(self, hashes):
+        """Position of the most similar indexed question at or above the threshold, or None."""
+        signature = minhash(hashes)
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        if not candidates:
+            return None
+        words = frozenset(hashes.tolist())
+        similarity, best = max((jaccard(words, self.word_sets[c]), c) for c in candidates)
+        return best if similarity >= self.threshold else None
+
+    def check_and_add(self, text):
+        """Record a new question unless it is a near-duplicate of an indexed one.
+
+        Returns its position in the index, to pass to set_mcq_id once the
+        question is stored, or None when it was rejected. Every call counts
+        towards the rejection rate.
+        """
+        hashes = shingle_hashes(text)
+        with self.lock:
+            self.checked += 1
+            if self._most_similar(hashes) is not None:
+                self.rejected += 1
+                return None
+            position = len(self.keys)
+            self._add_signature(None, hashes)
+            return position
+
+    def set_mcq_id(self, position, mcq_id):
+        with self.lock:
+            self.keys[position] = mcq_id
+            self.known_ids.add(mcq_id)
+
+    def discard(self, position):
+        """Take back a question added by check_and_add that could not be stored."""
+        with self.lock:
+            for bucket, band_key in zip(self.buckets, self._band_keys(self.signatures[position])):
+                bucket[band_key].remove(position)
+
+    @property
+    def rejection_rate(self):
+        return self.rejected / self.checked if self.checked else 0.0
+
+    def stats(self):
+        return {
+            'indexed': len(self.keys),
+            'checked': self.checked,
+            'rejected': self.rejected,
+            'rejection_rate': round(self.rejection_rate, 4)
+        }
+
+_indexes = OrderedDict()  # (job_id, skill_id) -> DuplicateIndex
+_indexes_lock = threading.Lock()
+
+def get_duplicate_index(job_id, skill_id):
+    """Index of a job and skill's stored questions, caught up with rows added since it was built."""
+    with _indexes_lock:
+        index = _indexes.pop((job_id, skill_id), None) or DuplicateIndex()
+        _indexes[(job_id, skill_id)] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    with index.lock:
+        rows = db.session.query(MCQ.mcq_id, MCQ.question).filter(
+            MCQ.job_id == job_id,
+            MCQ.skill_id == skill_id,
+            MCQ.mcq_id > index.last_mcq_id
+        ).order_by(MCQ.mcq_id).all()
+        for mcq_id, question in rows:
+            index.add(mcq_id, question)
+            index.last_mcq_id = mcq_id
+        if rows:
+            logger.debug(f"Indexed {len(rows)} questions for job_id={job_id}, skill_id={skill_id}")
+    return index
+
+def discard_duplicate_index(job_id, skill_id):
+    """Drop a cached index, e.g. after questions it saw were rolled back."""
+    with _indexes_lock:
+        _indexes.pop((job_id, skill_id), None)
@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import time
+import logging
+from pydantic import ValidationError
+from app import db
+from app.models.required_skill import RequiredSkill
+from app.models.skill import Skill
+from app.services.mcq_schema import ANSWER_LETTERS, DIFFICULTY_BANDS, generated_mcq_adapter, validation_summary
+from app.services.mcq_writer import build_mcq_row, copy_mcqs
+from app.services.question_batches import parsed_question
+from app.services.question_dedup import discard_duplicate_index, get_duplicate_index
+from app.utils.json_stream import JSONArrayStreamParser
+
+logger = logging.getLogger(__name__)
+
+# Rows sent per COPY statement while importing question files
+IMPORT_COPY_BATCH = int(os.getenv('QUESTION_IMPORT_COPY_BATCH', 5000))
+# Characters read from a .json file at a time
+IMPORT_READ_SIZE = 1024 * 1024
+# Validation errors kept in the import report
+MAX_REPORTED_ERRORS = 20
+
+def iter_file_records(path, stats):
+    """Yield the question objects of a .jsonl file (one per line) or a .json array, without loading it whole.
+
+    Lines and elements that are not valid JSON are counted as malformed.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line, strict=False)
+                except json.JSONDecodeError as e:
+                    stats['malformed'] += 1
+                    logger.warning(f"Skipping malformed line in {path}: {e}")
+            return
+        parser = JSONArrayStreamParser()
+        while True:
+            chunk = f.read(IMPORT_READ_SIZE)
+            if not chunk:
+                break
+            yield from parser.feed(chunk)
+        parser.close()
+        stats['malformed'] += parser.errors
+
+def file_cell(path):
+    """(skill, band) from a question_batches/<skill>_<band>.json file name, or (None, None)."""
+    skill, _, band = os.path.splitext(os.path.basename(path))[0].rpartition('_')
+    return (skill, band) if skill and band in DIFFICULTY_BANDS else (None, None)
+
+def repair_record(record):
+    """Bring older question files to the MCQ schema.
+
+    Files written by fix_question_structure carry an `options` list and the
+    answer text; hand-written ones often label options "(A) ..." and answers
+    "(B)". Records already in the schema pass through unchanged.
+    """
+    record = dict(record)
+    options = record.get('options')
+    if isinstance(options, list) and len(options) == 4:
+        for letter, option in zip(ANSWER_LETTERS, options):
+            record.setdefault(f'option_{letter.lower()}', option)
+    for letter in ANSWER_LETTERS:
+        option = record.get(f'option_{letter.lower()}')
+        if isinstance(option, str):
+            record[f'option_{letter.lower()}'] = re.sub(r'^\s*\(?[A-D]\)\s*', '', option)
+    answer = record.get('correct_answer')
+    if isinstance(answer, str):
+        match = re.fullmatch(r'\s*\(?([A-Da-d])\)?\s*', answer)
+        if match:
+            record['correct_answer'] = match.group(1)
+    elif isinstance(record.get('answer'), str):
+        texts = [record.get(f'option_{letter.lower()}') for letter in ANSWER_LETTERS]
+        if record['answer'] in texts:
+            record['correct_answer'] = ANSWER_LETTERS[texts.index(record['answer'])]
+    return record
+
+def import_questions(job_id, paths, skill=None, band=None, dry_run=False, batch_size=IMPORT_COPY_BATCH):
+    """Validate, de-duplicate and COPY question files into a job's bank without any LLM calls.
+
+    Each record's skill and band come from its own `skill` and
+    `difficulty_band` fields, else from `skill`/`band`, else from a
+    <skill>_<band>.json file name. Skills must be required by the job.
+    Near-duplicates of stored questions, or of earlier records, are
+    skipped. Everything is loaded in one transaction; with dry_run nothing
+    is written. Returns the import report.
+    """
+    required = {
+        name.lower(): skill_id for skill_id, name in db.session.query(Skill.skill_id, Skill.name).join(
+            RequiredSkill, RequiredSkill.skill_id == Skill.skill_id
+        ).filter(RequiredSkill.job_id == job_id)
+    }
+    stats = {
+        'job_id': job_id,
+        'files': len(paths),
+        'records': 0,
+        'imported': 0,
+        'malformed': 0,
+        'invalid': 0,
+        'unknown_cell': 0,
+        'duplicates': 0,
+        'dry_run': dry_run,
+        'errors': []
+    }
+    indexes = {}
+    pending = []
+    started = time.perf_counter()
+
+    def reject(kind, message):
+        stats[kind] += 1
+        if len(stats['errors']) < MAX_REPORTED_ERRORS:
+            stats['errors'].append(message)
+
+    def flush():
+        if pending and not dry_run:
+            copy_mcqs(pending)
+        stats['imported'] += len(pending)
+        pending.clear()
+
+    try:
+        for path in paths:
+            default_skill, default_band = skill, band
+            if default_skill is None or default_band is None:
+                name_skill, name_band = file_cell(path)
+                default_skill, default_band = default_skill or name_skill, default_band or name_band
+            for position, record in enumerate(iter_file_records(path, stats), start=1):
+                stats['records'] += 1
+                if not isinstance(record, dict):
+                    reject('invalid', f"{path} #{position}: not a JSON object")
+                    continue
+                record = repair_record(record)
+                record_skill = record.get('skill') or default_skill
+                record_band = str(record.get('difficulty_band') or default_band or '').lower()
+                skill_id = required.get(str(record_skill or '').lower())
+                if skill_id is None or record_band not in DIFFICULTY_BANDS:
+                    reject('unknown_cell', f"{path} #{position}: no required skill/band for ({record_skill}, {record_band or None})")
+                    continue
+                try:
+                    parsed = parsed_question(generated_mcq_adapter.validate_python(record))
+                except ValidationError as e:
+                    reject('invalid', f"{path} #{position}: {validation_summary(e)}")
+                    continue
+                row = build_mcq_row(job_id, skill_id, record_band, parsed)
+                if not row:
+                    reject('invalid', f"{path} #{position}: empty question or option after cleaning")
+                    continue
+                if skill_id not in indexes:
+                    indexes[skill_id] = get_duplicate_index(job_id, skill_id)
+                if indexes[skill_id].check_and_add(parsed['question']) is None:
+                    stats['duplicates'] += 1
+                    continue
+                pending.append(row)
+                if len(pending) >= batch_size:
+                    flush()
+                    logger.info(f"Imported {stats['imported']} of {stats['records']} records for job_id={job_id}")
+        flush()
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # COPY does not return mcq_ids; let the next lookup rebuild the indexes from the table
+        for skill_id in indexes:
+            discard_duplicate_index(job_id, skill_id)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['records_per_second'] = round(stats['records'] / stats['seconds']) if stats['seconds'] else stats['records']
+    logger.info(
+        f"Imported {stats['imported']} of {stats['records']} questions for job_id={job_id} "
+        f"in {stats['seconds']}s ({stats['records_per_second']} records/s)"
+    )
+    return stats
@@ -0,0 +1,94 @@
+"""Question selection for adaptive assessments.
+
+Pure functions over the assessment state dict, so they can be benchmarked
+without a database (see scripts/benchmark_question_selection.py). Selection
+state lives in the assessment state itself:
+
+- skill_order: skills by descending job priority, computed once at start
+- question_plan: {band: {skill: [mcq_id, ...]}}, shuffled once per attempt
+- cursors: {band: {skill: index}} into the question plan
+- asked_ids: {str(mcq_id): index into asked_questions} for O(1) lookups
+"""
+import os
+import random
+import secrets
+
+# Fixed base seed for question plans, so load tests replay the same questions
+# per attempt id; unset picks a random seed for every attempt
+QUESTION_PLAN_SEED = os.getenv('QUESTION_PLAN_SEED')
+
+def plan_seed(attempt_id):
+    if QUESTION_PLAN_SEED:
+        return int(QUESTION_PLAN_SEED) + attempt_id
+    return secrets.randbits(32)
+
+def build_plan(rows, seed, bands):
+    """Shuffle (mcq_id, band, skill) rows into a question plan.
+
+    Rows should come in a stable order (e.g. by mcq_id): the same rows and seed
+    always give the same plan.
+    """
+    plan = {band: {} for band in bands}
+    for mcq_id, band, skill in rows:
+        plan.setdefault(band, {}).setdefault(skill, []).append(mcq_id)
+    rng = random.Random(seed)
+    for band in sorted(plan):
+        for skill in sorted(plan[band]):
+            rng.shuffle(plan[band][skill])
+    return plan
+
+def plan_from_bank(question_bank):
+    """Question plan of a session that still carries the full question bank."""
+    return {
+        band: {skill: [question['mcq_id'] for question in questions] for skill, questions in skills.items()}
+        for band, skills in question_bank.items()
+    }
+
+def build_skill_order(skill_priorities):
+    """Skill names by descending priority, keeping the given order for ties."""
+    return sorted(skill_priorities, key=lambda skill: -skill_priorities[skill])
+
+def init_selection(state, skill_priorities, plan):
+    state['skill_order'] = build_skill_order(skill_priorities)
+    state['question_plan'] = plan
+    state['cursors'] = {band: {skill: 0 for skill in skills} for band, skills in plan.items()}
+    state['asked_ids'] = {
+        str(question['mcq_id']): index for index, question in enumerate(state.get('asked_questions', []))
+    }
+
+def has_selection(state):
+    return all(key in state for key in ('skill_order', 'question_plan', 'cursors', 'asked_ids'))
+
+def skills_to_ask(state):
+    """Skills that still have questions left, in priority order."""
+    questions_per_skill = state['questions_per_skill']
+    return [skill for skill in state['skill_order'] if questions_per_skill.get(skill, 0) > 0]
+
+def is_asked(state, mcq_id):
+    return str(mcq_id) in state['asked_ids']
+
+def get_asked_question(state, mcq_id):
+    index = state['asked_ids'].get(str(mcq_id))
+    return state['asked_questions'][index] if index is not None else None
+
+def mark_asked(state, question):
+    state['asked_ids'][str(question['mcq_id'])] = len(state['asked_questions'])
+    state['asked_questions'].append(question)
+
+def next_from_plan(state, band, skill):
+    """Next unasked mcq_id of a band and skill from the question plan, or None.
+
+    The cursor only moves forward, so each call is amortized O(1) however many
+    questions have been asked.
+    """
+    mcq_ids = state['question_plan'].get(band, {}).get(skill, [])
+    cursors = state['cursors'].setdefault(band, {})
+    asked_ids = state['asked_ids']
+    index = cursors.get(skill, 0)
+    while index < len(mcq_ids) and str(mcq_ids[index]) in asked_ids:
+        index += 1
+    if index >= len(mcq_ids):
+        cursors[skill] = index
+        return None
+    cursors[skill] = index + 1
+    return mcq_ids[index]
@@ -0,0 +1,292 @@
+import os
+import time
+import itertools
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from app import db
+from app.models.job import JobDescription
+from app.models.report_export import ReportExport
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Scratch directory a report is rendered into before it is uploaded to storage; point it at
+# a disk-backed volume where /tmp is held in memory (Cloud Run)
+REPORT_EXPORT_DIR = os.getenv('REPORT_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'quizzer_reports'))
+os.makedirs(REPORT_EXPORT_DIR, exist_ok=True)
+# Queued or running exports older than this many seconds are marked failed (their worker is gone)
+REPORT_EXPORT_TIMEOUT = int(os.getenv('REPORT_EXPORT_TIMEOUT', 3600))
+# Completed exports are deleted from storage this many hours after they finished
+REPORT_EXPORT_RETENTION_HOURS = float(os.getenv('REPORT_EXPORT_RETENTION_HOURS', 24))
+# How often a serving process sweeps stale and expired exports
+REPORT_EXPORT_SWEEP_INTERVAL = float(os.getenv('REPORT_EXPORT_SWEEP_INTERVAL', 600))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('REPORT_EXPORT_WORKERS', 2)),
+    thread_name_prefix='report-export'
+)
+_next_sweep = 0
+_sweep_lock = threading.Lock()
+
+class FlowableStream(list):
+    """List that pulls flowables from an iterator as reportlab consumes them.
+
+    reportlab pops flowables off the front of the list it is given, so only a
+    small window of candidates is ever materialized instead of the whole report.
+    """
+
+    def __init__(self, source, window=64):
+        super().__init__()
+        self._source = iter(source)
+        self._window = window
+
+    def __len__(self):
+        if self._source is not None and super().__len__() < self._window:
+            chunk = list(itertools.islice(self._source, self._window))
+            if chunk:
+                self.extend(chunk)
+            else:
+                self._source = None
+        return super().__len__()
+
+def _report_styles():
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        name='Title',
+        parent=styles['Heading1'],
+        fontSize=16,
+        leading=20,
+        spaceAfter=12,
+        textColor=colors.black,
+        fontName='Helvetica-Bold'
+    )
+    heading_style = ParagraphStyle(
+        name='Heading',
+        parent=styles['Heading2'],
+        fontSize=12,
+        leading=14,
+        spaceAfter=8,
+        fontName='Helvetica-Bold'
+    )
+    body_style = ParagraphStyle(
+        name='Body',
+        parent=styles['Normal'],
+        fontSize=10,
+        leading=12,
+        spaceAfter=6,
+        fontName='Helvetica'
+    )
+    indent_style = ParagraphStyle(
+        name='Indent',
+        parent=body_style,
+        leftIndent=20
+    )
+    return title_style, heading_style, body_style, indent_style
+
+def _report_flowables(report_data, report_type):
+    """Yield the flowables of a report, one candidate at a time."""
+    title_style, heading_style, body_style, indent_style = _report_styles()
+
+    # Header
+    yield Paragraph(
+        f"Recruitment Report: {report_data.get('job_title', 'Unknown Job')}",
+        title_style
+    )
+    yield Paragraph(
+        f"Type: {report_type.replace('-', ' ').title()}",
+        body_style
+    )
+    yield Spacer(1, 0.2 * inch)
+
+    # Candidate details
+    for candidate in report_data.get('candidates', []):
+        # Candidate name and rank
+        yield Paragraph(
+            f"{candidate.get('name', 'Unknown')} (Rank: {candidate.get('rank', 'N/A')})",
+            heading_style
+        )
+        # Details
+        yield Paragraph(
+            f"Total Score: {candidate.get('combined_score', 0):.2f}",
+            indent_style
+        )
+        yield Paragraph(
+            f"Skill Score: {candidate.get('post_score', 0):.2f}",
+            indent_style
+        )
+        yield Paragraph(
+            f"Experience Score: {candidate.get('pre_score', 0):.2f}",
+            indent_style
+        )
+        # Description (wrapped)
+        description = candidate.get('description', '')
+        yield Paragraph(
+            f"Description: {description}",
+            indent_style
+        )
+        # AI Feedback (if available)
+        if candidate.get('ai_feedback'):
+            feedback = candidate['ai_feedback'].get('summary', '')
+            yield Paragraph(
+                f"AI Feedback: {feedback}",
+                indent_style
+            )
+        yield Spacer(1, 0.3 * inch)
+
+def _add_header_footer(canvas, doc):
+    canvas.saveState()
+    # Header
+    canvas.setFont('Helvetica-Bold', 10)
+    canvas.drawString(0.75 * inch, doc.pagesize[1] - 0.5 * inch, "Jatayu Recruitment Platform")
+    # Footer
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(0.75 * inch, 0.5 * inch, f"Page {canvas.getPageNumber()}")
+    canvas.drawRightString(
+        doc.pagesize[0] - 0.75 * inch, 0.5 * inch,
+        f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+    canvas.restoreState()
+
+def render_report_pdf(report_data, report_type, target):
+    """Render a report to `target`, which can be a file path or a binary file object."""
+    doc = SimpleDocTemplate(
+        target,
+        pagesize=letter,
+        leftMargin=0.75 * inch,
+        rightMargin=0.75 * inch,
+        topMargin=0.75 * inch,
+        bottomMargin=0.75 * inch,
+        pageCompression=1
+    )
+    doc.build(
+        FlowableStream(_report_flowables(report_data, report_type)),
+        onFirstPage=_add_header_footer,
+        onLaterPages=_add_header_footer
+    )
+
+def report_export_key(export):
+    """Storage path of an export's PDF."""
+    return f'reports/{export.job_id}/report_export_{export.export_id}.pdf'
+
+def init_app(app):
+    """Sweep stale and expired exports from serving processes, at most every REPORT_EXPORT_SWEEP_INTERVAL.
+
+    The sweep runs on the export executor, so it never delays the request
+    that triggers it; the first request a process serves triggers one.
+    """
+    @app.before_request
+    def ensure_export_sweep():
+        global _next_sweep
+        if time.time() < _next_sweep:
+            return
+        with _sweep_lock:
+            if time.time() < _next_sweep:
+                return
+            _next_sweep = time.time() + REPORT_EXPORT_SWEEP_INTERVAL
+        _executor.submit(_run_sweep, app)
+
+def enqueue_report_export(export, build_report):
+    """Queue a ReportExport for background rendering.
+
+    `build_report(job, user_id, defer_feedback=True)` returns the report data
+    with its candidates as a generator; it runs in the worker thread inside an
+    application context, and AI feedback is generated chunk by chunk as pages
+    are laid out.
+    """
+    app = current_app._get_current_object()
+    _executor.submit(_run_report_export, app, export.export_id, build_report)
+    logger.info(f"Queued report export {export.export_id} for job_id={export.job_id} ({export.report_type})")
+
+def _run_report_export(app, export_id, build_report):
+    with app.app_context():
+        export = ReportExport.query.get(export_id)
+        if not export:
+            logger.error(f"Report export {export_id} not found")
+            return
+        export.status = 'running'
+        db.session.commit()
+
+        key = report_export_key(export)
+        partial_path = os.path.join(REPORT_EXPORT_DIR, f'report_export_{export_id}.pdf.part')
+        try:
+            job = JobDescription.query.get(export.job_id)
+            if not job:
+                raise ValueError(f'Job {export.job_id} not found')
+            report_data = build_report(job, export.requested_by, defer_feedback=True)
+            render_report_pdf(report_data, export.report_type, partial_path)
+            with open(partial_path, 'rb') as f:
+                get_storage().upload(f, key, 'application/pdf', make_public=False)
+
+            export.file_path = key
+            export.status = 'completed'
+            export.error = None
+            export.completed_at = datetime.utcnow()
+            db.session.commit()
+            logger.info(f"Report export {export_id} completed: {key}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Report export {export_id} failed: {str(e)}", exc_info=True)
+            export = ReportExport.query.get(export_id)
+            if export:
+                export.status = 'failed'
+                export.error = str(e)
+                export.completed_at = datetime.utcnow()
+                db.session.commit()
+        finally:
+            # The rendered file only lives on local disk until it is uploaded
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            db.session.remove()
+
+def sweep_report_exports():
+    """Fail exports whose worker died and delete expired PDFs from storage.
+
+    A process restart loses its queued and running exports; they are marked
+    failed once older than REPORT_EXPORT_TIMEOUT. Completed exports older
+    than REPORT_EXPORT_RETENTION_HOURS are removed and marked expired.
+    Returns (failed, expired) counts.
+    """
+    now = datetime.utcnow()
+    failed = ReportExport.query.filter(
+        ReportExport.status.in_(['queued', 'running']),
+        ReportExport.created_at < now - timedelta(seconds=REPORT_EXPORT_TIMEOUT)
+    ).update({
+        'status': 'failed',
+        'error': 'Report export did not finish in time; please request it again',
+        'completed_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+
+    expired = 0
+    for export in ReportExport.query.filter(
+        ReportExport.status == 'completed',
+        ReportExport.completed_at < now - timedelta(hours=REPORT_EXPORT_RETENTION_HOURS)
+    ).all():
+        if export.file_path:
+            get_storage().delete(export.file_path)
+        export.status = 'expired'
+        export.file_path = None
+        db.session.commit()
+        expired += 1
+    if failed or expired:
+        logger.info(f"Report export sweep: {failed} stale exports failed, {expired} expired")
+    return failed, expired
+
+def _run_sweep(app):
+    with app.app_context():
+        try:
+            sweep_report_exports()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Report export sweep failed: {str(e)}", exc_info=True)
+        finally:
+            db.session.remove()
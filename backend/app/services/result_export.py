@@ -0,0 +1,177 @@
+import csv
+import io
+import logging
+import tempfile
+from sqlalchemy import and_, func
+from app import db
+from app.models.candidate import Candidate
+from app.models.assessment_registration import AssessmentRegistration
+from app.models.assessment_attempt import AssessmentAttempt
+from app.models.proctoring_violation import ProctoringViolation
+from app.models.required_skill import RequiredSkill
+from app.models.skill import Skill
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only needed for Parquet exports
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+# Flush the CSV buffer to the client once it grows past this many characters
+CSV_FLUSH_SIZE = 64 * 1024
+
+BASE_COLUMNS = ['candidate_id', 'name', 'email', 'attempt_id', 'status', 'total_score', 'violation_count']
+
+def parquet_available():
+    return pa is not None
+
+def get_export_skills(job_id):
+    """Skill names of a job in priority order; each becomes a band and an accuracy column."""
+    rows = db.session.query(Skill.name).join(
+        RequiredSkill, RequiredSkill.skill_id == Skill.skill_id
+    ).filter(
+        RequiredSkill.job_id == job_id
+    ).order_by(RequiredSkill.priority.desc(), Skill.name).all()
+    return [name for (name,) in rows]
+
+def get_export_columns(skill_names):
+    columns = list(BASE_COLUMNS)
+    for skill in skill_names:
+        columns.extend([f'{skill} band', f'{skill} accuracy'])
+    return columns
+
+def iter_result_rows(job_id, skill_names):
+    """Yield one dict per registered candidate/attempt of a job.
+
+    Uses yield_per so psycopg2 streams rows from a server-side cursor instead
+    of loading the whole result set.
+    """
+    violation_counts = db.session.query(
+        ProctoringViolation.attempt_id,
+        func.count(ProctoringViolation.violation_id).label('violation_count')
+    ).join(
+        AssessmentAttempt, AssessmentAttempt.attempt_id == ProctoringViolation.attempt_id
+    ).filter(
+        AssessmentAttempt.job_id == job_id
+    ).group_by(ProctoringViolation.attempt_id).subquery()
+
+    query = db.session.query(
+        Candidate.candidate_id,
+        Candidate.name,
+        Candidate.email,
+        AssessmentAttempt.attempt_id,
+        AssessmentAttempt.status,
+        AssessmentAttempt.performance_log,
+        func.coalesce(violation_counts.c.violation_count, 0).label('violation_count')
+    ).select_from(AssessmentRegistration).join(
+        Candidate, Candidate.candidate_id == AssessmentRegistration.candidate_id
+    ).outerjoin(
+        AssessmentAttempt,
+        and_(
+            AssessmentAttempt.candidate_id == AssessmentRegistration.candidate_id,
+            AssessmentAttempt.job_id == AssessmentRegistration.job_id
+        )
+    ).outerjoin(
+        violation_counts, violation_counts.c.attempt_id == AssessmentAttempt.attempt_id
+    ).filter(
+        AssessmentRegistration.job_id == job_id
+    ).order_by(
+        Candidate.candidate_id, AssessmentAttempt.attempt_id
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+    for row in query:
+        performance = row.performance_log if isinstance(row.performance_log, dict) else {}
+        skill_data = {
+            k: v for k, v in performance.items()
+            if k != 'proctoring_data' and isinstance(v, dict)
+        }
+        total_score = (
+            sum(v.get('accuracy_percent', 0) for v in skill_data.values()) / len(skill_data)
+            if skill_data else 0
+        )
+        result = {
+            'candidate_id': row.candidate_id,
+            'name': row.name,
+            'email': row.email,
+            'attempt_id': row.attempt_id,
+            'status': row.status or 'not_attempted',
+            'total_score': round(total_score, 2),
+            'violation_count': int(row.violation_count or 0)
+        }
+        for skill in skill_names:
+            data = skill_data.get(skill, {})
+            result[f'{skill} band'] = data.get('final_band')
+            result[f'{skill} accuracy'] = data.get('accuracy_percent')
+        yield result
+
+def generate_results_csv(job_id):
+    """Yield CSV text chunks for a job's results."""
+    skill_names = get_export_skills(job_id)
+    columns = get_export_columns(skill_names)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    row_count = 0
+    for row in iter_result_rows(job_id, skill_names):
+        writer.writerow([row[column] for column in columns])
+        row_count += 1
+        if buffer.tell() >= CSV_FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+    logger.info(f"CSV export for job_id={job_id} streamed {row_count} rows")
+
+def _parquet_schema(skill_names):
+    fields = [
+        ('candidate_id', pa.int64()),
+        ('name', pa.string()),
+        ('email', pa.string()),
+        ('attempt_id', pa.int64()),
+        ('status', pa.string()),
+        ('total_score', pa.float64()),
+        ('violation_count', pa.int64())
+    ]
+    for skill in skill_names:
+        fields.extend([(f'{skill} band', pa.string()), (f'{skill} accuracy', pa.float64())])
+    return pa.schema(fields)
+
+def generate_results_parquet(job_id, chunk_size=64 * 1024):
+    """Yield the bytes of a Parquet file with a job's results.
+
+    Rows are written one row group at a time into a spooled temp file (Parquet
+    needs its footer written last), which is then streamed to the client.
+    """
+    if pa is None:
+        raise RuntimeError('pyarrow is not installed')
+
+    skill_names = get_export_skills(job_id)
+    schema = _parquet_schema(skill_names)
+    row_count = 0
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        with pq.ParquetWriter(spool, schema) as writer:
+            batch = []
+            for row in iter_result_rows(job_id, skill_names):
+                batch.append(row)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    row_count += len(batch)
+                    batch = []
+            if batch or not row_count:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                row_count += len(batch)
+
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    logger.info(f"Parquet export for job_id={job_id} streamed {row_count} rows")
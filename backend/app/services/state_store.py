@@ -0,0 +1,397 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app, g, has_app_context
+from sqlalchemy import ARRAY, Text, bindparam, cast, func, literal, update
+from sqlalchemy.dialects.postgresql import JSONB, array, insert
+from app import db
+from app.models.assessment_state import AssessmentState
+
+try:
+    import redis
+except ImportError:  # redis is optional, only needed for STATE_STORE=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# db (default): every save is written to assessment_states, safe with any number of workers.
+# memory: per-process cache, only safe when an attempt always reaches the same worker.
+# redis: cache shared by all workers through REDIS_URL.
+STATE_STORE = os.getenv('STATE_STORE', 'db')
+# Cached states are checkpointed to Postgres at least this often; a crash loses at most this window
+STATE_CHECKPOINT_SECONDS = float(os.getenv('STATE_CHECKPOINT_SECONDS', 2))
+STATE_MEMORY_MAX_ENTRIES = int(os.getenv('STATE_MEMORY_MAX_ENTRIES', 5000))
+STATE_TTL = timedelta(hours=24)
+
+class StateConflict(Exception):
+    """The state row changed since this request read it."""
+
+def _loaded_versions():
+    """Versions of the states read during the current request, keyed by attempt id."""
+    if not has_app_context():
+        return {}
+    if 'assessment_state_versions' not in g:
+        g.assessment_state_versions = {}
+    return g.assessment_state_versions
+
+def forget_loaded_versions():
+    if has_app_context():
+        g.pop('assessment_state_versions', None)
+
+def load_state_from_db(attempt_id):
+    """Return (state, expiry_date) from assessment_states, dropping expired rows.
+
+    The row's version is remembered for the rest of the request so the next
+    save can check nobody else wrote in between.
+    """
+    assessment_state = AssessmentState.query.get(attempt_id)
+    if not assessment_state:
+        logger.error(f"Assessment state not found for attempt_id={attempt_id}")
+        return None, None
+    if assessment_state.expiry_date and assessment_state.expiry_date < datetime.utcnow():
+        logger.warning(f"Assessment state expired for attempt_id={attempt_id}")
+        db.session.delete(assessment_state)
+        db.session.commit()
+        return None, None
+    _loaded_versions()[attempt_id] = assessment_state.version
+    return assessment_state.state, assessment_state.expiry_date
+
+def upsert_state(attempt_id, state):
+    """Insert or replace a state row in one statement; the caller commits."""
+    statement = insert(AssessmentState).values(
+        attempt_id=attempt_id,
+        state=state,
+        skill_count=len(state.get('performance_log', {})),
+        expiry_date=datetime.utcnow() + STATE_TTL  # Set expiry to 24 hours from now
+    )
+    version = db.session.execute(statement.on_conflict_do_update(
+        index_elements=[AssessmentState.attempt_id],
+        set_={'state': statement.excluded.state, 'version': AssessmentState.version + 1}
+    ).returning(AssessmentState.version)).scalar_one()
+    _loaded_versions()[attempt_id] = version
+
+def conditional_update_state(attempt_id, state, expected_version):
+    """UPDATE ... WHERE version = expected_version; raises StateConflict if another write won."""
+    table = AssessmentState.__table__
+    version = db.session.execute(
+        update(table)
+        .where(table.c.attempt_id == attempt_id, table.c.version == expected_version)
+        .values(state=state, version=table.c.version + 1)
+        .returning(table.c.version)
+    ).scalar_one_or_none()
+    if version is None:
+        db.session.rollback()
+        _loaded_versions().pop(attempt_id, None)
+        raise StateConflict(f'Assessment state of attempt_id={attempt_id} changed since version {expected_version}')
+    _loaded_versions()[attempt_id] = version
+
+def _json_path(path):
+    return cast(array([str(part) for part in path]), ARRAY(Text))
+
+def build_state_patch(changes):
+    """Compile field-level changes into one jsonb_set expression over the state column.
+
+    `changes` is a list of (op, path, value): 'set' replaces the value at
+    path, 'inc' adds a number to it and 'append' pushes onto the array there.
+    Each path should appear once per patch.
+    """
+    column = AssessmentState.__table__.c.state
+    expression = column
+    for op, path, value in changes:
+        json_path = _json_path(path)
+        if op == 'set':
+            new_value = literal(value, JSONB)
+        elif op == 'inc':
+            new_value = func.to_jsonb(
+                func.coalesce(cast(column.op('#>>')(json_path), db.Numeric), 0) + literal(value, db.Numeric)
+            )
+        elif op == 'append':
+            new_value = func.coalesce(column.op('#>')(json_path), cast('[]', JSONB)).op('||')(
+                func.jsonb_build_array(literal(value, JSONB))
+            )
+        else:
+            raise ValueError(f'Unknown state patch operation: {op}')
+        expression = func.jsonb_set(expression, json_path, new_value, True)
+    return expression
+
+def patch_state_row(attempt_id, changes, unless_recorded=None):
+    """Apply field-level changes in place without reading or replacing the whole state.
+
+    Patches don't check the version (increments and appends commute with other
+    writers) but do bump it, so a concurrent full save will notice.
+    `unless_recorded=(path, item)` skips the patch if the array at path already
+    contains item, which makes a retried request a no-op. Returns the row count.
+    """
+    table = AssessmentState.__table__
+    statement = update(table).where(table.c.attempt_id == attempt_id)
+    if unless_recorded:
+        path, item = unless_recorded
+        statement = statement.where(~func.coalesce(
+            table.c.state.op('#>')(_json_path(path)).op('@>')(literal([item], JSONB)), False
+        ))
+    result = db.session.execute(
+        statement.values(state=build_state_patch(changes), version=table.c.version + 1)
+    )
+    # Our copy no longer matches the row; a later full save in this request must not assume it does
+    _loaded_versions().pop(attempt_id, None)
+    return result.rowcount
+
+def delete_state_row(attempt_id):
+    assessment_state = AssessmentState.query.get(attempt_id)
+    if assessment_state:
+        db.session.delete(assessment_state)
+        db.session.commit()
+
+class DBStateStore:
+    """Reads and writes assessment_states on every call."""
+
+    name = 'db'
+
+    def get(self, attempt_id):
+        state, _ = load_state_from_db(attempt_id)
+        return state
+
+    def save(self, attempt_id, state, durable=False):
+        expected_version = _loaded_versions().get(attempt_id)
+        if expected_version is None:
+            upsert_state(attempt_id, state)
+        else:
+            conditional_update_state(attempt_id, state, expected_version)
+        db.session.commit()
+
+    def patch(self, attempt_id, state, changes, unless_recorded=None):
+        """Persist `changes`, already applied to `state` by the caller, as a field-level update."""
+        patch_state_row(attempt_id, changes, unless_recorded=unless_recorded)
+        db.session.commit()
+
+    def delete(self, attempt_id):
+        delete_state_row(attempt_id)
+        _loaded_versions().pop(attempt_id, None)
+
+    def flush(self):
+        return 0
+
+class MemoryHotTier:
+    """Process-local LRU of states plus a JSON snapshot of each one awaiting a checkpoint.
+
+    Requests get the live dict back; the checkpoint thread only ever sees the
+    snapshots, so it never serializes a state a request is still mutating.
+    """
+
+    def __init__(self, max_entries=STATE_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # attempt_id -> (state, expires_at)
+        self._dirty = {}  # attempt_id -> JSON snapshot
+        self._lock = threading.Lock()
+
+    def get(self, attempt_id):
+        with self._lock:
+            entry = self._entries.get(attempt_id)
+            if entry is None:
+                return None
+            if entry[1] < datetime.utcnow():
+                self._entries.pop(attempt_id)
+                self._dirty.pop(attempt_id, None)
+                return None
+            self._entries.move_to_end(attempt_id)
+            return entry[0]
+
+    def put(self, attempt_id, state, expires_at=None, dirty=True):
+        snapshot = json.dumps(state) if dirty else None
+        with self._lock:
+            previous = self._entries.pop(attempt_id, None)
+            expires_at = expires_at or (previous[1] if previous else datetime.utcnow() + STATE_TTL)
+            self._entries[attempt_id] = (state, expires_at)
+            if dirty:
+                self._dirty[attempt_id] = snapshot
+            # Evict least recently used states that are already checkpointed
+            if len(self._entries) > self.max_entries:
+                for key in list(self._entries):
+                    if len(self._entries) <= self.max_entries:
+                        break
+                    if key not in self._dirty:
+                        self._entries.pop(key)
+
+    def discard(self, attempt_id):
+        with self._lock:
+            self._entries.pop(attempt_id, None)
+            self._dirty.pop(attempt_id, None)
+
+    def take_dirty(self):
+        """Return [(attempt_id, state)] for every unsaved state and mark them clean."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return [(attempt_id, json.loads(snapshot)) for attempt_id, snapshot in dirty.items()]
+
+    def restore_dirty(self, dirty):
+        """Requeue states whose checkpoint failed, unless a newer save already replaced them."""
+        with self._lock:
+            for attempt_id, state in dirty:
+                if attempt_id in self._entries:
+                    self._dirty.setdefault(attempt_id, json.dumps(state))
+
+class RedisHotTier:
+    """States kept as JSON in Redis, shared by all workers; dirty ids live in a Redis set."""
+
+    DIRTY_KEY = 'assessment_state:dirty'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('redis is not installed')
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _key(attempt_id):
+        return f'assessment_state:{attempt_id}'
+
+    def get(self, attempt_id):
+        value = self.client.get(self._key(attempt_id))
+        return json.loads(value) if value is not None else None
+
+    def put(self, attempt_id, state, expires_at=None, dirty=True):
+        ttl = int(((expires_at or datetime.utcnow() + STATE_TTL) - datetime.utcnow()).total_seconds())
+        pipe = self.client.pipeline()
+        pipe.set(self._key(attempt_id), json.dumps(state), ex=max(ttl, 1))
+        if dirty:
+            pipe.sadd(self.DIRTY_KEY, attempt_id)
+        pipe.execute()
+
+    def discard(self, attempt_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(attempt_id))
+        pipe.srem(self.DIRTY_KEY, attempt_id)
+        pipe.execute()
+
+    def take_dirty(self, batch_size=500):
+        dirty = []
+        while True:
+            ids = self.client.spop(self.DIRTY_KEY, batch_size)
+            if not ids:
+                return dirty
+            ids = [int(attempt_id) for attempt_id in ids]
+            values = self.client.mget([self._key(attempt_id) for attempt_id in ids])
+            dirty.extend((attempt_id, json.loads(value)) for attempt_id, value in zip(ids, values) if value is not None)
+
+    def restore_dirty(self, dirty):
+        if dirty:
+            self.client.sadd(self.DIRTY_KEY, *[attempt_id for attempt_id, _ in dirty])
+
+class CachedStateStore:
+    """Hot tier in front of assessment_states with write-behind checkpoints.
+
+    Saves go to the hot tier and the attempt is marked dirty; a background
+    thread writes dirty states to Postgres every STATE_CHECKPOINT_SECONDS.
+    Misses fall back to the database. Checkpoints only UPDATE existing rows
+    (start_assessment_session saves durably), so a late checkpoint can't
+    resurrect the state of an attempt that has just been finalized.
+    """
+
+    def __init__(self, hot_tier, checkpoint_seconds=STATE_CHECKPOINT_SECONDS, name=None):
+        self.hot_tier = hot_tier
+        self.checkpoint_seconds = checkpoint_seconds
+        self.name = name
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self._app = None
+
+    def get(self, attempt_id):
+        state = self.hot_tier.get(attempt_id)
+        if state is not None:
+            return state
+        state, expiry_date = load_state_from_db(attempt_id)
+        if state is not None:
+            self.hot_tier.put(attempt_id, state, expires_at=expiry_date, dirty=False)
+        return state
+
+    def save(self, attempt_id, state, durable=False):
+        if durable:
+            upsert_state(attempt_id, state)
+            db.session.commit()
+        self.hot_tier.put(attempt_id, state, dirty=not durable)
+        self._start_flusher()
+
+    def patch(self, attempt_id, state, changes, unless_recorded=None):
+        # An attempt has a single writer here, so the whole state is cached and checkpointed
+        self.save(attempt_id, state)
+
+    def delete(self, attempt_id):
+        self.hot_tier.discard(attempt_id)
+        delete_state_row(attempt_id)
+
+    def flush(self):
+        """Write every dirty state to Postgres; returns how many were written."""
+        dirty = self.hot_tier.take_dirty()
+        if not dirty:
+            return 0
+        try:
+            # Core executemany: rows already deleted by finalization simply match nothing
+            table = AssessmentState.__table__
+            db.session.execute(
+                update(table).where(table.c.attempt_id == bindparam('b_attempt_id'))
+                .values(state=bindparam('b_state'), version=table.c.version + 1),
+                [{'b_attempt_id': attempt_id, 'b_state': state} for attempt_id, state in dirty]
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Mark them dirty again so the next checkpoint retries
+            self.hot_tier.restore_dirty(dirty)
+            raise
+        return len(dirty)
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._app = current_app._get_current_object()
+                self._flusher = threading.Thread(target=self._run_flusher, name='state-checkpoint', daemon=True)
+                self._flusher.start()
+                atexit.register(self._flush_at_exit)
+                logger.info(f"State checkpoint thread started ({self.name}, every {self.checkpoint_seconds}s)")
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.checkpoint_seconds)
+            with self._app.app_context():
+                try:
+                    written = self.flush()
+                    if written:
+                        logger.debug(f"Checkpointed {written} assessment states")
+                except Exception as e:
+                    logger.error(f"Assessment state checkpoint failed: {str(e)}", exc_info=True)
+
+    def _flush_at_exit(self):
+        with self._app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Final assessment state checkpoint failed: {str(e)}")
+
+_store = None
+_store_lock = threading.Lock()
+
+def create_state_store(name=None):
+    name = (name or STATE_STORE).lower()
+    if name == 'db':
+        return DBStateStore()
+    if name == 'memory':
+        return CachedStateStore(MemoryHotTier(), name='memory')
+    if name == 'redis':
+        return CachedStateStore(RedisHotTier(os.getenv('REDIS_URL', 'redis://localhost:6379/0')), name='redis')
+    raise ValueError(f'Unknown state store: {name}')
+
+def get_state_store():
+    """The process-wide assessment state store selected by STATE_STORE."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_state_store()
+                logger.info(f"Using '{STATE_STORE}' assessment state store")
+    return _store
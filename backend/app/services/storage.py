@@ -0,0 +1,269 @@
+import os
+import hmac
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode
+
+try:
+    from google.cloud import storage as gcs
+    from google.api_core.exceptions import NotFound
+except ImportError:  # only the local backend is usable without google-cloud-storage
+    gcs = None
+    NotFound = None
+
+logger = logging.getLogger(__name__)
+
+# Every object lives under this prefix, e.g. uploads/snapshots/<attempt_id>/...
+KEY_PREFIX = 'uploads'
+# Files larger than this are sent as a resumable upload in UPLOAD_CHUNK_SIZE pieces
+RESUMABLE_THRESHOLD = int(os.getenv('STORAGE_RESUMABLE_THRESHOLD', 8 * 1024 * 1024))
+# GCS requires resumable chunks to be a multiple of 256 KB
+UPLOAD_CHUNK_SIZE = int(os.getenv('STORAGE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+COPY_BUFFER_SIZE = 1024 * 1024
+# Lifetime of signed upload URLs handed to the browser
+SIGNED_URL_EXPIRY = int(os.getenv('STORAGE_SIGNED_URL_EXPIRY', 300))
+
+def object_key(path):
+    """Full object name of an upload path, rejecting anything that escapes the prefix."""
+    parts = [part for part in str(path).replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        raise ValueError(f'Invalid storage path: {path}')
+    return '/'.join([KEY_PREFIX] + parts)
+
+def _file_size(file_obj):
+    """Remaining bytes of a seekable file object, or None if it can't be measured."""
+    try:
+        position = file_obj.tell()
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell() - position
+        file_obj.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+class StorageBackend:
+    """Interface shared by the storage backends; paths are relative to KEY_PREFIX."""
+
+    name = None
+
+    def upload(self, file_obj, path, content_type, make_public=True):
+        """Store a file object and return its URL."""
+        raise NotImplementedError
+
+    def download(self, path, target):
+        """Write an object into a binary file object; False if it doesn't exist."""
+        raise NotImplementedError
+
+    def open(self, path):
+        """Binary file object reading an object in chunks, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def exists(self, path):
+        """Whether an object has been stored, e.g. by a PUT to a signed upload URL."""
+        raise NotImplementedError
+
+    def delete(self, path):
+        """Delete an object; False if it didn't exist."""
+        raise NotImplementedError
+
+    def public_url(self, path):
+        raise NotImplementedError
+
+    def signed_upload_url(self, path, content_type, expires_in=SIGNED_URL_EXPIRY):
+        """URL the client can PUT the file to directly, with the headers it must send."""
+        raise NotImplementedError
+
+    def _signed_upload(self, url, content_type, expires_in):
+        return {
+            'url': url,
+            'method': 'PUT',
+            'headers': {'Content-Type': content_type},
+            'expires_at': (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat()
+        }
+
+class GCSStorageBackend(StorageBackend):
+    """Google Cloud Storage, with one client and bucket handle per process.
+
+    The client is built on first use (after gunicorn forks), so credentials are
+    loaded once instead of on every upload.
+    """
+
+    name = 'gcs'
+
+    def __init__(self, bucket_name):
+        if gcs is None:
+            raise RuntimeError('google-cloud-storage is not installed')
+        self.bucket_name = bucket_name
+        self._client = None
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    self._client = gcs.Client()
+                    self._bucket = self._client.bucket(self.bucket_name)
+                    logger.info(f"Created GCS client for bucket {self.bucket_name}")
+        return self._bucket
+
+    def upload(self, file_obj, path, content_type, make_public=True):
+        blob = self.bucket.blob(object_key(path))
+        size = _file_size(file_obj)
+        if size is None or size > RESUMABLE_THRESHOLD:
+            # Chunked resumable upload: a dropped connection only resends the current chunk
+            blob.chunk_size = UPLOAD_CHUNK_SIZE
+        blob.upload_from_file(file_obj, content_type=content_type, size=size)
+        return blob.public_url
+
+    def download(self, path, target):
+        try:
+            self.bucket.blob(object_key(path)).download_to_file(target)
+            return True
+        except NotFound:
+            return False
+
+    def open(self, path):
+        blob = self.bucket.blob(object_key(path))
+        try:
+            blob.reload()
+        except NotFound:
+            return None
+        return blob.open('rb', chunk_size=COPY_BUFFER_SIZE)
+
+    def exists(self, path):
+        return self.bucket.blob(object_key(path)).exists()
+
+    def delete(self, path):
+        # Delete straight away and treat 404 as "already gone" instead of asking exists() first
+        try:
+            self.bucket.blob(object_key(path)).delete()
+            return True
+        except NotFound:
+            return False
+
+    def public_url(self, path):
+        return f'https://storage.googleapis.com/{self.bucket_name}/{object_key(path)}'
+
+    def signed_upload_url(self, path, content_type, expires_in=SIGNED_URL_EXPIRY):
+        url = self.bucket.blob(object_key(path)).generate_signed_url(
+            version='v4',
+            expiration=timedelta(seconds=expires_in),
+            method='PUT',
+            content_type=content_type
+        )
+        return self._signed_upload(url, content_type, expires_in)
+
+class LocalStorageBackend(StorageBackend):
+    """Objects stored as files under a local directory, for tests and offline benchmarks.
+
+    Files are served and accepted by the /api/storage routes; upload URLs are
+    signed with an HMAC of the path, content type and expiry so the direct
+    upload flow works without GCS credentials.
+    """
+
+    name = 'local'
+
+    def __init__(self, root, base_url=None, signing_key=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = (base_url or 'http://localhost:5000').rstrip('/')
+        self.signing_key = (signing_key or 'dev-secret-key').encode()
+
+    def file_path(self, path):
+        return self.root / object_key(path)
+
+    def upload(self, file_obj, path, content_type, make_public=True):
+        destination = self.file_path(path)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        partial = destination.with_name(f'{destination.name}.part')
+        with open(partial, 'wb') as out:
+            shutil.copyfileobj(file_obj, out, COPY_BUFFER_SIZE)
+        os.replace(partial, destination)
+        return self.public_url(path)
+
+    def download(self, path, target):
+        try:
+            with open(self.file_path(path), 'rb') as source:
+                shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def open(self, path):
+        try:
+            return open(self.file_path(path), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def exists(self, path):
+        return self.file_path(path).is_file()
+
+    def delete(self, path):
+        try:
+            self.file_path(path).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _url_path(self, path):
+        return quote(object_key(path).split('/', 1)[1])
+
+    def public_url(self, path):
+        return f'{self.base_url}/api/storage/files/{self._url_path(path)}'
+
+    def _signature(self, path, content_type, expires):
+        message = f'PUT\n{object_key(path)}\n{content_type}\n{expires}'.encode()
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()
+
+    def signed_upload_url(self, path, content_type, expires_in=SIGNED_URL_EXPIRY):
+        expires = int(time.time()) + expires_in
+        query = urlencode({'expires': expires, 'signature': self._signature(path, content_type, expires)})
+        url = f'{self.base_url}/api/storage/upload/{self._url_path(path)}?{query}'
+        return self._signed_upload(url, content_type, expires_in)
+
+    def verify_upload_signature(self, path, content_type, expires, signature):
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(path, content_type, expires), signature or '')
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_storage_backend(name=None):
+    name = (name or os.getenv('STORAGE_BACKEND', 'gcs')).lower()
+    if name == 'gcs':
+        return GCSStorageBackend(os.getenv('GCS_BUCKET_NAME', 'gen-ai-quiz'))
+    if name == 'local':
+        return LocalStorageBackend(
+            os.getenv('STORAGE_LOCAL_ROOT', os.path.join(tempfile.gettempdir(), 'quizzer_storage')),
+            os.getenv('STORAGE_LOCAL_BASE_URL'),
+            os.getenv('STORAGE_SIGNING_KEY') or os.getenv('SECRET_KEY')
+        )
+    raise ValueError(f'Unknown storage backend: {name}')
+
+def get_storage():
+    """The process-wide storage backend selected by STORAGE_BACKEND (gcs or local)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_storage_backend()
+    return _backend
+
+def set_storage(backend):
+    """Swap the process-wide backend, e.g. for a LocalStorageBackend in a benchmark."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
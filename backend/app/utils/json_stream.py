@@ -0,0 +1,85 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JSONArrayStreamParser:
+    """Incrementally parse the elements of a JSON array of objects from text chunks.
+
+    Text before the array (code fences, prose) is skipped, each element is
+    decoded on its own as soon as its closing brace arrives, and an element
+    that fails to decode is counted in `errors` and skipped instead of
+    failing the whole array. A response without the surrounding array, i.e.
+    bare objects, is parsed the same way.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.element = []
+        self.errors = 0
+
+    def feed(self, text):
+        """Consume a chunk of text and return the elements it completed."""
+        elements = []
+        for char in text:
+            if self.finished:
+                break
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                elif char == '{':
+                    self.started = True
+                    self._consume(char, elements)
+                continue
+            self._consume(char, elements)
+        return elements
+
+    def close(self):
+        """Finish the stream; an unterminated last element counts as an error."""
+        if self.element and ''.join(self.element).strip():
+            logger.warning(f"Streamed JSON ended inside an element: {''.join(self.element)[:100]}")
+            self.errors += 1
+        self.element = []
+        self.finished = True
+        return []
+
+    def _consume(self, char, elements):
+        if self.depth == 0:
+            if char == '{':
+                self.depth = 1
+                self.element = [char]
+            elif char == ']':
+                self.finished = True
+            # Commas, whitespace and stray characters between elements are ignored
+            return
+
+        self.element.append(char)
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == '\\':
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+            return
+        if char == '"':
+            self.in_string = True
+        elif char in '{[':
+            self.depth += 1
+        elif char in '}]':
+            self.depth -= 1
+            if self.depth == 0:
+                self._decode(''.join(self.element), elements)
+                self.element = []
+
+    def _decode(self, text, elements):
+        try:
+            # strict=False accepts raw newlines and tabs inside strings
+            elements.append(json.loads(text, strict=False))
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed streamed JSON element: {e} - {text[:100]}")
+            self.errors += 1
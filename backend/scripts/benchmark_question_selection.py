@@ -0,0 +1,123 @@
+"""Per-question cost of picking the next question, as a test gets longer.
+
+Runs the selection used by /next-question over a synthetic question plan,
+against the previous approach of sorting skills and filtering the full
+question bank by every asked question on each call. No database is needed,
+so the primary key lookup of the picked MCQ is not included:
+
+    cd backend && python -m scripts.benchmark_question_selection --questions 200
+"""
+import argparse
+import json
+import random
+import time
+from app.services import question_selection
+
+BANDS = ["good", "better", "perfect"]
+
+def build_state(total_questions, skills, per_cell, seed):
+    rng = random.Random(seed)
+    priorities = {f"skill_{i}": rng.randint(1, 10) for i in range(skills)}
+    mcq_id = 0
+    question_bank = {band: {} for band in BANDS}
+    for band in BANDS:
+        for skill in priorities:
+            questions = []
+            for _ in range(per_cell):
+                mcq_id += 1
+                questions.append({
+                    "mcq_id": mcq_id,
+                    "question": f"Question {mcq_id}",
+                    "options": ["a", "b", "c", "d"],
+                    "answer": "a"
+                })
+            rng.shuffle(questions)
+            question_bank[band][skill] = questions
+    priority_sum = sum(priorities.values())
+    state = {
+        'question_bank': question_bank,
+        'questions_per_skill': {
+            skill: max(1, round(priority / priority_sum * total_questions)) + 1 for skill, priority in priorities.items()
+        },
+        'current_band_per_skill': {skill: rng.choice(BANDS) for skill in priorities},
+        'question_count': 0,
+        'asked_questions': []
+    }
+    return state, priorities
+
+def select_legacy(state, priorities):
+    sorted_skills = sorted(state['questions_per_skill'].items(), key=lambda x: -priorities.get(x[0], 0))
+    for skill, remaining in sorted_skills:
+        if remaining <= 0:
+            continue
+        band = state['current_band_per_skill'][skill]
+        available = [
+            q for q in state['question_bank'].get(band, {}).get(skill, [])
+            if q['mcq_id'] not in [aq['mcq_id'] for aq in state['asked_questions']]
+        ]
+        if available:
+            question = available.pop(0)
+            state['questions_per_skill'][skill] -= 1
+            state['asked_questions'].append(question)
+            return question
+    return None
+
+def select_precomputed(state, priorities):
+    for skill in question_selection.skills_to_ask(state):
+        band = state['current_band_per_skill'][skill]
+        mcq_id = question_selection.next_from_plan(state, band, skill)
+        if mcq_id is not None:
+            question = {"mcq_id": mcq_id, "skill": skill, "difficulty_band": band}
+            state['questions_per_skill'][skill] -= 1
+            question_selection.mark_asked(state, question)
+            return question
+    return None
+
+def run(select, state, priorities, total_questions, rng):
+    timings = []
+    for _ in range(total_questions):
+        started = time.perf_counter()
+        question = select(state, priorities)
+        timings.append(time.perf_counter() - started)
+        if question is None:
+            break
+        # Move the band like submit-answer does, so cursors in every band get used
+        skill = rng.choice(list(state['current_band_per_skill']))
+        state['current_band_per_skill'][skill] = rng.choice(BANDS)
+    return timings
+
+def report(name, timings, buckets):
+    size = max(1, len(timings) // buckets)
+    cells = []
+    for start in range(0, len(timings), size):
+        chunk = timings[start:start + size]
+        cells.append(f"q{start + 1}-{start + len(chunk)}: {sum(chunk) / len(chunk) * 1e6:8.1f}us")
+    print(f"{name:12} " + "  ".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--skills', type=int, default=8)
+    parser.add_argument('--per-cell', type=int, default=150, help='questions per band and skill in the bank')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for name, select in (('legacy', select_legacy), ('precomputed', select_precomputed)):
+        totals = [0.0] * args.questions
+        runs = 0
+        for i in range(args.repeat):
+            state, priorities = build_state(args.questions, args.skills, args.per_cell, args.seed + i)
+            if select is select_precomputed:
+                plan = question_selection.plan_from_bank(state.pop('question_bank'))
+                question_selection.init_selection(state, priorities, plan)
+            if i == 0:
+                print(f"{name:12} state at start: {len(json.dumps(state)) / 1024:.1f} KB")
+            timings = run(select, state, priorities, args.questions, random.Random(args.seed + i))
+            for index, elapsed in enumerate(timings):
+                totals[index] += elapsed
+            runs += 1
+        report(name, [total / runs for total in totals], buckets=5)
+
+if __name__ == '__main__':
+    main()